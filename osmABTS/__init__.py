@@ -26,7 +26,26 @@ modules,
     travellers
     trips
     paths
+    landmarks
+    matrix
+    traffic
+    routing
+    replacement
+    overlay
+    synthetic
+    speeds
+    replications
+    batch
+    service
+    analytic
+    sampling
+    cache
+    timings
+    progress
     simultime
+    checkpoint
+    scenarios
+    verify
     util
 
 These modules contains functions and classes that is useful for doing non-
@@ -0,0 +1,221 @@
+"""
+Analytic expected travel time
+=============================
+
+The mean travel time estimated by sampling the travellers and their trips can
+also be computed exactly from the definitions of the trips, as the limit for
+many travellers, without any sampling.
+
+The number of trips of a kind for a traveller is the integral part of the
+frequency, drawn from a normal distribution, times the time span, when it is
+at least one. So its expectation is
+
+.. math::
+
+    E[N] = \\sum_{n \\geq 1} P(f T \\geq n)
+
+from the error function. The places of the locations of a trip, the attributes
+of the traveller or random selections from categories, are independent of the
+number of trips, and their probabilities follow exactly the selection in
+:py:func:`util.select_place`. So the expected travel time of a trip is the
+average of its travel time over all the combinations of the places, with the
+travel time among the nodes of the categories from one-to-many Dijkstra
+searches. As for the sampled trips, only the legs before the first unreachable
+one are counted.
+
+The expected mean travel time is then the expected total travel time of the
+trips of a traveller over the expected number of trips, per unit of time.
+
+.. autosummary::
+    :toctree: generated
+
+    place_probabilities
+    expected_trip_count
+    expected_mean_time
+
+"""
+
+import math
+
+import numpy as np
+
+from .trips import TRAVELLER_ATTR, RANDOM_FROM_CAT, DEFAULT_TRIPS
+from .travellers import DEFAULT_ATTRS
+from .matrix import compute_travel_time_matrix
+
+
+def place_probabilities(places):
+
+    """Computes the probability of the nodes to be selected from places
+
+    The selection by :py:func:`util.select_place` takes the place before the
+    one whose cumulative weight is first above the random number, wrapping
+    around to the last place. So each place gets the weight of the next place.
+
+    :param places: A list of places
+    :returns: A pair of the sorted array of the distinct nodes of the places
+        and the array of their probabilities
+    :raises ValueError: If there is no place in the list
+
+    """
+
+    if len(places) == 0:
+        raise ValueError('No place to select from')
+
+    weights = np.array([place.weight for place in places], dtype=np.float64)
+    probs = np.roll(weights, -1) / np.sum(weights)
+
+    nodes, inverse = np.unique(
+        np.array([place.node for place in places], dtype=np.int64),
+        return_inverse=True
+        )
+    return nodes, np.bincount(inverse, weights=probs, minlength=len(nodes))
+
+
+def expected_trip_count(trip, time_span):
+
+    """Computes the expected number of trips of a kind for a traveller
+
+    :param trip: The :py:class:`trips.Trip` instance
+    :param time_span: The time span, in weeks
+    :returns: The expected number of the trips
+
+    """
+
+    mean = trip.freq * time_span
+    if trip.var == 0.0:
+        return float(max(int(mean), 0))
+
+    scale = trip.var * time_span * math.sqrt(2.0)
+    count = 0.0
+    n_trips = 1
+    while n_trips <= mean or n_trips - mean < 40.0 * scale:
+        count += 0.5 * math.erfc((n_trips - mean) / scale)
+        n_trips += 1
+        continue
+
+    return count
+
+
+def expected_mean_time(net, places, time_span, trips=None, attrs=None,
+                       processes=None):
+
+    """Computes the expected mean travel time
+
+    :param net: The network
+    :param places: The places of interest dictionary
+    :param time_span: The time span, in weeks
+    :param trips: The list of :py:class:`trips.Trip`, the default by default
+    :param attrs: The attributes of the travellers, the default by default
+    :param processes: The number of processes for the Dijkstra searches
+    :returns: The expected mean travel time in one unit of time
+    :raises ValueError: If no trip is expected
+
+    """
+
+    trips = trips or DEFAULT_TRIPS
+    attrs = attrs or DEFAULT_ATTRS
+
+    supports = {}
+    matrices = {}
+
+    def support(cat_name):
+        """Gets the nodes and probabilities of a category"""
+        if cat_name not in supports:
+            supports[cat_name] = place_probabilities(places[cat_name])
+        return supports[cat_name]
+
+    def cat_times(beg_cat, end_cat):
+        """Gets the travel time between the nodes of two categories"""
+        if (beg_cat, end_cat) not in matrices:
+            beg_nodes = support(beg_cat)[0]
+            end_nodes = support(end_cat)[0]
+            # The network is undirected, the fewer sources the better
+            if len(beg_nodes) <= len(end_nodes):
+                times = compute_travel_time_matrix(
+                    net, beg_nodes, end_nodes, processes
+                    )
+            else:
+                times = compute_travel_time_matrix(
+                    net, end_nodes, beg_nodes, processes
+                    ).T
+            matrices[(beg_cat, end_cat)] = times
+            matrices[(end_cat, beg_cat)] = times.T
+        return matrices[(beg_cat, end_cat)]
+
+    total_count = 0.0
+    total_time = 0.0
+    for trip in trips:
+        count = expected_trip_count(trip, time_span)
+        if count == 0.0:
+            continue
+        total_count += count
+        total_time += count * _expected_trip_time(
+            trip, attrs, support, cat_times
+            )
+        continue
+
+    if total_count == 0.0:
+        raise ValueError('No trip expected for the mean travel time')
+
+    return total_time / total_count / time_span
+
+
+def _expected_trip_time(trip, attrs, support, cat_times):
+
+    """Computes the expected travel time of a trip
+
+    Each distinct attribute of the traveller and each random selection is a
+    random variable, with an axis in the grid of all their combinations.
+
+    """
+
+    # The categories of the random variables for the locations
+    var_keys = []
+    var_cats = []
+    loc_vars = []
+    for loc_i, loc in enumerate(trip.locations):
+        if loc.source == TRAVELLER_ATTR:
+            key = (TRAVELLER_ATTR, loc.value)
+            cat_name = attrs[loc.value]
+        elif loc.source == RANDOM_FROM_CAT:
+            key = (RANDOM_FROM_CAT, loc_i)
+            cat_name = loc.value
+        else:
+            assert False
+        if key not in var_keys:
+            var_keys.append(key)
+            var_cats.append(cat_name)
+        loc_vars.append(var_keys.index(key))
+        continue
+
+    n_vars = len(var_cats)
+    sizes = [len(support(cat_name)[0]) for cat_name in var_cats]
+
+    total = np.zeros(sizes, dtype=np.float64)
+    reached = np.ones(sizes, dtype=np.bool_)
+    for beg_loc, end_loc in zip(trip.route[:-1], trip.route[1:]):
+        beg_var = loc_vars[beg_loc]
+        end_var = loc_vars[end_loc]
+        if beg_var == end_var:
+            continue
+        times = cat_times(var_cats[beg_var], var_cats[end_var])
+        if beg_var > end_var:
+            times = times.T
+        shape = [1] * n_vars
+        shape[beg_var] = sizes[beg_var]
+        shape[end_var] = sizes[end_var]
+        times = times.reshape(shape)
+
+        reached &= np.isfinite(times)
+        total += np.where(reached, times, 0.0)
+        continue
+
+    weights = np.ones(sizes, dtype=np.float64)
+    for var_i, cat_name in enumerate(var_cats):
+        shape = [1] * n_vars
+        shape[var_i] = sizes[var_i]
+        weights *= support(cat_name)[1].reshape(shape)
+        continue
+
+    return float(np.sum(total * weights))
@@ -0,0 +1,500 @@
+"""
+Batch runs of scenarios
+=======================
+
+For studies sweeping the number of travellers, the time span, the trips or
+the weights of the places, the map is parsed and the network and places are
+formed only once, and each point of the study is evaluated as a
+:py:class:`BatchScenario` on the same model.
+
+The scenarios are read from a JSON file, or a YAML file when PyYAML is
+installed, with a list of scenarios under ``scenarios`` and optional default
+values for all of them under ``defaults``, like
+
+.. code-block:: json
+
+    {
+        "defaults": {"travellers": 100, "time": 5.0, "seed": 0},
+        "scenarios": [
+            {"name": "base"},
+            {"name": "crowded", "travellers": 1000},
+            {"name": "equal offices", "place_weights": {"work": 1.0}},
+            {"name": "commuting", "method": "matrix", "trips": [
+                {"freq": 5.0, "var": 1.0, "route": [0, 1, 0],
+                 "locations": [["attr", "home"], ["attr", "work"]]}
+                ]}
+            ]
+    }
+
+where the fields of the scenarios are
+
+``name``
+    The name of the scenario in the results.
+
+``travellers``, ``time``, ``seed``
+    The number of travellers, the time span in weeks, and the random seed.
+
+``method``
+    How the mean travel time is computed, ``'paths'`` for routing all the
+    trips, ``'matrix'`` for the travel time matrix, ``'sample'`` for the
+    stratified estimate from the fraction ``sample`` of the trips, or
+    ``'analytic'`` for the exact expectation without any traveller.
+
+``trips``
+    The list of the trip descriptions, each with the frequency ``freq``, its
+    variation ``var``, the ``locations`` as pairs of ``'attr'`` and the
+    attribute of the traveller or ``'cat'`` and the category of the places,
+    and the ``route`` over the locations. The default trips by default.
+
+``place_weights``
+    The weights of the places by category, either a number for all the places
+    in the category, or a dictionary of the weights of the places by their
+    names, with the other places keeping their weights.
+
+The scenarios sharing the seed, the number of travellers and the weights of
+places also share the travellers, which are only generated once, with the
+trips still the same as for separate runs. Such groups of scenarios are run in
+parallel by a pool of processes when requested, each of them getting a copy
+of the model. The travel time matrix is computed once for all the scenarios
+needing it, since it only depends on the locations of the places.
+
+.. autosummary::
+    :toctree: generated
+    :template: classtempl.rstt
+
+    BatchScenario
+
+.. autosummary::
+    :toctree: generated
+
+    read_batch_file
+    parse_trips
+    run_batch
+    write_results
+
+"""
+
+import csv
+import json
+import time
+import random
+import multiprocessing
+
+from .cache import stage_key
+from .places import Place
+from .trips import Trip, Location, TRAVELLER_ATTR, RANDOM_FROM_CAT
+
+
+class BatchScenario(object):
+
+    """A scenario of a batch run
+
+    .. py:attribute:: name
+
+        The name of the scenario
+
+    .. py:attribute:: travellers
+
+        The number of travellers
+
+    .. py:attribute:: time_span
+
+        The time span, in weeks
+
+    .. py:attribute:: seed
+
+        The random seed
+
+    .. py:attribute:: method
+
+        The method for the mean travel time
+
+    .. py:attribute:: sample
+
+        The fraction of the trips routed for the ``'sample'`` method
+
+    .. py:attribute:: trips
+
+        The list of :py:class:`trips.Trip`, None for the default trips
+
+    .. py:attribute:: place_weights
+
+        The dictionary of the weights of the places by category
+
+    """
+
+    __slots__ = [
+        'name',
+        'travellers',
+        'time_span',
+        'seed',
+        'method',
+        'sample',
+        'trips',
+        'place_weights',
+        ]
+
+    def __init__(self, name, travellers=100, time_span=5.0, seed=0,
+                 method='paths', sample=0.1, trips=None, place_weights=None):
+
+        """Initializes the scenario with the fields"""
+
+        if method not in _METHODS:
+            raise ValueError('Unknown method %s for scenario %s' % (
+                method, name
+                ))
+
+        self.name = name
+        self.travellers = travellers
+        self.time_span = time_span
+        self.seed = seed
+        self.method = method
+        self.sample = sample
+        self.trips = trips
+        self.place_weights = place_weights or {}
+
+    def travellers_key(self):
+
+        """Gets the key of the scenarios sharing the same travellers"""
+
+        return repr((
+            self.seed, self.travellers, sorted(
+                (cat_name, weights if not isinstance(weights, dict)
+                 else sorted(weights.iteritems()))
+                for cat_name, weights in self.place_weights.iteritems()
+                )
+            ))
+
+
+_METHODS = ['paths', 'matrix', 'sample', 'analytic']
+
+_LOCATION_SOURCES = {
+    'attr': TRAVELLER_ATTR,
+    'cat': RANDOM_FROM_CAT,
+    }
+
+
+#
+# Reading the scenarios
+# ---------------------
+#
+
+def read_batch_file(file_name):
+
+    """Reads the scenarios from a JSON or YAML file
+
+    The files with the extensions ``.yaml`` and ``.yml`` are read as YAML.
+
+    :param file_name: The name of the file
+    :returns: The list of :py:class:`BatchScenario`
+    :raises ValueError: If the file is malformed, or PyYAML is needed but
+        unavailable
+
+    """
+
+    with open(file_name, 'r') as in_file:
+        if file_name.endswith(('.yaml', '.yml')):
+            try:
+                import yaml
+            except ImportError:
+                raise ValueError('PyYAML is needed for reading %s' % file_name)
+            content = yaml.safe_load(in_file)
+        else:
+            content = json.load(in_file)
+
+    if not isinstance(content, dict) or 'scenarios' not in content:
+        raise ValueError('No scenarios in file %s' % file_name)
+
+    defaults = content.get('defaults', {})
+    scenarios = []
+    for i, spec in enumerate(content['scenarios']):
+        fields = dict(defaults)
+        fields.update(spec)
+        fields.setdefault('name', 'scenario %d' % (i + 1))
+        if 'time' in fields:
+            fields['time_span'] = fields.pop('time')
+        if fields.get('trips') is not None:
+            fields['trips'] = parse_trips(fields['trips'])
+        try:
+            scenarios.append(BatchScenario(**fields))
+        except TypeError:
+            raise ValueError('Invalid fields for scenario %s' % fields['name'])
+        continue
+
+    names = [i.name for i in scenarios]
+    if len(set(names)) != len(names):
+        raise ValueError('Duplicate scenario names in file %s' % file_name)
+
+    return scenarios
+
+
+def parse_trips(specs):
+
+    """Parses the descriptions of the trips
+
+    :param specs: The list of the dictionaries describing the trips
+    :returns: The list of :py:class:`trips.Trip`
+    :raises ValueError: If a description is malformed
+
+    """
+
+    trips = []
+    for spec in specs:
+        try:
+            locations = [
+                Location(source=_LOCATION_SOURCES[source], value=value)
+                for source, value in spec['locations']
+                ]
+            route = [int(i) for i in spec['route']]
+            trip = Trip(
+                freq=float(spec['freq']), var=float(spec['var']),
+                locations=locations, route=route
+                )
+        except (KeyError, TypeError, ValueError):
+            raise ValueError('Invalid trip description %r' % (spec, ))
+        if any(i < 0 or i >= len(locations) for i in route):
+            raise ValueError('Route out of the locations in %r' % (spec, ))
+        trips.append(trip)
+        continue
+
+    return trips
+
+
+#
+# Running the scenarios
+# ---------------------
+#
+# The model is handed to the worker processes by the pool initializer, so
+# that the forked workers get their own copies without pickling. The groups of
+# scenarios sharing the travellers are the tasks, and the results are put back
+# in the order of the scenarios.
+#
+
+_WORKER_DATA = {}
+
+
+def _init_worker(model):
+
+    """Initializes the worker processes with the model"""
+
+    _WORKER_DATA['model'] = model
+
+
+def _run_group(group, model=None):
+
+    """Runs a group of scenarios sharing the travellers
+
+    :returns: A list of the indices of the scenarios and their results
+
+    """
+
+    if model is None:
+        model = _WORKER_DATA['model']
+
+    base_places = model.places
+    base_key = model.stage_keys.get('places')
+    try:
+        results = []
+        _, first = group[0]
+        model.places = _reweight_places(base_places, first.place_weights)
+        if base_key is not None and model.places is not base_places:
+            # The cached travellers and trips depend on the weights as well
+            model.stage_keys['places'] = stage_key(
+                'place_weights', base_key, first.place_weights
+                )
+        travellers = None
+        for idx, scenario in group:
+            begin = time.time()
+            if scenario.method == 'analytic':
+                results.append((idx, _run_analytic(model, scenario, begin)))
+                continue
+
+            # The random state after the travellers is restored for the trips
+            if travellers is None:
+                model.seed_random(scenario.seed)
+                model.form_travellers(scenario.travellers)
+                travellers = model.travellers, random.getstate()
+            else:
+                model.travellers = travellers[0]
+                random.setstate(travellers[1])
+
+            results.append((idx, _run_scenario(model, scenario, begin)))
+            continue
+    finally:
+        model.places = base_places
+        if base_key is not None:
+            model.stage_keys['places'] = base_key
+
+    return results
+
+
+def _run_scenario(model, scenario, begin):
+
+    """Runs a scenario with the travellers formed"""
+
+    model.gen_trips(scenario.time_span, scenario.trips)
+    std_err = 0.0
+    if scenario.method == 'paths':
+        model.compute_paths(compact=True)
+        mean_time = model.compute_mean_time()
+        model.paths = None
+    elif scenario.method == 'matrix':
+        mean_time = model.compute_mean_time_by_matrix()
+    else:
+        mean_time, std_err = model.estimate_mean_time(
+            scenario.sample, seed=scenario.seed
+            )
+
+    return _form_result(
+        scenario, len(model.trips), mean_time, std_err, begin
+        )
+
+
+def _run_analytic(model, scenario, begin):
+
+    """Runs a scenario by the exact expectation"""
+
+    mean_time = model.compute_expected_mean_time(
+        scenario.time_span, scenario.trips
+        )
+    return _form_result(scenario, None, mean_time, 0.0, begin)
+
+
+def _form_result(scenario, n_trips, mean_time, std_err, begin):
+
+    """Forms the dictionary of the results of a scenario"""
+
+    return {
+        'name': scenario.name,
+        'travellers': scenario.travellers,
+        'time_span': scenario.time_span,
+        'seed': scenario.seed,
+        'method': scenario.method,
+        'trips': n_trips,
+        'mean_time': float(mean_time),
+        'std_err': float(std_err),
+        'wall': time.time() - begin,
+        }
+
+
+def _reweight_places(places, place_weights):
+
+    """Forms the places with the weights changed"""
+
+    if len(place_weights) == 0:
+        return places
+
+    new_places = dict(places)
+    for cat_name, weights in place_weights.iteritems():
+        if cat_name not in places:
+            raise ValueError('Unknown place category %s' % cat_name)
+        if isinstance(weights, dict):
+            new_places[cat_name] = [
+                Place(place.node, place.name,
+                      float(weights.get(place.name, place.weight)))
+                for place in places[cat_name]
+                ]
+        else:
+            new_places[cat_name] = [
+                Place(place.node, place.name, float(weights))
+                for place in places[cat_name]
+                ]
+        continue
+
+    return new_places
+
+
+def run_batch(model, scenarios, processes=None, callback=None):
+
+    """Runs the scenarios on a model
+
+    :param model: The model, with the network and places formed. Its
+        travellers and trips are changed by serial runs.
+    :param scenarios: The list of :py:class:`BatchScenario`
+    :param processes: The number of processes for running the groups of
+        scenarios sharing the travellers in parallel, serial by default
+    :param callback: An optional function called with each result as it
+        becomes available
+    :returns: The list of the dictionaries of the results, in the order of
+        the scenarios, with the fields of the scenario, the number of trips,
+        the mean travel time, its standard error for the sampled estimates,
+        and the wall time in seconds
+
+    """
+
+    if model.places is None:
+        raise ValueError('Places unavailable for batch runs')
+
+    if any(i.method == 'matrix' for i in scenarios) and model.matrix is None:
+        model.compute_matrix(processes)
+
+    groups = {}
+    for idx, scenario in enumerate(scenarios):
+        groups.setdefault(scenario.travellers_key(), []).append(
+            (idx, scenario)
+            )
+        continue
+    groups = sorted(groups.itervalues(), key=lambda group: group[0][0])
+
+    results = [None] * len(scenarios)
+
+    if processes is None or processes < 2:
+        group_results = (_run_group(group, model) for group in groups)
+        pool = None
+    else:
+        pool = multiprocessing.Pool(
+            processes, initializer=_init_worker, initargs=(model, )
+            )
+        group_results = pool.imap_unordered(_run_group, groups)
+
+    try:
+        for group_result in group_results:
+            for idx, result in group_result:
+                results[idx] = result
+                if callback is not None:
+                    callback(result)
+                continue
+            continue
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+
+    return results
+
+
+_RESULT_FIELDS = [
+    'name', 'travellers', 'time_span', 'seed', 'method', 'trips',
+    'mean_time', 'std_err', 'wall',
+    ]
+
+
+def write_results(results, out_file):
+
+    """Writes the results as a CSV table
+
+    :param results: The list of the dictionaries of the results
+    :param out_file: The file object to write to
+
+    """
+
+    writer = csv.DictWriter(out_file, _RESULT_FIELDS, lineterminator='\n')
+    writer.writeheader()
+    for result in results:
+        writer.writerow({
+            key: _format_field(value) for key, value in result.iteritems()
+            })
+        continue
+
+    return None
+
+
+def _format_field(value):
+
+    """Formats a field of the results for the CSV table"""
+
+    if isinstance(value, float):
+        return repr(value)
+    elif isinstance(value, unicode):
+        return value.encode('utf-8')
+    return value
@@ -0,0 +1,163 @@
+"""
+Caching of the pipeline stages
+==============================
+
+The stages of the preparation of a model, the parsing of the map, the
+formation of the network and places, and the generation of the travellers and
+trips, can be cached in a directory, so that unchanged stages are loaded from
+the disk rather than computed again.
+
+Each stage is stored under a fingerprint of its inputs, which includes the
+fingerprint of the stage it depends on, so a change in any stage invalidates
+all the stages after it. For the stages drawing random numbers, the state of
+the random number generator before the stage is also a part of the
+fingerprint, and its state after the stage is stored with the results and
+restored on loading, so that the results are exactly the same as computing
+the stage again, including all the random numbers drawn afterward.
+
+The functions in the inputs, like the tests for the categories of places, are
+fingerprinted by their compiled code.
+
+.. autosummary::
+    :toctree: generated
+    :template: classtempl.rstt
+
+    StageCache
+
+.. autosummary::
+    :toctree: generated
+
+    stage_key
+    stable_repr
+
+"""
+
+import os
+import random
+import hashlib
+import tempfile
+import types
+import cPickle as pickle
+
+
+class StageCache(object):
+
+    """Cache of the pipeline stages in a directory
+
+    .. py:attribute:: directory
+
+        The directory of the cache files, one pickle file for each stage and
+        fingerprint
+
+    """
+
+    __slots__ = [
+        'directory',
+        ]
+
+    def __init__(self, directory):
+
+        """Initializes the cache, the directory is created if needed"""
+
+        self.directory = directory
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def run(self, stage, parent, params, compute, use_random=False):
+
+        """Runs a stage, loading the results from the cache when possible
+
+        :param stage: The name of the stage
+        :param parent: The fingerprint of the stage it depends on, or None
+        :param params: The parameters of the stage, fingerprinted by
+            :py:func:`stable_repr`
+        :param compute: The function computing the results of the stage
+        :param use_random: If the stage draws random numbers
+        :returns: A pair of the results and the fingerprint of the stage
+
+        """
+
+        key = stage_key(
+            stage, parent, params, random.getstate() if use_random else None
+            )
+
+        file_name = os.path.join(
+            self.directory, '%s-%s.pickle' % (stage, key)
+            )
+        try:
+            with open(file_name, 'rb') as in_file:
+                result, state = pickle.load(in_file)
+        except (IOError, EOFError, pickle.UnpicklingError):
+            result = compute()
+            state = random.getstate() if use_random else None
+            self._store(file_name, (result, state))
+        else:
+            if use_random:
+                random.setstate(state)
+
+        return result, key
+
+    def _store(self, file_name, data):
+
+        """Stores the data, the file only appears when completely written"""
+
+        out_fd, tmp_name = tempfile.mkstemp(dir=self.directory)
+        try:
+            with os.fdopen(out_fd, 'wb') as out_file:
+                pickle.dump(data, out_file, pickle.HIGHEST_PROTOCOL)
+            os.rename(tmp_name, file_name)
+        except BaseException:
+            os.remove(tmp_name)
+            raise
+
+        return None
+
+
+def stage_key(stage, parent, params, state=None):
+
+    """Forms the fingerprint of a stage
+
+    :param stage: The name of the stage
+    :param parent: The fingerprint of the stage it depends on, or None
+    :param params: The parameters of the stage
+    :param state: The state of the random number generator before the stage,
+        for the stages drawing random numbers
+    :returns: The fingerprint as a hexadecimal string
+
+    """
+
+    digest = hashlib.sha1()
+    digest.update(stage)
+    digest.update(parent or '')
+    digest.update(stable_repr(params))
+    if state is not None:
+        digest.update(repr(state))
+    return digest.hexdigest()
+
+
+def stable_repr(obj):
+
+    """Forms a representation of an object stable across runs
+
+    Dictionaries are sorted by their keys, and functions are represented by
+    their compiled code rather than their addresses.
+
+    """
+
+    if isinstance(obj, dict):
+        return '{%s}' % ', '.join(
+            '%s: %s' % (stable_repr(key), stable_repr(obj[key]))
+            for key in sorted(obj)
+            )
+    elif isinstance(obj, (list, tuple)):
+        return '%s(%s)' % (
+            type(obj).__name__, ', '.join(stable_repr(i) for i in obj)
+            )
+    elif isinstance(obj, types.FunctionType):
+        return stable_repr(obj.__code__)
+    elif isinstance(obj, types.CodeType):
+        return 'code(%r, %s, %r)' % (
+            obj.co_code, stable_repr(obj.co_consts), obj.co_names
+            )
+    else:
+        return repr(obj)
@@ -0,0 +1,128 @@
+"""
+Checkpoints for long computations
+=================================
+
+Results of long computations over the edges, like the sensitivity analysis,
+are appended to a checkpoint file as they are computed, so that a killed job
+can be resumed by skipping the edges already done. Each line of the file is a
+tab-separated record of the fingerprint of the model, the two end nodes of the
+edge and the result. Records with a different fingerprint, from other models
+sharing the file, are ignored.
+
+The records are buffered and written in batches, so that checkpointing does
+not slow down the computation.
+
+.. autosummary::
+    :toctree: generated
+    :template: classtempl.rstt
+
+    Checkpoint
+
+"""
+
+import os
+
+
+class Checkpoint(object):
+
+    """Checkpoint file of results for the edges
+
+    .. py:attribute:: file_name
+
+        The name of the checkpoint file
+
+    .. py:attribute:: fingerprint
+
+        The fingerprint of the model
+
+    .. py:attribute:: done
+
+        The dictionary of the results already in the file, with the node pair
+        of the edges as keys. Both orientations of an edge are included.
+
+    """
+
+    __slots__ = [
+        'file_name',
+        'fingerprint',
+        'done',
+        'batch_size',
+        '_buffer',
+        '_broken_end',
+        ]
+
+    def __init__(self, file_name, fingerprint, batch_size=64):
+
+        """Initializes the checkpoint and reads the existing records
+
+        :param file_name: The name of the checkpoint file, which need not to
+            exist
+        :param fingerprint: The fingerprint of the model
+        :param batch_size: The number of records buffered before written
+
+        """
+
+        self.file_name = file_name
+        self.fingerprint = fingerprint
+        self.batch_size = batch_size
+        self._buffer = []
+        self._broken_end = False
+        self.done = {}
+
+        try:
+            in_file = open(file_name, 'r')
+        except IOError:
+            return
+
+        with in_file:
+            for line in in_file:
+                # Incomplete last lines from killed jobs are skipped
+                self._broken_end = not line.endswith('\n')
+                fields = line.rstrip('\n').split('\t')
+                if (self._broken_end or len(fields) != 4 or
+                        fields[0] != fingerprint):
+                    continue
+                try:
+                    beg, end = int(fields[1]), int(fields[2])
+                    result = float(fields[3])
+                except ValueError:
+                    continue
+                self.done[(beg, end)] = result
+                self.done[(end, beg)] = result
+                continue
+
+    def add(self, beg, end, result):
+
+        """Adds the result for an edge
+
+        It is written to the file when the buffer is full.
+
+        """
+
+        self.done[(beg, end)] = result
+        self.done[(end, beg)] = result
+        self._buffer.append(
+            '%s\t%d\t%d\t%r\n' % (self.fingerprint, beg, end, result)
+            )
+        if len(self._buffer) >= self.batch_size:
+            self.flush()
+
+        return None
+
+    def flush(self):
+
+        """Writes the buffered records to the file"""
+
+        if len(self._buffer) == 0:
+            return None
+
+        with open(self.file_name, 'a') as out_file:
+            if self._broken_end:
+                out_file.write('\n')
+                self._broken_end = False
+            out_file.writelines(self._buffer)
+            out_file.flush()
+            os.fsync(out_file.fileno())
+        self._buffer = []
+
+        return None
@@ -0,0 +1,298 @@
+"""
+Landmark lower bounds
+=====================
+
+This module contains the preprocessing for the landmark (ALT) lower bounds of
+the travel time between the nodes of the road network. A small number of
+nodes are selected as *landmarks* by the farthest-point heuristic, and the
+travel time from each landmark to all the nodes in the network are tabulated.
+By the triangle inequality, for any landmark :math:`L` and nodes :math:`u` and
+:math:`v`,
+
+.. math::
+
+    d(u, v) \\geq | d(L, u) - d(L, v) |
+
+which gives a cheap lower bound for the travel time between any pair of nodes.
+The bounds are used as the heuristic for the A* search.
+
+The tables are stored as NumPy arrays, which can be saved into a directory and
+memory-mapped back later.
+
+.. autosummary::
+    :toctree: generated
+    :template: classtempl.rstt
+
+    LandmarkIndex
+
+.. autosummary::
+    :toctree: generated
+
+    select_landmarks
+    form_landmarks
+    load_landmarks
+
+"""
+
+import os
+import os.path
+
+import numpy as np
+import networkx as nx
+
+
+#
+# The index class
+# ---------------
+#
+
+class LandmarkIndex(object):
+
+    """Tables of travel times from the landmarks
+
+    .. py:attribute:: nodes
+
+        A sorted array of the identities of all the nodes in the network. The
+        columns of the tables are in this order.
+
+    .. py:attribute:: landmarks
+
+        An array of the node identities of the landmarks.
+
+    .. py:attribute:: dists
+
+        A two-dimensional array, with the travel time from each landmark as
+        rows and the nodes as columns. Unreachable nodes have got infinite
+        travel time.
+
+    .. py:attribute:: comps
+
+        An array giving the label of the connected component for each node.
+
+    """
+
+    __slots__ = [
+        'nodes',
+        'landmarks',
+        'dists',
+        'comps',
+        ]
+
+    def __init__(self, nodes, landmarks, dists, comps):
+
+        """Initializes the index with the tables"""
+
+        self.nodes = nodes
+        self.landmarks = landmarks
+        self.dists = dists
+        self.comps = comps
+
+    def node_index(self, nodes):
+
+        """Gets the column indices of a node or an array of nodes
+
+        :raises KeyError: If any of the nodes is not in the index
+        """
+
+        nodes = np.asarray(nodes, dtype=self.nodes.dtype)
+        idx = np.searchsorted(self.nodes, nodes)
+        idx_clip = np.minimum(idx, len(self.nodes) - 1)
+        if np.any(self.nodes[idx_clip] != nodes):
+            raise KeyError('Nodes not found in the landmark index')
+        return idx_clip
+
+    def lower_bounds_idx(self, beg_idx, end_idx):
+
+        """Lower bounds of the travel time between given column indices
+
+        The two arguments can be integers or arrays of integers that can be
+        broadcast together.
+
+        """
+
+        beg_idx, end_idx = np.broadcast_arrays(
+            np.atleast_1d(beg_idx), np.atleast_1d(end_idx)
+            )
+        beg_dists = self.dists[:, beg_idx]
+        end_dists = self.dists[:, end_idx]
+        with np.errstate(invalid='ignore'):
+            diff = np.abs(beg_dists - end_dists)
+        # Landmarks in other components do not give any information
+        diff[np.isnan(diff)] = 0.0
+        bounds = np.max(diff, axis=0)
+        return np.where(
+            self.comps[beg_idx] == self.comps[end_idx], bounds, np.inf
+            )
+
+    def lower_bound(self, beg, end):
+
+        """Gets the lower bound of the travel time between two nodes"""
+
+        beg_idx, end_idx = self.node_index([beg, end])
+        return float(self.lower_bounds_idx(beg_idx, end_idx)[0])
+
+    def heuristic(self, beg, end):
+
+        """The heuristic function to be used for the A* search"""
+
+        return self.lower_bound(beg, end)
+
+    def heuristic_to(self, target):
+
+        """Gets a faster heuristic function for a fixed target
+
+        The landmark distances of the target are extracted only once, and the
+        bounds for other nodes are evaluated on plain lists.
+
+        """
+
+        nodes = self.nodes
+        dists = self.dists
+        target_idx = int(self.node_index(target))
+        target_dists = dists[:, target_idx].tolist()
+        target_comp = self.comps[target_idx]
+
+        def heuristic(node, _):
+
+            """The lower bound of the travel time to the target"""
+
+            idx = nodes.searchsorted(node)
+            if self.comps[idx] != target_comp:
+                return float('inf')
+            return max([0.0] + [
+                abs(i - j)
+                for i, j in zip(dists[:, idx].tolist(), target_dists)
+                if i - j == i - j  # skip landmarks of other components
+                ])
+
+        return heuristic
+
+    def save(self, dir_name):
+
+        """Saves the tables into a directory
+
+        Each of the tables are saved as a NumPy ``.npy`` file, so that they can
+        be memory-mapped later by :py:func:`load_landmarks`.
+
+        """
+
+        if not os.path.isdir(dir_name):
+            os.makedirs(dir_name)
+        for field in self.__slots__:
+            np.save(
+                os.path.join(dir_name, field + '.npy'), getattr(self, field)
+                )
+
+        return None
+
+
+def load_landmarks(dir_name, mmap=True):
+
+    """Loads the landmark tables from a directory
+
+    :param dir_name: The directory that the tables are saved into by
+        :py:meth:`LandmarkIndex.save`
+    :param mmap: If the tables are going to be memory-mapped read-only rather
+        than read into the memory
+    :returns: A :py:class:`LandmarkIndex` instance
+    :raises ValueError: If the tables cannot be read
+
+    """
+
+    mmap_mode = 'r' if mmap else None
+    try:
+        tables = [
+            np.load(
+                os.path.join(dir_name, field + '.npy'), mmap_mode=mmap_mode
+                )
+            for field in LandmarkIndex.__slots__
+            ]
+    except IOError:
+        raise ValueError('Landmark tables in %s unable to be read' % dir_name)
+
+    return LandmarkIndex(*tables)
+
+
+#
+# Landmark selection
+# ------------------
+#
+# The landmarks are selected by the farthest-point heuristic. The first
+# landmark is the node farthest from an arbitrary node, and each of the later
+# ones is the node farthest from all the landmarks already selected. Nodes not
+# reachable from any landmark yet are considered the farthest, so that each
+# connected component can get its landmarks when enough landmarks are asked
+# for.
+#
+
+def _dists_from(net, nodes, source):
+
+    """Computes the array of travel times from a source to sorted nodes"""
+
+    lengths = nx.single_source_dijkstra_path_length(
+        net, source, weight='travel_time'
+        )
+    dists = np.empty(len(nodes), dtype=np.float64)
+    dists.fill(np.inf)
+    dists[np.searchsorted(nodes, lengths.keys())] = lengths.values()
+    return dists
+
+
+def select_landmarks(net, number):
+
+    """Selects the landmarks by the farthest-point heuristic
+
+    :param net: The road network
+    :param number: The number of landmarks to select. Less landmarks can be
+        returned for very small networks.
+    :returns: A pair of the sorted array of nodes and a list of pairs of the
+        landmark and the array of its travel times to the nodes
+
+    """
+
+    nodes = np.array(sorted(net.nodes_iter()), dtype=np.int64)
+    if len(nodes) == 0:
+        raise ValueError('Landmarks cannot be selected on an empty network')
+
+    dists = _dists_from(net, nodes, nodes[0])
+    curr = nodes[np.argmax(np.where(np.isinf(dists), -1.0, dists))]
+    min_dists = np.empty(len(nodes), dtype=np.float64)
+    min_dists.fill(np.inf)
+
+    selected = []
+    for _ in xrange(0, number):
+        dists = _dists_from(net, nodes, curr)
+        selected.append((curr, dists))
+        np.minimum(min_dists, dists, out=min_dists)
+
+        farthest = np.argmax(min_dists)
+        if min_dists[farthest] == 0.0:
+            break  # all nodes have been selected
+        curr = nodes[farthest]
+
+    return nodes, selected
+
+
+def form_landmarks(net, number=16):
+
+    """Forms the landmark index for a network
+
+    :param net: The road network
+    :param number: The number of landmarks
+    :returns: A :py:class:`LandmarkIndex` instance
+
+    """
+
+    nodes, selected = select_landmarks(net, number)
+
+    comps = np.empty(len(nodes), dtype=np.int64)
+    for label, comp in enumerate(nx.connected_components(net)):
+        comps[np.searchsorted(nodes, list(comp))] = label
+
+    return LandmarkIndex(
+        nodes,
+        np.array([i[0] for i in selected], dtype=np.int64),
+        np.array([i[1] for i in selected], dtype=np.float64),
+        comps
+        )
+
@@ -12,6 +12,8 @@ analysis towards the graph or runs optional script.
 from __future__ import print_function
 
 import argparse
+import sys
+import contextlib
 
 import networkx as nx
 
@@ -19,7 +21,16 @@ from .model import Model
 from .network import print_network, draw_network
 from .places import print_places
 from .travellers import print_travellers
-from .simultime import simul_travel_time, test_sensitivity_edges
+from .simultime import (
+    simul_travel_time, test_sensitivity_edges, test_sensitivity_top_edges,
+    test_sensitivity_scenarios
+    )
+from .scenarios import form_street_scenarios, form_junction_scenarios
+from .replications import run_replications
+from .timings import Timings
+from .progress import ConsoleProgress
+from .paths import RoutingStats, collect_stats
+from .verify import verify_model, print_checks
 
 
 def main():
@@ -42,6 +53,11 @@ def main():
         metavar='FILE',
         help='Plots the graph to file'
         )
+    parser.add_argument(
+        '--volumes', '-V', action='store', type=str,
+        metavar='FILE',
+        help='Plots the graph with the traffic volumes to file'
+        )
     parser.add_argument(
         '--travellers', '-t', type=int, action='store', default=100,
         help='The number of travellers to simulate'
@@ -54,6 +70,91 @@ def main():
         '--sensitivity', '-s', action='store_true', default=False,
         help='Perform sensitivity analysis (slow!)'
         )
+    # The ways of computing the mean travel time, other than all the paths
+    mean_group = parser.add_mutually_exclusive_group()
+    mean_group.add_argument(
+        '--matrix', '-m', action='store_true', default=False,
+        help='Compute the mean travel time by a travel time matrix'
+        )
+    parser.add_argument(
+        '--processes', '-p', type=int, action='store', default=None,
+        help='The number of processes for parallel computation'
+        )
+    parser.add_argument(
+        '--landmarks', '-l', type=int, action='store', default=0,
+        help='The number of landmarks for the travel time lower bounds'
+        )
+    parser.add_argument(
+        '--sa-method', action='store', default='index',
+        choices=['index', 'replacement', 'brute'],
+        help='The method for the sensitivity analysis'
+        )
+    parser.add_argument(
+        '--sa-output', action='store', type=str, metavar='FILE',
+        help='Write the sorted sensitivity analysis results to file'
+        )
+    parser.add_argument(
+        '--sa-top', action='store', type=int, metavar='N',
+        help='Only find the N most sensitive edges'
+        )
+    parser.add_argument(
+        '--sa-records', action='store', type=str, metavar='FILE',
+        help='Write the sensitivity analysis records as JSON lines to file'
+        )
+    parser.add_argument(
+        '--closures', action='store', default=None,
+        choices=['streets', 'junctions'],
+        help='Test the closure of each whole street or each junction'
+        )
+    parser.add_argument(
+        '--closures-output', action='store', type=str, metavar='FILE',
+        help='Write the sorted closure results to file'
+        )
+    parser.add_argument(
+        '--checkpoint', action='store', type=str, metavar='FILE',
+        help='Checkpoint file for resuming the sensitivity analysis'
+        )
+    parser.add_argument(
+        '--cache', action='store', type=str, metavar='DIR',
+        help='Directory for caching the network, places, travellers and trips'
+        )
+    parser.add_argument(
+        '--seed', action='store', type=int, default=None,
+        help='The seed for the random numbers, needed for resuming'
+        )
+    mean_group.add_argument(
+        '--sample', action='store', type=float, metavar='FRACTION',
+        help='Estimate the mean travel time from a fraction of the trips'
+        )
+    parser.add_argument(
+        '--analytic', '-a', action='store_true', default=False,
+        help='Compute the exact expected mean travel time as well'
+        )
+    parser.add_argument(
+        '--replications', '-R', type=int, action='store', default=0,
+        help='The maximum number of Monte Carlo replications to run'
+        )
+    parser.add_argument(
+        '--precision', type=float, action='store', default=None,
+        help='The relative precision to stop the replications at'
+        )
+    parser.add_argument(
+        '--timings', action='store', type=str, metavar='FILE',
+        help='Write the time and memory usage of the stages as JSON to file'
+        )
+    parser.add_argument(
+        '--progress', type=float, action='store', nargs='?', const=5.0,
+        default=None, metavar='SECONDS',
+        help='Report the progress of long loops to stderr every few seconds'
+        )
+    parser.add_argument(
+        '--routing-stats', action='store_true', default=False,
+        help='Count the work of the shortest-path searches of each stage'
+        )
+    parser.add_argument(
+        '--verify', action='store_true', default=False,
+        help='Verify the fast engines against the reference implementations'
+        )
     parser.add_argument(
         '--script', '-S', action='store',
         help='Run script after the simulation'
@@ -67,15 +168,33 @@ def main():
     print('*' * 80)
     print('\n\n\n')
 
-    model = Model(args.map[0])
+    timings = Timings() if args.timings is not None else None
+
+    progress = (
+        ConsoleProgress(interval=args.progress)
+        if args.progress is not None else None
+        )
+
+    model = Model(
+        args.map[0], cache_dir=args.cache, timings=timings, progress=progress,
+        routing_stats=args.routing_stats
+        )
     print('Map file %s successfully parsed...' % args.map[0])
 
+    if args.seed is not None:
+        model.seed_random(args.seed)
+        print('Random numbers seeded with %d...' % args.seed)
+
     model.form_network()
     print('Network successfully formed...')
     print(' %d nodes and %d edges' % (
         model.network.number_of_nodes(), model.network.number_of_edges()
         ))
 
+    if args.landmarks > 0:
+        model.form_landmarks(args.landmarks)
+        print(' %d landmarks selected...' % len(model.landmarks.landmarks))
+
     model.form_places()
     print('Places of interest recognized...')
     for cat_name, places_list in model.places.iteritems():
@@ -97,11 +216,108 @@ def main():
         draw_network(model.network, args.draw)
         print('Network drawn to file %s' % args.draw)
 
-    mean_time = simul_travel_time(model)
+    if args.sample is not None:
+        mean_time, std_err = model.estimate_mean_time(args.sample)
+        print('Mean travel time estimated from %g of the trips' % (
+            args.sample
+            ))
+        print(' standard error %f hours' % std_err)
+    elif args.matrix:
+        model.compute_matrix(args.processes)
+        print('Travel time matrix of %d by %d computed...' % (
+            model.matrix.times.shape
+            ))
+        mean_time = model.compute_mean_time_by_matrix()
+    else:
+        mean_time = simul_travel_time(model)
     print('Mean travel time per traveller per week %f hours' % mean_time)
 
-    if args.sensitivity:
-        test_sensitivity_edges(model, mean_time)
+    if args.sample is not None and (
+            args.sensitivity or args.closures is not None
+            ):
+        # The changes are computed exactly over all the trips, so the base
+        # mean time for them must be exact as well, not the estimate
+        mean_time = simul_travel_time(model)
+        print('Exact mean travel time for the sensitivity %f hours' % (
+            mean_time
+            ))
+
+    if args.analytic:
+        print('Expected mean travel time per traveller per week %f hours' % (
+            model.compute_expected_mean_time(
+                args.time, processes=args.processes
+                )
+            ))
+
+    status = 0
+    if args.verify:
+        print('Verifying the engines against the references...')
+        with _stage(model, 'verify'):
+            checks = verify_model(model)
+        print_checks(checks, sys.stdout)
+        if all(check.ok() for check in checks):
+            print(' All the checks passed')
+        else:
+            print(' Some checks FAILED')
+            status = 1
+
+    if args.volumes is not None:
+        model.compute_volumes()
+        draw_network(model.network, args.volumes, width_attr='volume')
+        print('Network with traffic volumes drawn to file %s' % args.volumes)
+
+    if args.sensitivity and args.sa_top is not None:
+        with _stage(model, 'sensitivity'):
+            test_sensitivity_top_edges(
+                model, mean_time, number=args.sa_top, output=args.sa_output,
+                records=args.sa_records
+                )
+    elif args.sensitivity:
+        with _stage(model, 'sensitivity'):
+            test_sensitivity_edges(
+                model, mean_time, method=args.sa_method,
+                processes=args.processes, output=args.sa_output,
+                checkpoint=args.checkpoint, records=args.sa_records
+                )
+
+    if args.closures is not None:
+        if args.closures == 'streets':
+            scenarios = form_street_scenarios(model.network)
+        else:
+            scenarios = form_junction_scenarios(model.network)
+        with _stage(model, 'closures') as record:
+            test_sensitivity_scenarios(
+                model, mean_time, scenarios, output=args.closures_output
+                )
+            if record is not None:
+                record.counts['scenarios'] = len(scenarios)
+
+    if args.replications > 0:
+        print('Running Monte Carlo replications...')
+
+        def print_replication(results):
+            """Prints the progress of the replications"""
+            print(' replication %d: %f hours, %f +- %f' % (
+                len(results), results.mean_times[-1], results.mean(),
+                results.half_width()
+                ))
+
+        with _stage(model, 'replications') as record:
+            results = run_replications(
+                model, args.travellers, args.time,
+                seed=args.seed if args.seed is not None else 0,
+                rel_precision=args.precision, max_reps=args.replications,
+                callback=print_replication
+                )
+            if record is not None:
+                record.counts['replications'] = len(results)
+        print('Mean travel time per traveller per week %f hours' % (
+            results.mean()
+            ))
+        print(' %d%% confidence interval [%f, %f] from %d replications' % (
+            (round(results.confidence * 100),) + results.interval() +
+            (len(results),)
+            ))
 
     if args.script is not None:
         print('Running custom python script %s' % args.script)
@@ -110,7 +326,45 @@ def main():
             {'model': model, 'nx': nx}
             )
 
-    return 0
+    if model.routing_stats is not None:
+        print('Shortest-path searches of the stages:')
+        for name, stats in sorted(model.routing_stats.iteritems()):
+            if not any(stats.as_dict().itervalues()):
+                continue
+            print(' %s: %s' % (name, ', '.join(
+                '%s %d' % (key, value)
+                for key, value in sorted(stats.as_dict().iteritems())
+                )))
+            continue
+
+    if timings is not None:
+        timings.write(args.timings)
+        print('Timings of %d stages written to file %s' % (
+            len(timings.stages), args.timings
+            ))
+
+    return status
+
+
+@contextlib.contextmanager
+def _stage(model, name):
+
+    """Records a part of the run as a stage, like the stages of the model
+
+    The record of the timing is given when the timings are requested.
+
+    """
+
+    stats = None
+    if model.routing_stats is not None:
+        stats = model.routing_stats.setdefault(name, RoutingStats())
+
+    with collect_stats(stats):
+        if model.timings is None:
+            yield None
+        else:
+            with model.timings.stage(name) as record:
+                yield record
 
 
 
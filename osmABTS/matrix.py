@@ -0,0 +1,302 @@
+"""
+Travel time matrices
+====================
+
+Since the set of distinct nodes for the places of interest is usually much
+smaller than the number of trips, the travel time of the trips can be computed
+by looking up a dense matrix of the travel time from the homes to all the other
+places, rather than routing each of the trips. Each row of the matrix is
+computed by a single Dijkstra search from the source node, which terminates as
+soon as all the places are reached, and the rows can be computed in parallel
+by a pool of processes.
+
+Since the network is undirected, the matrix is also used for the legs from a
+place back to a home.
+
+.. autosummary::
+    :toctree: generated
+    :template: classtempl.rstt
+
+    TravelTimeMatrix
+
+.. autosummary::
+    :toctree: generated
+
+    compute_travel_time_matrix
+    form_matrix_from_places
+
+"""
+
+import multiprocessing
+
+import numpy as np
+
+from .paths import dijkstra
+from .util import pairwise
+
+
+#
+# The matrix class
+# ----------------
+#
+
+class TravelTimeMatrix(object):
+
+    """Dense travel time matrix from source nodes to target nodes
+
+    .. py:attribute:: sources
+
+        A sorted array of the source nodes, corresponding to the rows.
+
+    .. py:attribute:: targets
+
+        A sorted array of the target nodes, corresponding to the columns.
+
+    .. py:attribute:: times
+
+        The two-dimensional array of the travel times, infinite for unreachable
+        pairs.
+
+    .. py:attribute:: categories
+
+        A dictionary with the place category names as keys and the array of
+        the column indices of the nodes of the category as values.
+
+    """
+
+    __slots__ = [
+        'sources',
+        'targets',
+        'times',
+        'categories',
+        ]
+
+    def __init__(self, sources, targets, times, categories):
+
+        """Initializes the matrix with the arrays"""
+
+        self.sources = sources
+        self.targets = targets
+        self.times = times
+        self.categories = categories
+
+    def category_times(self, cat_name):
+
+        """Gets the sub-matrix for the nodes of a category of places
+
+        :param cat_name: The name of the category
+        :returns: The array of travel times from all the sources to the nodes
+            of the category, in the order of the nodes of the places
+
+        """
+
+        return self.times[:, self.categories[cat_name]]
+
+    def leg_times(self, beg_nodes, end_nodes):
+
+        """Looks up the travel times for legs between pairs of nodes
+
+        Each leg needs to have one end in the sources and the other end in the
+        targets.
+
+        :param beg_nodes: An array of the beginning nodes of the legs
+        :param end_nodes: An array of the ending nodes of the legs
+        :returns: An array of the travel times
+        :raises KeyError: If any leg is not covered by the matrix
+
+        """
+
+        beg_nodes = np.asarray(beg_nodes, dtype=np.int64)
+        end_nodes = np.asarray(end_nodes, dtype=np.int64)
+
+        times = np.empty(len(beg_nodes), dtype=np.float64)
+        times.fill(np.nan)
+        times[beg_nodes == end_nodes] = 0.0
+
+        for row_nodes, col_nodes in [
+                (beg_nodes, end_nodes), (end_nodes, beg_nodes)
+                ]:
+            rows, row_found = _locate(self.sources, row_nodes)
+            cols, col_found = _locate(self.targets, col_nodes)
+            found = row_found & col_found & np.isnan(times)
+            times[found] = self.times[rows[found], cols[found]]
+            continue
+
+        if np.any(np.isnan(times)):
+            raise KeyError('Legs not covered by the travel time matrix')
+
+        return times
+
+    def trip_times(self, trips):
+
+        """Computes the travel time of trips by looking up the matrix
+
+        As for :py:class:`paths.ShortestPath`, the travel time of a trip only
+        counts the legs before the first unreachable one.
+
+        :param trips: A list of trips, each of them a list of places
+        :returns: An array of the travel times of the trips
+
+        """
+
+        leg_trip = []
+        beg_nodes = []
+        end_nodes = []
+        for trip_i, trip in enumerate(trips):
+            for beg, end in pairwise(trip):
+                leg_trip.append(trip_i)
+                beg_nodes.append(beg.node)
+                end_nodes.append(end.node)
+                continue
+            continue
+
+        leg_trip = np.array(leg_trip, dtype=np.int64)
+        times = self.leg_times(beg_nodes, end_nodes)
+
+        leg_pos = np.arange(len(leg_trip))
+        cut = np.isinf(times)
+        first_cut = np.empty(len(trips), dtype=np.int64)
+        first_cut.fill(len(leg_trip))
+        np.minimum.at(first_cut, leg_trip[cut], leg_pos[cut])
+        kept = leg_pos < first_cut[leg_trip]
+
+        return np.bincount(
+            leg_trip[kept], weights=times[kept], minlength=len(trips)
+            )
+
+
+def _locate(sorted_nodes, nodes):
+
+    """Locates nodes in a sorted array
+
+    :returns: The indices and a boolean array for if the nodes are found
+
+    """
+
+    if len(sorted_nodes) == 0:
+        return (
+            np.zeros(len(nodes), dtype=np.int64),
+            np.zeros(len(nodes), dtype=np.bool_)
+            )
+    idx = np.minimum(
+        np.searchsorted(sorted_nodes, nodes), len(sorted_nodes) - 1
+        )
+    return idx, sorted_nodes[idx] == nodes
+
+
+#
+# Matrix computation
+# ------------------
+#
+# The rows are computed by Dijkstra searches terminated once all the targets
+# are settled. For parallel computation, the network is handed to the worker
+# processes once by the pool initializer, and the sources are distributed in
+# chunks.
+#
+
+_WORKER_DATA = {}
+
+
+def _compute_row(net, source, targets):
+
+    """Computes the travel times from a source to the sorted targets"""
+
+    dist, _ = dijkstra(net, [source], targets)
+    row = np.empty(len(targets), dtype=np.float64)
+    row.fill(np.inf)
+    reached = [i for i, node in enumerate(targets) if node in dist]
+    row[reached] = [dist[targets[i]] for i in reached]
+    return row
+
+
+def _init_worker(net, targets):
+
+    """Initializes the worker processes with the network"""
+
+    _WORKER_DATA['net'] = net
+    _WORKER_DATA['targets'] = targets
+
+
+def _compute_row_in_worker(source):
+
+    """Computes a row in a worker process"""
+
+    return _compute_row(_WORKER_DATA['net'], source, _WORKER_DATA['targets'])
+
+
+def compute_travel_time_matrix(net, sources, targets, processes=None):
+
+    """Computes the dense travel time matrix between nodes
+
+    :param net: The network
+    :param sources: A sorted array of the source nodes
+    :param targets: A sorted array of the target nodes
+    :param processes: The number of processes to use, serial computation will
+        be performed for None or one.
+    :returns: A two-dimensional array for the travel times, with the sources
+        as the rows and targets as the columns
+
+    """
+
+    targets = targets.tolist()
+
+    if processes is None or processes < 2:
+        rows = [_compute_row(net, source, targets) for source in sources]
+    else:
+        pool = multiprocessing.Pool(
+            processes, initializer=_init_worker, initargs=(net, targets)
+            )
+        try:
+            rows = pool.map(
+                _compute_row_in_worker, sources.tolist(),
+                chunksize=max(1, len(sources) // (processes * 4))
+                )
+        finally:
+            pool.close()
+            pool.join()
+
+    times = np.empty((len(sources), len(targets)), dtype=np.float64)
+    for i, row in enumerate(rows):
+        times[i, :] = row
+        continue
+
+    return times
+
+
+def form_matrix_from_places(net, places, processes=None, source_cat='home'):
+
+    """Forms the travel time matrix from one category to all the others
+
+    :param net: The network
+    :param places: The places of interest dictionary
+    :param processes: The number of processes to use
+    :param source_cat: The name of the category for the sources
+    :returns: A :py:class:`TravelTimeMatrix` instance, with the categories
+        dictionary including all the categories other than the sources
+
+    """
+
+    sources = np.unique(np.array(
+        [place.node for place in places[source_cat]], dtype=np.int64
+        ))
+
+    cat_nodes = {
+        cat_name: np.array(
+            [place.node for place in cat_list], dtype=np.int64
+            )
+        for cat_name, cat_list in places.iteritems()
+        if cat_name != source_cat
+        }
+    if len(cat_nodes) > 0:
+        targets = np.unique(np.concatenate(cat_nodes.values()))
+    else:
+        targets = np.array([], dtype=np.int64)
+
+    categories = {
+        cat_name: np.searchsorted(targets, nodes)
+        for cat_name, nodes in cat_nodes.iteritems()
+        }
+
+    times = compute_travel_time_matrix(net, sources, targets, processes)
+
+    return TravelTimeMatrix(sources, targets, times, categories)
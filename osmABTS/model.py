@@ -11,12 +11,26 @@ most class in this project and is the one that mostly interacts with the users.
 
 """
 
+import random
+import hashlib
+
+import numpy as np
+
+from .util import file_digest
 from .readosm import read_osm
 from .network import form_network_from_osm
 from .places import form_places_from_osm, DEFAULT_PLACE_CATS
 from .travellers import Traveller, DEFAULT_ATTRS
-from .trips import gen_trips, DEFAULT_TRIPS
-from .paths import ShortestPath
+from .trips import gen_trips, unique_trips, DEFAULT_TRIPS
+from .paths import ShortestPath, PathStore, store_paths
+from .landmarks import form_landmarks
+from .matrix import form_matrix_from_places
+from .traffic import form_edge_index, edge_volumes
+from .analytic import expected_mean_time
+from .sampling import form_strata, sample_strata, stratified_mean
+from .cache import StageCache
+from .timings import timed_stage
+from .progress import track
 
 
 class Model(object):
@@ -41,7 +55,8 @@ class Model(object):
     formed as a networkx graph. The nodes are just the traffic junctions and
     the edges are the road connections, with travelling time given as the
     weight. This network can be formed by calling the :py:meth:`form_network`
-    method and stored in the :py:attr:`network` field.
+    method and stored in the :py:attr:`network` field, with the option of
+    trimming out the pure connection nodes kept in the :py:attr:`trim` field.
 
     Next the places of interest for the travellers to visit needs to be
     generated, also from the OSM data. To make the problem simple, the places
@@ -70,48 +85,247 @@ class Model(object):
 
     The generation of the trips can be achieved by calling the method
     :py:meth:`gen_trips` and the trips will be stored in the :py:attr:`trips`
-    attribute with the initial and final node pair as elements. Then the
+    attribute with the initial and final node pair as elements. The kind of
+    each trip, as the index in the list of trip descriptions, and the index of
+    its traveller are stored in the attributes :py:attr:`trip_kinds` and
+    :py:attr:`trip_travellers`. Then the
     computation of the shortest paths can be achieved by
     :py:meth:`compute_paths` and stored in the attribute :py:attr:`paths`.
     Finally the average time spent on travel can be computed by the
     straightforward method :py:meth:`compute_mean_time`.
 
+    Alternatively, since the trips are mostly between the homes and the other
+    places, a dense matrix of the travel time from all the homes to all the
+    other places can be computed by :py:meth:`compute_matrix` and stored in
+    the attribute :py:attr:`matrix`. Then the mean travel time can be computed
+    by :py:meth:`compute_mean_time_by_matrix` with simple look-ups rather than
+    shortest path searches for each trip.
+
+    For quick estimates, the mean travel time can be estimated with a standard
+    error by :py:meth:`estimate_mean_time` from a stratified random sample of
+    the trips, see :py:mod:`sampling`.
+
+    Without generating any traveller or trip, the mean travel time can also be
+    computed exactly as the limit for many travellers by
+    :py:meth:`compute_expected_mean_time`, from the definitions of the trips
+    and the weights of the places.
+
+    .. rubric:: Traffic volumes
+
+    The number of traversals of each edge by all the trips can be computed by
+    :py:meth:`compute_volumes`. The results are stored in the attribute
+    :py:attr:`volumes` as an array in the order of the dense edge identities
+    in :py:attr:`edge_index`, and also set as the edge attribute ``volume``
+    of the network.
+
+    .. rubric:: Reproducibility
+
+    The random numbers for the travellers and trips can be seeded by
+    :py:meth:`seed_random`, with the seed recorded in the attribute
+    :py:attr:`seed`. A fingerprint of the map file, the seed and the generated
+    trips can be obtained from :py:meth:`fingerprint`, for identifying the
+    results of long computations on the model.
+
+    .. rubric:: Caching
+
+    With a cache directory given to the constructor, the parsing of the map,
+    the network, places, travellers and trips are stored in the directory
+    under the fingerprints of their inputs, and loaded rather than computed
+    again when the inputs are unchanged, see :py:mod:`cache`. The
+    fingerprints of the stages are kept in the attribute
+    :py:attr:`stage_keys`.
+
+    .. rubric:: Timings
+
+    With a :py:class:`timings.Timings` instance given to the constructor, the
+    wall and CPU time and the memory usage of each of the stages above are
+    recorded in it, with the sizes of their results, see :py:mod:`timings`.
+    The instance is kept in the attribute :py:attr:`timings`.
+
+    With the routing statistics requested from the constructor, the work of
+    the shortest-path searches of each stage is counted into a
+    :py:class:`paths.RoutingStats` in the dictionary :py:attr:`routing_stats`,
+    with the names of the stages as keys.
+
+    Similarly, a progress callback can be given to the constructor and kept in
+    the attribute :py:attr:`progress`, to be called during the long loops, like
+    the routing of the trips, see :py:mod:`progress`.
+
+    .. rubric:: Landmarks
+
+    Optionally, the landmark lower bounds of the travel time can be formed by
+    :py:meth:`form_landmarks` after the network, and stored in the attribute
+    :py:attr:`landmarks`. When available, they are used for the A* search of
+    the shortest paths.
+
     """
 
     __slots__ = [
+        'osm_file',
+        'seed',
         'raw_osm',
         'network',
+        'trim',
         'places',
         'travellers',
         'trips',
+        'trip_kinds',
+        'trip_travellers',
         'time_span',
         'paths',
+        'landmarks',
+        'matrix',
+        'edge_index',
+        'volumes',
+        'cache',
+        'stage_keys',
+        'timings',
+        'progress',
+        'routing_stats',
         ]
 
-    def __init__(self, osm_file):
+    def __init__(self, osm_file, cache_dir=None, timings=None,
+                 progress=None, routing_stats=False):
 
         """Initializes the object with given OpenStreetMap data
 
         :param osm_file: The file name for the OpenStreetMap data
+        :param cache_dir: The optional directory for caching the stages
+        :param timings: The optional :py:class:`timings.Timings` instance for
+            recording the stages
+        :param progress: The optional progress callback for the long loops
+        :param routing_stats: If the shortest-path searches are counted
         :raises ValueError: If the file is corrupt or cannot be read
         """
 
-        self.raw_osm = read_osm(osm_file)
+        self.osm_file = osm_file
+        self.seed = None
+        self.cache = StageCache(cache_dir) if cache_dir is not None else None
+        self.stage_keys = {}
+        self.timings = timings
+        self.progress = progress
+        self.routing_stats = {} if routing_stats else None
+        self._read_osm()
 
         # Initialize the fields to None for detection of no value yet computed
         self.network = None
+        self.trim = None
         self.places = None
         self.travellers = None
         self.trips = None
+        self.trip_kinds = None
+        self.trip_travellers = None
         self.paths = None
+        self.landmarks = None
+        self.matrix = None
+        self.edge_index = None
+        self.volumes = None
         self.time_span = 0.0
 
-    def form_network(self):
+    @timed_stage('parse', lambda self: {
+        'nodes': len(self.raw_osm.nodes), 'ways': len(self.raw_osm.ways)
+        })
+    def _read_osm(self):
+
+        """Parses the OpenStreetMap data of the file"""
+
+        # The map is fingerprinted by its content, only needed for the cache
+        digest = file_digest(self.osm_file) if self.cache is not None else None
+        self.raw_osm = self._run_stage(
+            'raw_osm', None, digest, lambda: read_osm(self.osm_file)
+            )
+
+    def _run_stage(self, stage, parent, params, compute, use_random=False):
+
+        """Runs a stage of the preparation, through the cache if available
+
+        :param stage: The name of the stage, for the fingerprint
+        :param parent: The name of the stage it depends on
+        :param params: The parameters of the stage
+        :param compute: The function computing the results
+        :param use_random: If the stage draws random numbers
+        :returns: The results of the stage
+
+        """
+
+        if self.cache is None:
+            return compute()
+
+        result, self.stage_keys[stage] = self.cache.run(
+            stage, self.stage_keys.get(parent), params, compute, use_random
+            )
+        return result
+
+    def seed_random(self, seed):
+
+        """Seeds the random numbers for the simulation
 
-        """Forms the road network based on the raw data """
+        :param seed: The seed, an integer or a string
 
-        self.network = form_network_from_osm(self.raw_osm)
+        """
+
+        random.seed(seed)
+        self.seed = seed
+
+    def fingerprint(self):
+
+        """Computes the fingerprint of the model
+
+        It is a hex digest of the content of the map file, the random seed, the
+        time span, and the node sequences of the trips.
+
+        """
+
+        if self.trips is None:
+            raise ValueError('Trips unavailable for the model fingerprint')
+
+        digest = hashlib.sha1()
+        digest.update(file_digest(self.osm_file))
+        digest.update(repr((self.seed, self.time_span)))
+        for trip in self.trips:
+            digest.update(repr(tuple(place.node for place in trip)))
+            continue
+
+        return digest.hexdigest()
+
+    @timed_stage('network', lambda self: {
+        'nodes': self.network.number_of_nodes(),
+        'edges': self.network.number_of_edges()
+        })
+    def form_network(self, trim=True):
+
+        """Forms the road network based on the raw data
+
+        :param trim: If the pure connection nodes are trimmed out
+
+        """
+
+        self.network = self._run_stage(
+            'network', 'raw_osm', trim,
+            lambda: form_network_from_osm(self.raw_osm, trim)
+            )
+        self.trim = trim
+        self.landmarks = None
+
+    @timed_stage('landmarks', lambda self: {
+        'landmarks': len(self.landmarks.landmarks)
+        })
+    def form_landmarks(self, number=16):
+
+        """Forms the landmark lower bounds of the travel time
+
+        :param number: The number of landmarks to select
+
+        """
 
+        if self.network is None:
+            raise ValueError('Landmarks cannot be formed without a network')
+
+        self.landmarks = form_landmarks(self.network, number)
+
+    @timed_stage('places', lambda self: {
+        'places': sum(len(i) for i in self.places.itervalues())
+        })
     def form_places(self, place_cats=None):
 
         """Forms the dictionary of interesting places
@@ -129,10 +343,17 @@ class Model(object):
         if self.network is None:
             raise ValueError('Places cannot be generated without a network')
 
-        self.places = form_places_from_osm(
-            self.raw_osm, self.network, place_cats
+        self.places = self._run_stage(
+            'places', 'network', place_cats,
+            lambda: form_places_from_osm(
+                self.raw_osm, self.network, place_cats
+                )
             )
+        self.matrix = None
 
+    @timed_stage('travellers', lambda self: {
+        'travellers': len(self.travellers)
+        })
     def form_travellers(self, number, attrs=None):
 
         """Forms a list of travellers
@@ -150,11 +371,16 @@ class Model(object):
         if self.places is None:
             raise ValueError('Places unavailable for traveller generation')
 
-        self.travellers = [
-            Traveller(self.places, attrs)
-            for _ in xrange(0, number)
-            ]
+        self.travellers = self._run_stage(
+            'travellers', 'places', (number, attrs),
+            lambda: [
+                Traveller(self.places, attrs)
+                for _ in xrange(0, number)
+                ],
+            use_random=True
+            )
 
+    @timed_stage('trips', lambda self: {'trips': len(self.trips)})
     def gen_trips(self, time_span, trips=None):
 
         """Generates trips for the simulation
@@ -175,24 +401,57 @@ class Model(object):
             raise ValueError('Travellers unavailable for trip generation')
 
         self.time_span = time_span
-        self.trips = []
-        for traveller_i in self.travellers:
-            self.trips.extend(gen_trips(
-                time_span, self.places, trips, traveller_i
-                ))
+        self.trips, self.trip_kinds, self.trip_travellers = self._run_stage(
+            'trips', 'travellers', (time_span, trips),
+            lambda: self._gen_trips(time_span, trips), use_random=True
+            )
+
+    def _gen_trips(self, time_span, trips):
 
-    def compute_paths(self):
+        """Generates the trips, with their kinds and travellers"""
 
-        """Computes the shortest paths for the trips"""
+        all_trips = []
+        kinds = []
+        travellers = []
+        # The kinds are generated one by one, in the same order of the random
+        # numbers as all at once
+        for traveller_i, traveller in enumerate(self.travellers):
+            for kind_i, trip in enumerate(trips):
+                new_trips = gen_trips(
+                    time_span, self.places, [trip], traveller
+                    )
+                all_trips.extend(new_trips)
+                kinds.extend([kind_i] * len(new_trips))
+                travellers.extend([traveller_i] * len(new_trips))
+                continue
+            continue
+
+        return all_trips, kinds, travellers
+
+    @timed_stage('paths', lambda self: {'paths': len(self.paths)})
+    def compute_paths(self, compact=False):
+
+        """Computes the shortest paths for the trips
+
+        :param compact: If the paths are going to be stored in a compact
+            :py:class:`paths.PathStore` rather than a list of
+            :py:class:`paths.ShortestPath` instances. The compact storage
+            takes much less memory for large numbers of trips.
+
+        """
 
         if self.trips is None:
             raise ValueError('Trips unavailable for shortest path computing')
 
-        self.paths = [
-            ShortestPath(self.network, trip_i)
-            for trip_i in self.trips
-            ]
+        paths = (
+            ShortestPath(self.network, trip_i, self.landmarks)
+            for trip_i in track(
+                self.trips, self.progress, 'paths', 'trips', len(self.trips)
+                )
+            )
+        self.paths = store_paths(paths) if compact else list(paths)
 
+    @timed_stage('mean_time', lambda self: {'paths': len(self.paths)})
     def compute_mean_time(self):
 
         """Computes the mean travel time for the travellers
@@ -203,6 +462,156 @@ class Model(object):
 
         if self.paths is None:
             raise ValueError('Paths unavailable for mean travel time')
-        return sum(
-            path_i.travel_time() for path_i in self.paths
-            ) / len(self.paths) / self.time_span
+        if isinstance(self.paths, PathStore):
+            total = np.sum(self.paths.total_travel_times())
+        else:
+            total = sum(path_i.travel_time() for path_i in self.paths)
+        return total / len(self.paths) / self.time_span
+
+    @timed_stage('sampled_mean_time', lambda self: {
+        'trips': len(self.trips)
+        })
+    def estimate_mean_time(self, fraction=0.1, zones=4, seed=None):
+
+        """Estimates the mean travel time from a sample of the trips
+
+        The trips are stratified by their kind and the zone of the home of
+        their traveller, and only the trips drawn are routed.
+
+        :param fraction: The fraction of the trips to route in each stratum
+        :param zones: The number of zones of the homes along each direction
+        :param seed: The optional seed for drawing the sample
+        :returns: A pair of the estimate of the mean travel time in one unit
+            of time, and its standard error
+
+        """
+
+        if self.trips is None:
+            raise ValueError('Trips unavailable for mean travel time')
+
+        homes = [
+            self.travellers[i].attrs['home'].node
+            for i in self.trip_travellers
+            ]
+        strata = form_strata(self.network, homes, self.trip_kinds, zones)
+        sample = sample_strata(
+            strata, fraction, np.random.RandomState(seed)
+            )
+
+        times = [
+            ShortestPath(
+                self.network, self.trips[i], self.landmarks
+                ).travel_time()
+            for i in track(
+                sample.tolist(), self.progress, 'sampled paths', 'trips',
+                len(sample)
+                )
+            ]
+        mean, std_err = stratified_mean(times, strata, sample)
+        return mean / self.time_span, std_err / self.time_span
+
+    @timed_stage('matrix', lambda self: {
+        'rows': self.matrix.times.shape[0],
+        'columns': self.matrix.times.shape[1]
+        })
+    def compute_matrix(self, processes=None):
+
+        """Computes the travel time matrix from the homes to other places
+
+        :param processes: The number of processes for computing the rows of
+            the matrix in parallel, serial by default
+
+        """
+
+        if self.places is None:
+            raise ValueError('Places unavailable for travel time matrix')
+
+        self.matrix = form_matrix_from_places(
+            self.network, self.places, processes
+            )
+
+    @timed_stage('matrix_mean_time', lambda self: {
+        'trips': len(self.trips)
+        })
+    def compute_mean_time_by_matrix(self):
+
+        """Computes the mean travel time by looking up the matrix
+
+        The result is the same as :py:meth:`compute_mean_time`, without the
+        shortest paths for the trips formed.
+
+        :returns: The mean travel time for all travellers in one unit of time
+        :raises ValueError: If some legs of the trips are not covered by the
+            matrix
+
+        """
+
+        if self.matrix is None:
+            raise ValueError('Travel time matrix unavailable for mean time')
+        if self.trips is None:
+            raise ValueError('Trips unavailable for mean travel time')
+
+        try:
+            times = self.matrix.trip_times(self.trips)
+        except KeyError:
+            raise ValueError('Trips not covered by the travel time matrix')
+        return np.sum(times) / len(self.trips) / self.time_span
+
+    @timed_stage('expected_mean_time')
+    def compute_expected_mean_time(self, time_span, trips=None, attrs=None,
+                                   processes=None):
+
+        """Computes the exact expected mean travel time
+
+        :param time_span: The time span for the simulation, in weeks
+        :param trips: A list of :py:class:`trips.Trip` objects, the default
+            trip list by default
+        :param attrs: The attributes of the travellers, the default by default
+        :param processes: The number of processes for the Dijkstra searches
+        :returns: The expected mean travel time in one unit of time
+
+        """
+
+        if self.places is None:
+            raise ValueError('Places unavailable for expected mean time')
+
+        return expected_mean_time(
+            self.network, self.places, time_span, trips, attrs, processes
+            )
+
+    @timed_stage('volumes', lambda self: {
+        'edges': len(self.volumes),
+        'traversals': int(self.volumes.sum())
+        })
+    def compute_volumes(self):
+
+        """Computes the traffic volumes on the edges
+
+        Each distinct sequence of nodes of the trips is only routed once, and
+        counted with the number of trips sharing it. The shortest paths already
+        computed are reused when available.
+
+        """
+
+        if self.trips is None:
+            raise ValueError('Trips unavailable for traffic volumes')
+
+        firsts, counts, _ = unique_trips(self.trips)
+        if self.paths is not None:
+            paths = (self.paths[i] for i in firsts)
+        else:
+            paths = (
+                ShortestPath(self.network, self.trips[i], self.landmarks)
+                for i in firsts
+                )
+
+        self.edge_index = form_edge_index(self.network)
+        self.volumes = edge_volumes(
+            self.edge_index, store_paths(paths), counts
+            )
+
+        for (beg, end), volume in zip(
+                self.edge_index.edges.tolist(), self.volumes.tolist()
+                ):
+            self.network[beg][end]['volume'] = volume
+            continue
@@ -14,7 +14,11 @@ Each edge is going to be an undirected edge connecting the nodes. They all have
 got the attribute of ``name`` for the name of the road, and the attribute of
 ``travel_time`` for the time needed to traverse the edge by a common traveller.
 Also there is an attribute ``length`` for the length of the actual road and
-attribute ``highway`` for the type of the road.
+attribute ``highway`` for the type of the road. Since the edges from trimming
+out the pure connection nodes can be joined from roads of different types, the
+length of the road of each type is stored in the attribute ``class_lengths``
+as a dictionary with the types as keys, for recomputing the travel time with
+other speeds, see :py:mod:`speeds`.
 
 The driver function is in
 
@@ -82,6 +86,18 @@ def _calc_distance(coord1, coord2):
     return vincenty(coord1, coord2).miles
 
 
+def _merge_class_lengths(lengths1, lengths2):
+
+    """Merges the lengths of each type of roads of two edges"""
+
+    merged = dict(lengths1)
+    for highway, length in lengths2.iteritems():
+        merged[highway] = merged.get(highway, 0.0) + length
+        continue
+
+    return merged
+
+
 def _test_if_road(way):
 
     """Tests if a raw way is a road to consider"""
@@ -162,7 +178,8 @@ def form_network_from_osm(raw_osm, trim=True):
                 net.add_edge(
                     node_id, prev_node_id,
                     travel_time=travel_time, length=distance,
-                    highway=highway, name=tags.get('name', 'Unamed')
+                    highway=highway, name=tags.get('name', 'Unamed'),
+                    class_lengths={highway: distance}
                     )
 
             prev_node_id = node_id
@@ -200,7 +217,11 @@ def form_network_from_osm(raw_osm, trim=True):
                                 neighb[n2]['travel_time']
                                 ),
                             highway=neighb[n1]['highway'],
-                            name=neighb[n1]['name']
+                            name=neighb[n1]['name'],
+                            class_lengths=_merge_class_lengths(
+                                neighb[n1]['class_lengths'],
+                                neighb[n2]['class_lengths']
+                                )
                             )
                     net.remove_node(node_id)
 
@@ -256,13 +277,16 @@ def edge2str(net, edge):
         )
 
 
-def draw_network(net, out_name):
+def draw_network(net, out_name, width_attr=None):
 
     """Draws the network to a graphics file
 
     The actual drawing is performed by matplotlib interface of the networkX
     library.
 
+    :param width_attr: The name of an optional edge attribute, like
+        ``volume``, to be shown by the widths of the edges
+
     """
 
     import matplotlib.pyplot as plt
@@ -272,7 +296,17 @@ def draw_network(net, out_name):
         for key, data in net.nodes_iter(data=True)
         }
 
-    nx.draw_networkx(net, pos=pos, with_labels=False, node_size=2)
+    if width_attr is None:
+        nx.draw_networkx(net, pos=pos, with_labels=False, node_size=2)
+    else:
+        edges = net.edges(data=True)
+        values = [data.get(width_attr, 0.0) for _, _, data in edges]
+        max_value = max(values + [0.0]) or 1.0
+        nx.draw_networkx(
+            net, pos=pos, with_labels=False, node_size=2,
+            edgelist=[(beg, end) for beg, end, _ in edges],
+            width=[0.5 + 4.5 * value / max_value for value in values]
+            )
     plt.axis('off')
     plt.savefig(out_name)
 
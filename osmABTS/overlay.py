@@ -0,0 +1,247 @@
+"""
+Scenario overlays on the network
+================================
+
+For the what-if analyses, rather than modifying the network in place and
+restoring it afterward, a scenario can be described by a
+:py:class:`NetworkOverlay` on the unchanged base network, holding only the
+closed edges, the edges with changed travel time and the added links. Since
+the base network is never modified, any number of overlays can be used on the
+same network at the same time.
+
+The overlay mimics the read-only part of the interface of the undirected
+networkx graphs, like the ``adj`` attribute, the subscription for the
+neighbours of a node and the ``in`` operator for the nodes, so that it can be
+used by the shortest path functions here and in networkx. The neighbours of
+the few nodes touched by the changes are formed once when the overlay is
+created, and the neighbours of all the other nodes are directly those of the
+base network. For the searches looking up the ``adj`` dictionary directly,
+which are much faster on a plain dictionary, a shallow copy of the adjacency
+of the base network with the changed nodes replaced is formed on the first
+access.
+
+.. autosummary::
+    :toctree: generated
+    :template: classtempl.rstt
+
+    NetworkOverlay
+
+"""
+
+
+class NetworkOverlay(object):
+
+    """Overlays of changes on a base network
+
+    .. py:attribute:: base
+
+        The base network, which is never modified
+
+    .. py:attribute:: closed
+
+        The set of the closed edges, as the node pairs in both orientations
+
+    .. py:attribute:: changed
+
+        The dictionary of the neighbours of the nodes touched by the changes,
+        with the nodes as keys
+
+    """
+
+    __slots__ = [
+        'base',
+        'closed',
+        'changed',
+        '_adj',
+        ]
+
+    def __init__(self, base, closed=(), travel_times=None, added=()):
+
+        """Initializes the overlay
+
+        :param base: The base network
+        :param closed: An iterable of the node pairs of the closed edges
+        :param travel_times: An optional dictionary of the new travel time of
+            the edges, with the node pairs as keys
+        :param added: An iterable of the added links, as triples of the two
+            end nodes and the dictionary of the edge attributes, which needs
+            to contain the travel time. The ends need to be in the base
+            network.
+        :raises ValueError: If an added link is not between base nodes
+
+        """
+
+        self.base = base
+        self.closed = set()
+        self.changed = {}
+        self._adj = None
+
+        def neighbours(node):
+            """Gets the changeable neighbours of a node"""
+            if node not in self.changed:
+                self.changed[node] = dict(base.adj[node])
+            return self.changed[node]
+
+        for beg, end in closed:
+            # Edges given twice, in either orientation, are closed once
+            if not base.has_edge(beg, end) or (beg, end) in self.closed:
+                continue
+            self.closed.add((beg, end))
+            self.closed.add((end, beg))
+            del neighbours(beg)[end]
+            del neighbours(end)[beg]
+            continue
+
+        if travel_times is not None:
+            for (beg, end), travel_time in travel_times.iteritems():
+                if (beg, end) in self.closed or not base.has_edge(beg, end):
+                    continue
+                data = dict(base.adj[beg][end], travel_time=travel_time)
+                neighbours(beg)[end] = data
+                neighbours(end)[beg] = data
+                continue
+
+        for beg, end, data in added:
+            if beg not in base or end not in base:
+                raise ValueError(
+                    'Added link %s-%s not between nodes of the network' % (
+                        beg, end
+                        )
+                    )
+            neighbours(beg)[end] = data
+            neighbours(end)[beg] = data
+            continue
+
+    #
+    # The read-only graph interface
+    #
+
+    @property
+    def adj(self):
+
+        """The adjacency dictionary, formed on the first access"""
+
+        if self._adj is None:
+            self._adj = dict(self.base.adj)
+            self._adj.update(self.changed)
+        return self._adj
+
+    @property
+    def node(self):
+
+        """The node attributes, those of the base network"""
+
+        return self.base.node
+
+    def is_directed(self):
+
+        """The overlay is undirected, as the base network"""
+
+        return False
+
+    def is_multigraph(self):
+
+        """The overlay is not a multigraph, as the base network"""
+
+        return False
+
+    def __getitem__(self, node):
+
+        """Gets the dictionary of the neighbours of a node"""
+
+        try:
+            return self.changed[node]
+        except KeyError:
+            return self.base.adj[node]
+
+    def __contains__(self, node):
+
+        """Tests if a node is in the network"""
+
+        return node in self.base
+
+    def __iter__(self):
+
+        """Iterates over the nodes"""
+
+        return iter(self.base)
+
+    def __len__(self):
+
+        """Gets the number of nodes"""
+
+        return len(self.base)
+
+    def nodes_iter(self, data=False):
+
+        """Iterates over the nodes"""
+
+        return self.base.nodes_iter(data=data)
+
+    def nodes(self, data=False):
+
+        """Gets the list of the nodes"""
+
+        return self.base.nodes(data=data)
+
+    def number_of_nodes(self):
+
+        """Gets the number of nodes"""
+
+        return self.base.number_of_nodes()
+
+    def has_node(self, node):
+
+        """Tests if a node is in the network"""
+
+        return node in self.base
+
+    def neighbors_iter(self, node):
+
+        """Iterates over the neighbours of a node"""
+
+        return iter(self[node])
+
+    def neighbors(self, node):
+
+        """Gets the list of the neighbours of a node"""
+
+        return list(self[node])
+
+    def has_edge(self, beg, end):
+
+        """Tests if an edge is in the network"""
+
+        return beg in self and end in self[beg]
+
+    def edges_iter(self, data=False):
+
+        """Iterates over the edges, each only once"""
+
+        seen = set()
+        for node in self.base:
+            for neighb, edge_data in self[node].iteritems():
+                if neighb in seen:
+                    continue
+                yield (node, neighb, edge_data) if data else (node, neighb)
+                continue
+            seen.add(node)
+            continue
+
+    def edges(self, data=False):
+
+        """Gets the list of the edges"""
+
+        return list(self.edges_iter(data=data))
+
+    def number_of_edges(self):
+
+        """Gets the number of edges"""
+
+        return sum(len(self[node]) for node in self.base) // 2
+
+    def degree(self, node):
+
+        """Gets the degree of a node"""
+
+        return len(self[node])
@@ -13,8 +13,45 @@ convenience functions for getting information about the paths.
     :members:
     :special-members:
 
+For large numbers of trips, the paths can be stored compactly by
+
+.. autoclass:: PathStore
+    :members:
+    :special-members:
+
+.. autoclass:: PathView
+    :members:
+
+.. autofunction:: store_paths
+
+For computations needing the whole shortest-path tree rather than single
+paths, a plain Dijkstra search with multiple sources and early termination
+is also given,
+
+.. autofunction:: dijkstra
+
+For comparing the searches and tuning the caches, the work of the searches can
+be counted into a :py:class:`RoutingStats` when they are run under
+:py:func:`collect_stats`. Without it, the searches are not slowed down at all.
+With it, the shortest paths of the trips are found by a copy of the same
+algorithms as networkx, with the same results, while counting. Only the
+searches in the current process are counted.
+
+.. autoclass:: RoutingStats
+    :members:
+
+.. autofunction:: collect_stats
+
+.. autofunction:: current_stats
+
 """
 
+import heapq
+import array
+import itertools
+import contextlib
+
+import numpy as np
 import networkx as nx
 from networkx.exception import NetworkXNoPath
 
@@ -41,16 +78,25 @@ class ShortestPath(object):
 
     # pylint: disable=too-few-public-methods
 
-    def __init__(self, net, trip):
+    __slots__ = [
+        'nodes',
+        'travel_times',
+        ]
+
+    def __init__(self, net, trip, landmarks=None):
 
         """Initializes a shortest path by giving the trip
 
         :param net: The network on which to find the paths
         :param trip: A list of places that needs to be visited by a trip
+        :param landmarks: The optional :py:class:`landmarks.LandmarkIndex` for
+            the network. When given, the paths are found by the A* search with
+            the landmark lower bounds as the heuristic.
 
         """
 
         self.nodes = []
+        stats = _STATS
 
         # find the shortest path
         for beg, end in pairwise(trip):
@@ -59,13 +105,28 @@ class ShortestPath(object):
             end_node = end.node
 
             try:
-                self.nodes.extend(
-                    nx.shortest_path(
-                        net, source=beg_node, target=end_node,
-                        weight='travel_time'
+                if stats is not None:
+                    self.nodes.extend(_counted_path(
+                        net, beg_node, end_node, landmarks, stats
+                        ))
+                elif landmarks is None:
+                    self.nodes.extend(
+                        nx.shortest_path(
+                            net, source=beg_node, target=end_node,
+                            weight='travel_time'
+                            )
+                        )
+                else:
+                    self.nodes.extend(
+                        nx.astar_path(
+                            net, beg_node, end_node,
+                            heuristic=landmarks.heuristic_to(end_node),
+                            weight='travel_time'
+                            )
                         )
-                    )
             except NetworkXNoPath:
+                if stats is not None:
+                    stats.unreachable += 1
                 break
                 # hack: just take the part of the path that is reachable
 
@@ -84,3 +145,444 @@ class ShortestPath(object):
         """Returns the total travel time of the shortest path"""
 
         return sum(self.travel_times)
+
+
+#
+# Compact storage of paths
+# ------------------------
+#
+# The node sequences of all the paths are concatenated into a single integer
+# array, with an offsets array giving the beginning of each path, as in the
+# compressed sparse row layout. The same is done for the travel times of the
+# edges. Views of individual paths are created lazily on access.
+#
+
+class PathStore(object):
+
+    """Compact storage for a list of shortest paths
+
+    It can be used in place of a list of :py:class:`ShortestPath` instances,
+    supporting the length, indexing and iteration, which gives
+    :py:class:`PathView` instances for the individual paths.
+
+    .. py:attribute:: nodes
+
+        The concatenated array of the nodes of all the paths
+
+    .. py:attribute:: node_offsets
+
+        The array of the offsets of the nodes for the paths, with the extra
+        last entry for the total length
+
+    .. py:attribute:: travel_times
+
+        The concatenated array of the travel times of the edges of all the
+        paths
+
+    .. py:attribute:: time_offsets
+
+        The array of the offsets of the travel times for the paths
+
+    """
+
+    __slots__ = [
+        'nodes',
+        'node_offsets',
+        'travel_times',
+        'time_offsets',
+        ]
+
+    def __init__(self, nodes, node_offsets, travel_times, time_offsets):
+
+        """Initializes the store with the arrays"""
+
+        self.nodes = nodes
+        self.node_offsets = node_offsets
+        self.travel_times = travel_times
+        self.time_offsets = time_offsets
+
+    def __len__(self):
+
+        """Gets the number of paths"""
+
+        return len(self.node_offsets) - 1
+
+    def __getitem__(self, idx):
+
+        """Gets the view of a path"""
+
+        if idx < 0:
+            idx += len(self)
+        if idx < 0 or idx >= len(self):
+            raise IndexError('Path index out of range')
+        return PathView(self, idx)
+
+    def __iter__(self):
+
+        """Iterates over the views of the paths"""
+
+        for idx in xrange(0, len(self)):
+            yield PathView(self, idx)
+
+    def path_ids(self):
+
+        """Gets the index of the path for each of the travel times"""
+
+        return np.repeat(
+            np.arange(len(self), dtype=np.int64),
+            np.diff(self.time_offsets)
+            )
+
+    def total_travel_times(self):
+
+        """Gets the array of the total travel time of all the paths"""
+
+        return np.bincount(
+            self.path_ids(), weights=self.travel_times, minlength=len(self)
+            )
+
+
+class PathView(object):
+
+    """View of a single path in a :py:class:`PathStore`
+
+    It has got the same interface as :py:class:`ShortestPath`, with the
+    attributes giving array views into the store.
+
+    """
+
+    # pylint: disable=too-few-public-methods
+
+    __slots__ = [
+        'store',
+        'idx',
+        ]
+
+    def __init__(self, store, idx):
+
+        """Initializes the view for a path in the store"""
+
+        self.store = store
+        self.idx = idx
+
+    @property
+    def nodes(self):
+
+        """The array of the nodes of the path"""
+
+        offsets = self.store.node_offsets
+        return self.store.nodes[offsets[self.idx]:offsets[self.idx + 1]]
+
+    @property
+    def travel_times(self):
+
+        """The array of the travel times for the edges"""
+
+        offsets = self.store.time_offsets
+        return self.store.travel_times[offsets[self.idx]:offsets[self.idx + 1]]
+
+    def travel_time(self):
+
+        """Returns the total travel time of the path"""
+
+        return float(np.sum(self.travel_times))
+
+
+def store_paths(paths):
+
+    """Stores paths in a compact :py:class:`PathStore`
+
+    :param paths: An iterable of :py:class:`ShortestPath` instances or other
+        objects with the same interface. It is only iterated once, so that the
+        paths can be generated lazily without being kept in memory.
+    :returns: The :py:class:`PathStore` instance
+
+    """
+
+    nodes = array.array('l')
+    node_offsets = [0]
+    travel_times = array.array('d')
+    time_offsets = [0]
+
+    for path in paths:
+        nodes.extend(path.nodes)
+        node_offsets.append(len(nodes))
+        travel_times.extend(path.travel_times)
+        time_offsets.append(len(travel_times))
+        continue
+
+    return PathStore(
+        np.array(nodes, dtype=np.int64),
+        np.array(node_offsets, dtype=np.int64),
+        np.array(travel_times, dtype=np.float64),
+        np.array(time_offsets, dtype=np.int64)
+        )
+
+
+def dijkstra(net, sources, targets=None, weight='travel_time'):
+
+    """Dijkstra search from multiple sources
+
+    All the sources start with zero distance, so that the distance of a node
+    is the travel time from the nearest source. When the targets are given,
+    the search is terminated as soon as all of them are settled.
+
+    :param net: The network to search
+    :param sources: An iterable of the source nodes
+    :param targets: An optional iterable of the target nodes
+    :param weight: The edge attribute for the weight
+    :returns: A pair of dictionaries, the first one is the distance of the
+        settled nodes, and the second is the predecessor of the nodes in the
+        shortest-path tree, with None for the sources. Nodes not reached are
+        absent from both.
+
+    """
+
+    stats = _STATS
+    heappop = heapq.heappop
+    adj = net.adj
+    if stats is None:
+        heappush = heapq.heappush
+    else:
+        stats.queries += 1
+
+        def heappush(heap, item):
+            """Pushes to the heap, counted"""
+            stats.pushes += 1
+            heapq.heappush(heap, item)
+
+    dist = {}
+    seen = {}
+    pred = {}
+    heap = []
+    for source in sources:
+        seen[source] = 0.0
+        pred[source] = None
+        heap.append((0.0, source))
+    heapq.heapify(heap)
+    if stats is not None:
+        stats.pushes += len(heap)
+
+    last = None
+    remaining = None if targets is None else set(targets)
+    if remaining is not None and len(remaining) == 0:
+        return dist, pred
+
+    while heap:
+        curr_dist, curr = heappop(heap)
+        if curr in dist:
+            continue
+        dist[curr] = curr_dist
+
+        if remaining is not None:
+            remaining.discard(curr)
+            if len(remaining) == 0:
+                last = curr
+                break
+
+        for node, data in adj[curr].iteritems():
+            if node in dist:
+                continue
+            new_dist = curr_dist + data[weight]
+            if node not in seen or new_dist < seen[node]:
+                seen[node] = new_dist
+                pred[node] = curr
+                heappush(heap, (new_dist, node))
+            continue
+
+    # Tentative predecessors of unsettled nodes are not reported
+    if len(pred) != len(dist):
+        pred = {node: pred[node] for node in dist}
+
+    if stats is not None:
+        # All the settled nodes are expanded, except the last target
+        stats.settled += len(dist)
+        stats.relaxed += sum(len(adj[node]) for node in dist)
+        if last is not None:
+            stats.relaxed -= len(adj[last])
+
+    return dist, pred
+
+
+#
+# Routing statistics
+# ------------------
+#
+# The counters are kept in a module-level slot, set only under
+# collect_stats, so that the searches only need a single check of it for
+# each search when they are not counted.
+#
+
+class RoutingStats(object):
+
+    """Counters of the work of the shortest-path searches
+
+    .. py:attribute:: queries
+
+        The number of searches, one for each leg of the trips routed
+
+    .. py:attribute:: settled
+
+        The number of nodes settled by the searches
+
+    .. py:attribute:: relaxed
+
+        The number of edges relaxed from the settled nodes
+
+    .. py:attribute:: pushes
+
+        The number of pushes to the heaps of the searches
+
+    .. py:attribute:: cache_hits
+
+        The number of shortest-path trees found in caches
+
+    .. py:attribute:: cache_misses
+
+        The number of shortest-path trees not found in caches
+
+    .. py:attribute:: unreachable
+
+        The number of legs of trips with the destination unreachable
+
+    """
+
+    __slots__ = [
+        'queries',
+        'settled',
+        'relaxed',
+        'pushes',
+        'cache_hits',
+        'cache_misses',
+        'unreachable',
+        ]
+
+    def __init__(self):
+
+        """Initializes all the counters to zero"""
+
+        for i in self.__slots__:
+            setattr(self, i, 0)
+            continue
+
+    def add(self, other):
+
+        """Adds the counters of another instance to this one"""
+
+        for i in self.__slots__:
+            setattr(self, i, getattr(self, i) + getattr(other, i))
+            continue
+
+    def as_dict(self):
+
+        """Gets the counters as a dictionary"""
+
+        return {i: getattr(self, i) for i in self.__slots__}
+
+
+_STATS = None
+
+
+@contextlib.contextmanager
+def collect_stats(stats):
+
+    """Counts the searches in the body of a ``with`` statement
+
+    The counters in effect before are restored afterward, so the searches in
+    nested bodies are only counted in the innermost one.
+
+    :param stats: The :py:class:`RoutingStats` to count into, or None for not
+        counting the searches
+
+    """
+
+    global _STATS  # pylint: disable=global-statement
+
+    prev = _STATS
+    _STATS = stats
+    try:
+        yield stats
+    finally:
+        _STATS = prev
+
+
+def current_stats():
+
+    """Gets the :py:class:`RoutingStats` counting the searches, or None"""
+
+    return _STATS
+
+
+def _counted_path(net, source, target, landmarks, stats):
+
+    """Finds the shortest path for a leg of a trip, counting the search
+
+    The search is the same as ``nx.dijkstra_path``, or ``nx.astar_path`` with
+    the landmarks, including the order of the ties, so that the paths are the
+    same as those found without counting.
+
+    :raises NetworkXNoPath: If the target is not reachable
+
+    """
+
+    stats.queries += 1
+    heappush = heapq.heappush
+    heappop = heapq.heappop
+    adj = net.adj
+    counter = itertools.count()
+    if landmarks is not None:
+        heuristic = landmarks.heuristic_to(target)
+
+    # The entries are the priority, tie breaker, node, distance and parent
+    heap = [(0, next(counter), source, 0, None)]
+    pushes = 1
+    relaxed = 0
+    settled = {}
+    seen = {}
+    found = False
+    while heap:
+        _, _, curr, curr_dist, parent = heappop(heap)
+        if curr in settled:
+            continue
+        settled[curr] = parent
+        if curr == target:
+            found = True
+            break
+
+        for node, data in adj[curr].iteritems():
+            relaxed += 1
+            if node in settled:
+                continue
+            new_dist = curr_dist + data.get('travel_time', 1)
+            if landmarks is None:
+                if node in seen and new_dist >= seen[node]:
+                    continue
+                seen[node] = new_dist
+                priority = new_dist
+            else:
+                if node in seen:
+                    old_dist, estimate = seen[node]
+                    if old_dist <= new_dist:
+                        continue
+                else:
+                    estimate = heuristic(node, target)
+                seen[node] = new_dist, estimate
+                priority = new_dist + estimate
+            heappush(heap, (priority, next(counter), node, new_dist, curr))
+            pushes += 1
+            continue
+
+    stats.settled += len(settled)
+    stats.relaxed += relaxed
+    stats.pushes += pushes
+    if not found:
+        raise NetworkXNoPath(
+            'Node %s not reachable from %s' % (target, source)
+            )
+
+    path = [target]
+    while settled[path[-1]] is not None:
+        path.append(settled[path[-1]])
+        continue
+    path.reverse()
+    return path
@@ -0,0 +1,148 @@
+"""
+Progress reporting
+==================
+
+The long loops, like the routing of the trips in
+:py:meth:`model.Model.compute_paths` and the tests of the edges in
+:py:func:`simultime.test_sensitivity_edges`, report their progress to an
+optional callback, given as the ``progress`` attribute of the model. Any
+callable can be used, it is called as
+
+.. code-block:: python
+
+    progress(task, unit, done, total)
+
+with the name of the loop, the name of the items, like ``'trips'`` or
+``'edges'``, the number of the items done and the total number of the items,
+first with zero items done before the loop, and last with all the items done.
+So it can be forwarded to any logging facility.
+
+A :py:class:`ConsoleProgress` prints the number of the items done, the
+throughput and the estimated time left, at most once in a given interval, so
+that it is cheap enough to be left on for long runs.
+
+.. autosummary::
+    :toctree: generated
+    :template: classtempl.rstt
+
+    ConsoleProgress
+
+.. autosummary::
+    :toctree: generated
+
+    track
+
+"""
+
+from __future__ import print_function
+
+import sys
+import time
+
+
+class ConsoleProgress(object):
+
+    """Rate-limited progress reporter printing to a file
+
+    .. py:attribute:: out
+
+        The file to print to
+
+    .. py:attribute:: interval
+
+        The minimum time between two lines for a task, in seconds
+
+    """
+
+    __slots__ = [
+        'out',
+        'interval',
+        '_starts',
+        '_last',
+        ]
+
+    def __init__(self, out=None, interval=5.0):
+
+        """Initializes the reporter, printing to standard error by default"""
+
+        self.out = out if out is not None else sys.stderr
+        self.interval = interval
+        self._starts = {}
+        self._last = {}
+
+    def __call__(self, task, unit, done, total):
+
+        """Reports the progress of a task"""
+
+        now = time.time()
+        finished = done >= total
+        if task not in self._starts:
+            self._starts[task] = now
+            self._last[task] = now
+            if not finished:
+                return None
+        elif not finished and now - self._last[task] < self.interval:
+            return None
+        self._last[task] = now
+
+        elapsed = now - self._starts[task]
+        rate = done / elapsed if elapsed > 0.0 else float('inf')
+        if finished:
+            eta = 'done in %s' % _format_seconds(elapsed)
+            del self._starts[task]
+            del self._last[task]
+        elif done > 0:
+            eta = 'ETA %s' % _format_seconds((total - done) / rate)
+        else:
+            eta = 'ETA unknown'
+
+        print(' %s: %d / %d %s, %.1f %s/s, %s' % (
+            task, done, total, unit, rate, unit, eta
+            ), file=self.out)
+        self.out.flush()
+
+        return None
+
+
+def track(iterable, progress, task, unit, total):
+
+    """Iterates over items with the progress reported
+
+    :param iterable: The iterable of the items
+    :param progress: The progress callback, or None for no report
+    :param task: The name of the task
+    :param unit: The name of the items
+    :param total: The total number of the items
+    :returns: An iterator over the items
+
+    """
+
+    if progress is None:
+        return iter(iterable)
+    return _track(iterable, progress, task, unit, total)
+
+
+def _track(iterable, progress, task, unit, total):
+
+    """Iterates over items, reporting the progress after each of them"""
+
+    progress(task, unit, 0, total)
+    done = 0
+    for item in iterable:
+        yield item
+        done += 1
+        progress(task, unit, done, total)
+        continue
+
+    return
+
+
+def _format_seconds(seconds):
+
+    """Formats a number of seconds as hours, minutes and seconds"""
+
+    if seconds == float('inf'):
+        return 'unknown'
+    minutes, seconds = divmod(int(round(seconds)), 60)
+    hours, minutes = divmod(minutes, 60)
+    return '%d:%02d:%02d' % (hours, minutes, seconds)
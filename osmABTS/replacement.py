@@ -0,0 +1,383 @@
+"""
+Replacement paths for single edge failures
+==========================================
+
+For a shortest path :math:`P = (v_0, \\ldots, v_k)` from the source
+:math:`s = v_0` to the target :math:`t = v_k` in an undirected network with
+positive weights, the travel time of the best detour when each edge
+:math:`e_j = (v_j, v_{j + 1})` of the path is removed can be computed from
+just the two shortest-path trees rooted at :math:`s` and :math:`t`, rather
+than a search for each of the edges.
+
+Each node :math:`x` gets the label :math:`l(x)`, the index of the last node of
+:math:`P` on its path in the tree from :math:`s`. The path to :math:`x` in
+the tree avoids :math:`e_j` exactly when :math:`l(x) \\leq j`, and for the
+other nodes, all the shortest paths to :math:`t` avoid :math:`e_j`. So the
+replacement path for :math:`e_j` has got the travel time
+
+.. math::
+
+    \\min_{(x, y) \\neq e_j, l(x) \\leq j < l(y)} d(s, x) + w(x, y) + d(y, t)
+
+which is computed for all the edges of the path at once by sorting the
+candidate edges by their costs and assigning each of them to the range of path
+edges not yet covered.
+
+.. autosummary::
+    :toctree: generated
+    :template: classtempl.rstt
+
+    ReplacementEngine
+
+.. autosummary::
+    :toctree: generated
+
+    replacement_paths
+    edge_total_deltas
+
+"""
+
+import collections
+
+import numpy as np
+
+from .paths import dijkstra, current_stats
+from .traffic import form_edge_index
+from .util import pairwise
+
+
+class ReplacementEngine(object):
+
+    """Engine for the replacement paths on a network
+
+    The shortest-path trees of the nodes are cached, since the same node is
+    usually the source or the target of many paths.
+
+    .. py:attribute:: net
+
+        The network
+
+    .. py:attribute:: index
+
+        The :py:class:`traffic.EdgeIndex` for the network
+
+    .. py:attribute:: ends
+
+        The two-column array of the positions of the end nodes of the edges
+
+    .. py:attribute:: weights
+
+        The array of the travel times of the edges
+
+    """
+
+    __slots__ = [
+        'net',
+        'index',
+        'ends',
+        'weights',
+        'cache_size',
+        '_trees',
+        ]
+
+    def __init__(self, net, index=None, cache_size=64):
+
+        """Initializes the engine
+
+        :param net: The network
+        :param index: The optional :py:class:`traffic.EdgeIndex` for the
+            network, formed when not given
+        :param cache_size: The number of shortest-path trees to cache
+
+        """
+
+        self.net = net
+        self.index = index if index is not None else form_edge_index(net)
+        self.ends = np.searchsorted(self.index.nodes, self.index.edges)
+        self.weights = np.array([
+            net[beg][end]['travel_time']
+            for beg, end in self.index.edges.tolist()
+            ], dtype=np.float64)
+        self.cache_size = cache_size
+        self._trees = collections.OrderedDict()
+
+    def tree(self, root):
+
+        """Gets the shortest-path tree rooted at a node
+
+        :returns: A pair of arrays over the node positions, the travel time
+            from the root, infinite for unreachable nodes, and the position of
+            the predecessor, -1 for the root and unreachable nodes
+
+        """
+
+        stats = current_stats()
+        try:
+            tree = self._trees.pop(root)
+        except KeyError:
+            if stats is not None:
+                stats.cache_misses += 1
+            nodes = self.index.nodes
+            dist, pred = dijkstra(self.net, [root])
+
+            dists = np.empty(len(nodes), dtype=np.float64)
+            dists.fill(np.inf)
+            dists[np.searchsorted(nodes, dist.keys())] = dist.values()
+
+            preds = np.empty(len(nodes), dtype=np.int64)
+            preds.fill(-1)
+            children = [i for i in pred.iterkeys() if pred[i] is not None]
+            preds[np.searchsorted(nodes, children)] = np.searchsorted(
+                nodes, [pred[i] for i in children]
+                )
+
+            tree = (dists, preds)
+            if len(self._trees) >= self.cache_size:
+                self._trees.popitem(last=False)
+        else:
+            if stats is not None:
+                stats.cache_hits += 1
+
+        self._trees[root] = tree
+        return tree
+
+    def replacement_costs(self, source, target):
+
+        """Computes the replacement path costs for a shortest path
+
+        :param source: The source node
+        :param target: The target node
+        :returns: A triple of the array of the edge identities along the
+            shortest path, the travel time of the shortest path, and the array
+            of the travel time of the replacement paths when each of the edges
+            is removed. The travel time is infinite for unreachable targets,
+            for which the path is empty.
+
+        """
+
+        src_dists, src_preds = self.tree(source)
+        tgt_dists, _ = self.tree(target)
+        nodes = self.index.nodes
+
+        tgt_pos = np.searchsorted(nodes, target)
+        base = src_dists[tgt_pos]
+        if np.isinf(base) or source == target:
+            return (
+                np.array([], dtype=np.int64), base,
+                np.array([], dtype=np.float64)
+                )
+
+        # The path, as node positions from the source
+        path = [tgt_pos]
+        while src_preds[path[-1]] >= 0:
+            path.append(src_preds[path[-1]])
+        path.reverse()
+        path = np.array(path, dtype=np.int64)
+        n_edges = len(path) - 1
+
+        path_ids = self.index.edge_ids(nodes[path[:-1]], nodes[path[1:]])
+        labels = _label_tree(src_preds, path)
+
+        # The candidate edges in both orientations
+        costs = np.empty(n_edges, dtype=np.float64)
+        costs.fill(np.inf)
+        on_path = np.zeros(len(self.weights), dtype=np.bool_)
+        on_path[path_ids] = True
+
+        lows = []
+        highs = []
+        values = []
+        for beg_col, end_col in [(0, 1), (1, 0)]:
+            beg = self.ends[:, beg_col]
+            end = self.ends[:, end_col]
+            valid = (
+                (labels[beg] >= 0) & (labels[beg] < labels[end]) & ~on_path
+                )
+            lows.append(labels[beg][valid])
+            highs.append(labels[end][valid])
+            values.append(
+                src_dists[beg][valid] + self.weights[valid] +
+                tgt_dists[end][valid]
+                )
+            continue
+
+        lows = np.concatenate(lows)
+        highs = np.concatenate(highs)
+        values = np.concatenate(values)
+        order = np.argsort(values, kind='mergesort')
+
+        _fill_ranges(
+            costs, lows[order].tolist(), highs[order].tolist(),
+            values[order].tolist()
+            )
+
+        return path_ids, base, costs
+
+
+def _label_tree(preds, path):
+
+    """Labels the nodes by the last path node on their tree paths
+
+    The labels are propagated from the path nodes down the tree by pointer
+    jumping. Nodes not reachable get the label -1.
+
+    """
+
+    labels = np.empty(len(preds), dtype=np.int64)
+    labels.fill(-1)
+    labels[path] = np.arange(len(path))
+
+    ancestors = preds.copy()
+    while True:
+        pending = (labels < 0) & (ancestors >= 0)
+        if not np.any(pending):
+            break
+        labels[pending] = labels[ancestors[pending]]
+        pending &= labels < 0
+        ancestors[pending] = ancestors[ancestors[pending]]
+        continue
+
+    return labels
+
+
+def _fill_ranges(costs, lows, highs, values):
+
+    """Fills in the minimum values for the ranges of path edges
+
+    The candidates should be sorted by the values. The candidate from the
+    label ``low`` to ``high`` covers the path edges from ``low`` to
+    ``high - 1``. A disjoint set forest is used for skipping the edges already
+    filled.
+
+    """
+
+    n_edges = len(costs)
+    # The next edge not filled yet, at or after each edge
+    next_free = range(0, n_edges + 1)
+
+    def find(idx):
+        """Finds the next free edge with path compression"""
+        root = idx
+        while next_free[root] != root:
+            root = next_free[root]
+        while next_free[idx] != root:
+            next_free[idx], idx = root, next_free[idx]
+        return root
+
+    n_filled = 0
+    for low, high, value in zip(lows, highs, values):
+        idx = find(low)
+        while idx < high:
+            costs[idx] = value
+            n_filled += 1
+            next_free[idx] = idx + 1
+            idx = find(idx + 1)
+        if n_filled == n_edges:
+            break
+        continue
+
+    return None
+
+
+def replacement_paths(net, source, target):
+
+    """Computes the replacement paths for the shortest path between nodes
+
+    :param net: The network
+    :param source: The source node
+    :param target: The target node
+    :returns: A triple of the list of the node pairs of the edges on the
+        shortest path, its travel time, and the list of the travel time when
+        each of the edges is removed
+
+    """
+
+    engine = ReplacementEngine(net)
+    path_ids, base, costs = engine.replacement_costs(source, target)
+    return (
+        [tuple(i) for i in engine.index.edges[path_ids].tolist()],
+        float(base), costs.tolist()
+        )
+
+
+#
+# Edge sensitivity
+# ----------------
+#
+# For the distinct trips of a :py:class:`routing.RoutingBase`, the replacement
+# costs of each of the legs give the new travel time of the trip for each edge
+# on the paths. As for the shortest paths, the travel time of a trip only
+# counts the legs before the first unreachable one. Since the network is
+# undirected, a leg and its reverse share the same replacement costs.
+#
+
+def edge_total_deltas(base, engine=None):
+
+    """Computes the changes in total travel time for removing each edge
+
+    :param base: The :py:class:`routing.RoutingBase` of the model
+    :param engine: The optional :py:class:`ReplacementEngine`, formed on the
+        network of the model when not given
+    :returns: The array of the changes of the total travel time of all the
+        trips, in the order of the edge identities of the base
+
+    """
+
+    if engine is None:
+        engine = ReplacementEngine(base.model.network, base.edge_index)
+
+    trip_legs = [
+        [leg for leg in pairwise(place.node for place in trip)]
+        for trip in base.trips
+        ]
+    leg_keys = sorted(set(
+        (min(leg), max(leg)) for legs in trip_legs for leg in legs
+        ))
+    replacements = {}
+    for key in leg_keys:
+        path_ids, cost, costs = engine.replacement_costs(*key)
+        replacements[key] = (
+            float(cost), dict(zip(path_ids.tolist(), costs.tolist()))
+            )
+        continue
+
+    deltas = np.zeros(len(engine.index), dtype=np.float64)
+
+    for legs, count in zip(trip_legs, base.counts.tolist()):
+        legs = [replacements[(min(leg), max(leg))] for leg in legs]
+        base_costs = [cost for cost, _ in legs]
+        base_time = _truncated_sum(base_costs)
+
+        edge_ids = set()
+        for cost, leg_costs in legs:
+            if np.isinf(cost):
+                break
+            edge_ids.update(leg_costs.iterkeys())
+            continue
+
+        for edge_id in edge_ids:
+            new_costs = [
+                leg_costs.get(edge_id, cost) for cost, leg_costs in legs
+                ]
+            deltas[edge_id] += count * (
+                _truncated_sum(new_costs) - base_time
+                )
+            continue
+
+        continue
+
+    return deltas
+
+
+def _truncated_sum(costs):
+
+    """Sums the travel times of the legs before the first unreachable one"""
+
+    total = 0.0
+    for cost in costs:
+        if np.isinf(cost):
+            break
+        total += cost
+        continue
+
+    return total
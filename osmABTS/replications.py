@@ -0,0 +1,229 @@
+"""
+Monte Carlo replications
+========================
+
+The mean travel time from a single simulation depends on the random selection
+of the places for the travellers and the random frequencies of their trips.
+For an estimate with a known precision, the travellers and trips are generated
+again for independent replications, each with its own seed derived from a base
+seed, and the mean travel time is reported with the confidence interval from
+the Student t distribution of the replication means.
+
+The replications can be stopped automatically as soon as the half width of the
+confidence interval is within a target fraction of the mean, so that the
+number of replications is just what the precision requires.
+
+The network and places of the model are shared by all the replications, and
+the travel time matrix of the model is used for the replications when it is
+available. The travellers and trips of the model are those of the last
+replication afterward.
+
+.. autosummary::
+    :toctree: generated
+    :template: classtempl.rstt
+
+    Replications
+
+.. autosummary::
+    :toctree: generated
+
+    run_replication
+    run_replications
+
+"""
+
+import math
+
+
+class Replications(object):
+
+    """The results of Monte Carlo replications
+
+    .. py:attribute:: mean_times
+
+        The list of the mean travel time of each replication
+
+    .. py:attribute:: confidence
+
+        The confidence level of the interval
+
+    """
+
+    __slots__ = [
+        'mean_times',
+        'confidence',
+        ]
+
+    def __init__(self, confidence=0.95):
+
+        """Initializes the results with no replication"""
+
+        self.mean_times = []
+        self.confidence = confidence
+
+    def add(self, mean_time):
+
+        """Adds the mean travel time of a replication"""
+
+        self.mean_times.append(mean_time)
+
+    def __len__(self):
+
+        """Gets the number of replications"""
+
+        return len(self.mean_times)
+
+    def mean(self):
+
+        """Gets the mean of the replications"""
+
+        return sum(self.mean_times) / len(self.mean_times)
+
+    def std_err(self):
+
+        """Gets the standard error of the mean, infinite for one replication"""
+
+        number = len(self.mean_times)
+        if number < 2:
+            return float('inf')
+        mean = self.mean()
+        var = sum((i - mean) ** 2 for i in self.mean_times) / (number - 1)
+        return math.sqrt(var / number)
+
+    def half_width(self):
+
+        """Gets the half width of the confidence interval"""
+
+        number = len(self.mean_times)
+        if number < 2:
+            return float('inf')
+        return (
+            _t_quantile(0.5 + self.confidence / 2.0, number - 1) *
+            self.std_err()
+            )
+
+    def interval(self):
+
+        """Gets the confidence interval as a pair"""
+
+        mean = self.mean()
+        half_width = self.half_width()
+        return mean - half_width, mean + half_width
+
+    def rel_precision(self):
+
+        """Gets the half width of the interval relative to the mean"""
+
+        return self.half_width() / abs(self.mean())
+
+
+def run_replication(model, seed, n_travellers, time_span, trips=None):
+
+    """Runs a single replication on the model
+
+    :param model: The model, with the network and places formed
+    :param seed: The seed for the replication
+    :param n_travellers: The number of travellers
+    :param time_span: The time span, in weeks
+    :param trips: The list of :py:class:`trips.Trip`, the default by default
+    :returns: The mean travel time of the replication
+
+    """
+
+    model.seed_random(seed)
+    model.form_travellers(n_travellers)
+    model.gen_trips(time_span, trips)
+
+    if model.matrix is not None:
+        return model.compute_mean_time_by_matrix()
+
+    model.compute_paths()
+    return model.compute_mean_time()
+
+
+def run_replications(model, n_travellers, time_span, trips=None, seed=0,
+                     rel_precision=None, confidence=0.95, min_reps=5,
+                     max_reps=100, callback=None):
+
+    """Runs Monte Carlo replications until the target precision
+
+    The replication ``i`` is seeded by ``seed + i``.
+
+    :param model: The model, with the network and places formed
+    :param n_travellers: The number of travellers in each replication
+    :param time_span: The time span of each replication, in weeks
+    :param trips: The list of :py:class:`trips.Trip`, the default by default
+    :param seed: The base seed
+    :param rel_precision: The target half width of the confidence interval
+        relative to the mean, all the ``max_reps`` replications are run when
+        not given
+    :param confidence: The confidence level of the interval
+    :param min_reps: The minimum number of replications before stopping
+    :param max_reps: The maximum number of replications
+    :param callback: An optional function called with the results after each
+        replication
+    :returns: The :py:class:`Replications` instance
+
+    """
+
+    results = Replications(confidence)
+
+    for i in xrange(0, max_reps):
+        results.add(run_replication(
+            model, seed + i, n_travellers, time_span, trips
+            ))
+        if callback is not None:
+            callback(results)
+        if (rel_precision is not None and len(results) >= max(min_reps, 2)
+                and results.rel_precision() <= rel_precision):
+            break
+        continue
+
+    return results
+
+
+#
+# Student t quantiles
+# -------------------
+#
+# The quantiles are exact for one and two degrees of freedom, and from the
+# Cornish-Fisher expansion around the normal quantile for more, which is
+# accurate to about three significant figures already for three degrees of
+# freedom. The normal quantile is found by bisection on the error function.
+#
+
+def _normal_quantile(prob):
+
+    """Computes the quantile of the standard normal distribution"""
+
+    low, high = -40.0, 40.0
+    for _ in xrange(0, 100):
+        mid = (low + high) / 2.0
+        if 0.5 * (1.0 + math.erf(mid / math.sqrt(2.0))) < prob:
+            low = mid
+        else:
+            high = mid
+        continue
+
+    return (low + high) / 2.0
+
+
+def _t_quantile(prob, dof):
+
+    """Computes the quantile of the Student t distribution"""
+
+    if dof == 1:
+        return math.tan(math.pi * (prob - 0.5))
+    elif dof == 2:
+        return (2.0 * prob - 1.0) / math.sqrt(2.0 * prob * (1.0 - prob))
+
+    z = _normal_quantile(prob)
+    return (
+        z +
+        (z ** 3 + z) / (4.0 * dof) +
+        (5.0 * z ** 5 + 16.0 * z ** 3 + 3.0 * z) / (96.0 * dof ** 2) +
+        (3.0 * z ** 7 + 19.0 * z ** 5 + 17.0 * z ** 3 - 15.0 * z) /
+        (384.0 * dof ** 3) +
+        (79.0 * z ** 9 + 776.0 * z ** 7 + 1482.0 * z ** 5 -
+         1920.0 * z ** 3 - 945.0 * z) / (92160.0 * dof ** 4)
+        )
@@ -0,0 +1,304 @@
+"""
+Base routing state for what-if analyses
+=======================================
+
+For the analysis of the changes in the mean travel time when some edges of
+the network are removed, most of the trips are not affected at all, since
+removing an edge only changes the trips whose shortest paths traverse it. So
+the base routing state of a model is kept here, with each distinct node
+sequence of the trips routed only once, and an inverted index from the edges
+to the distinct trips traversing them. For any set of removed edges, only the
+affected trips need to be routed again, on a
+:py:class:`overlay.NetworkOverlay` with the edges closed, so that the network
+of the model is never modified.
+
+When only the edges with the largest changes are of interest, upper bounds of
+the changes can be obtained cheaply. Since a detour around a removed edge is
+always available for each traversal of it, unless it is a bridge, the change
+is bounded by the number of traversals times the extra time of the shortest
+detour between its two ends. The edges are then evaluated exactly in the
+order of decreasing bounds, until the bounds of the remaining edges fall below
+the changes already found.
+
+.. autosummary::
+    :toctree: generated
+    :template: classtempl.rstt
+
+    RoutingBase
+
+"""
+
+import heapq
+
+import numpy as np
+
+from .paths import ShortestPath, store_paths, dijkstra
+from .trips import unique_trips
+from .traffic import form_edge_index, path_edge_ids
+from .overlay import NetworkOverlay
+
+
+class RoutingBase(object):
+
+    """The base routing state of a model
+
+    .. py:attribute:: model
+
+        The model, whose network is used for the routing
+
+    .. py:attribute:: trips
+
+        The list of the trips with distinct node sequences
+
+    .. py:attribute:: counts
+
+        The array of the number of trips sharing each of the distinct trips
+
+    .. py:attribute:: paths
+
+        The :py:class:`paths.PathStore` of the base shortest paths of the
+        distinct trips
+
+    .. py:attribute:: times
+
+        The array of the base travel times of the distinct trips
+
+    .. py:attribute:: edge_index
+
+        The :py:class:`traffic.EdgeIndex` of the network
+
+    .. py:attribute:: edge_offsets
+
+        The offsets into :py:attr:`edge_trips` for each of the edge identities
+
+    .. py:attribute:: edge_trips
+
+        The concatenated arrays of the distinct trips traversing each of the
+        edges
+
+    .. py:attribute:: total
+
+        The total travel time of all the trips
+
+    .. py:attribute:: norm
+
+        The normalization of the total travel time into the mean travel time,
+        the number of trips times the time span
+
+    """
+
+    __slots__ = [
+        'model',
+        'trips',
+        'counts',
+        'paths',
+        'times',
+        'edge_index',
+        'edge_offsets',
+        'edge_trips',
+        'total',
+        'norm',
+        ]
+
+    def __init__(self, model):
+
+        """Initializes the base state for a model
+
+        The trips need to be already generated for the model. Shortest paths
+        already computed for the model are reused.
+
+        """
+
+        if model.trips is None:
+            raise ValueError('Trips unavailable for the base routing state')
+
+        self.model = model
+
+        firsts, self.counts, _ = unique_trips(model.trips)
+        self.trips = [model.trips[i] for i in firsts]
+        if model.paths is not None:
+            paths = (model.paths[i] for i in firsts)
+        else:
+            paths = (self.route(trip) for trip in self.trips)
+        self.paths = store_paths(paths)
+        self.times = self.paths.total_travel_times()
+
+        self.total = np.sum(self.counts * self.times)
+        self.norm = len(model.trips) * model.time_span
+
+        # The inverted index, each trip is only listed once for an edge
+        self.edge_index = form_edge_index(model.network)
+        trip_ids, edge_ids = path_edge_ids(self.edge_index, self.paths)
+        pairs = np.unique(edge_ids * len(self.trips) + trip_ids)
+        self.edge_trips = pairs % len(self.trips) if len(pairs) > 0 else pairs
+        self.edge_offsets = np.concatenate(([0], np.cumsum(np.bincount(
+            pairs // max(len(self.trips), 1), minlength=len(self.edge_index)
+            ))))
+
+    def route(self, trip, net=None):
+
+        """Routes a trip on the network of the model or an overlay on it
+
+        The landmarks of the model are used for the search when available, so
+        the overlay should only close edges or make them slower.
+
+        :param trip: The trip to route
+        :param net: The optional overlay on the network of the model
+        :returns: The :py:class:`paths.ShortestPath` instance
+
+        """
+
+        model = self.model
+        if net is None:
+            net = model.network
+        return ShortestPath(net, trip, model.landmarks)
+
+    def mean_time(self):
+
+        """Gets the base mean travel time"""
+
+        return self.total / self.norm
+
+    def affected_trips(self, edges):
+
+        """Finds the distinct trips affected by removing some edges
+
+        :param edges: An iterable of the node pairs of the edges
+        :returns: The sorted array of the indices of the distinct trips whose
+            shortest paths traverse any of the edges
+
+        """
+
+        index = self.edge_index
+        offsets = self.edge_offsets
+
+        found = []
+        for beg, end in edges:
+            edge_id = index.edge_id(beg, end)
+            if edge_id >= 0:
+                found.append(
+                    self.edge_trips[offsets[edge_id]:offsets[edge_id + 1]]
+                    )
+            continue
+
+        if len(found) == 0:
+            return np.array([], dtype=np.int64)
+        return np.unique(np.concatenate(found))
+
+    def delta_without(self, edges):
+
+        """Computes the change of the total travel time with edges removed
+
+        Only the trips affected by the removal are routed again, on an
+        overlay with the edges closed.
+
+        :param edges: An iterable of the node pairs of the edges
+        :returns: The change of the total travel time of all the trips
+
+        """
+
+        edges = list(edges)
+        affected = self.affected_trips(edges)
+        if len(affected) == 0:
+            return 0.0
+
+        net = NetworkOverlay(self.model.network, closed=edges)
+        delta = 0.0
+        for trip_i in affected.tolist():
+            delta += self.counts[trip_i] * (
+                self.route(self.trips[trip_i], net).travel_time() -
+                self.times[trip_i]
+                )
+            continue
+
+        return delta
+
+    def mean_time_without(self, edges):
+
+        """Computes the mean travel time with some edges removed
+
+        :param edges: An iterable of the node pairs of the edges
+        :returns: The new mean travel time
+
+        """
+
+        return (self.total + self.delta_without(edges)) / self.norm
+
+    def delta_bounds(self, edges):
+
+        """Computes upper bounds of the changes for removing single edges
+
+        The bound is infinite for the edges traversed by the trips whose
+        removal disconnects their two ends, since the trips could be
+        truncated there.
+
+        :param edges: A list of the node pairs of the edges
+        :returns: The array of the upper bounds of the change of the total
+            travel time when each of the edges is removed alone
+
+        """
+
+        edge_ids = self.edge_index.edge_ids(
+            [beg for beg, _ in edges], [end for _, end in edges]
+            )
+
+        # The number of traversals of the edges by all the trips
+        trip_ids, path_ids = path_edge_ids(self.edge_index, self.paths)
+        volumes = np.bincount(
+            path_ids, weights=self.counts[trip_ids],
+            minlength=len(self.edge_index)
+            )
+
+        net = self.model.network
+        bounds = np.zeros(len(edges), dtype=np.float64)
+        for i, (beg, end) in enumerate(edges):
+            if edge_ids[i] < 0 or volumes[edge_ids[i]] == 0:
+                continue
+            dist, _ = dijkstra(
+                NetworkOverlay(net, closed=[(beg, end)]), [beg], [end]
+                )
+            detour = dist.get(end, np.inf) - net[beg][end]['travel_time']
+            bounds[i] = volumes[edge_ids[i]] * detour
+            continue
+
+        return bounds
+
+    def top_deltas(self, edges, number):
+
+        """Finds the edges with the largest changes when removed alone
+
+        The edges are evaluated exactly by :py:meth:`delta_without` in the
+        order of decreasing upper bounds from :py:meth:`delta_bounds`, until
+        the smallest of the largest changes found is no less than the bounds
+        of all the remaining edges.
+
+        :param edges: A list of the node pairs of the edges
+        :param number: The number of edges to find
+        :returns: A pair of the list of the changes of the total travel time
+            and the node pairs of the edges, in decreasing order of the
+            changes, and the number of edges evaluated exactly
+
+        """
+
+        bounds = self.delta_bounds(edges)
+        order = np.argsort(-bounds, kind='mergesort')
+
+        # Min-heap of the largest changes found, with the edge positions
+        top = []
+        n_evaluated = 0
+        for i in order.tolist():
+            if len(top) >= number and top[0][0] >= bounds[i]:
+                break
+            if bounds[i] == 0.0:
+                delta = 0.0
+            else:
+                delta = self.delta_without([edges[i]])
+                n_evaluated += 1
+            if len(top) < number:
+                heapq.heappush(top, (delta, -i))
+            elif delta > top[0][0]:
+                heapq.heapreplace(top, (delta, -i))
+            continue
+
+        top.sort(reverse=True)
+        return [(delta, edges[-i]) for delta, i in top], n_evaluated
@@ -0,0 +1,126 @@
+"""
+Stratified sampling of trips
+============================
+
+For quick estimates, the mean travel time can be estimated by routing only a
+random subset of the trips. The trips are divided into strata by their kind
+and the zone of the home of their traveller, where the zones are the cells of
+a regular grid over the bounding box of the homes. A fixed fraction of the
+trips in each stratum, at least two of them, is drawn without replacement, and
+the stratified mean is an unbiased estimate of the mean travel time, with the
+standard error from the variances within the strata.
+
+The fraction trades the accuracy against the run time, the standard error
+scales roughly as the inverse square root of the number of trips routed.
+
+.. autosummary::
+    :toctree: generated
+
+    form_strata
+    sample_strata
+    stratified_mean
+
+"""
+
+import numpy as np
+
+
+def form_strata(net, homes, kinds, zones=4):
+
+    """Forms the strata of the trips
+
+    :param net: The network, with the coordinates of the nodes
+    :param homes: The list of the home nodes of the trips
+    :param kinds: The list of the kinds of the trips, as integers
+    :param zones: The number of zones along each direction
+    :returns: The array of the stratum of each trip, numbered from zero
+        consecutively
+
+    """
+
+    coords = np.array(
+        [net.node[node]['coord'] for node in homes], dtype=np.float64
+        ).reshape((-1, 2))
+    if len(coords) == 0:
+        return np.array([], dtype=np.int64)
+
+    lows = coords.min(axis=0)
+    spans = np.maximum(coords.max(axis=0) - lows, 1.0e-12)
+    cells = np.minimum(
+        ((coords - lows) / spans * zones).astype(np.int64), zones - 1
+        )
+    zone = cells[:, 0] * zones + cells[:, 1]
+
+    keys = np.asarray(kinds, dtype=np.int64) * zones * zones + zone
+    _, strata = np.unique(keys, return_inverse=True)
+    return strata
+
+
+def sample_strata(strata, fraction, rand=None):
+
+    """Draws a stratified random sample of the trips
+
+    :param strata: The array of the stratum of each trip
+    :param fraction: The fraction of the trips to draw from each stratum
+    :param rand: The optional numpy ``RandomState`` for the draws
+    :returns: The sorted array of the indices of the trips drawn
+
+    """
+
+    if rand is None:
+        rand = np.random.RandomState()
+
+    order = np.argsort(strata, kind='mergesort')
+    sizes = np.bincount(strata)
+    offsets = np.concatenate(([0], np.cumsum(sizes)))
+
+    drawn = []
+    for stratum, size in enumerate(sizes.tolist()):
+        number = min(size, max(2, int(round(fraction * size))))
+        members = order[offsets[stratum]:offsets[stratum + 1]]
+        drawn.append(rand.choice(members, number, replace=False))
+        continue
+
+    if len(drawn) == 0:
+        return np.array([], dtype=np.int64)
+    return np.sort(np.concatenate(drawn))
+
+
+def stratified_mean(values, strata, sample):
+
+    """Computes the stratified mean and its standard error
+
+    :param values: The array of the values of the trips drawn
+    :param strata: The array of the stratum of all the trips
+    :param sample: The array of the indices of the trips drawn
+    :returns: A pair of the estimate of the mean over all the trips and its
+        standard error
+
+    """
+
+    values = np.asarray(values, dtype=np.float64)
+    sizes = np.bincount(strata).astype(np.float64)
+    shares = sizes / np.sum(sizes)
+
+    drawn_strata = strata[sample]
+    numbers = np.bincount(drawn_strata, minlength=len(sizes))
+    means = np.bincount(
+        drawn_strata, weights=values, minlength=len(sizes)
+        ) / numbers
+    sq_devs = np.bincount(
+        drawn_strata, weights=(values - means[drawn_strata]) ** 2,
+        minlength=len(sizes)
+        )
+
+    # Strata drawn completely, or with one trip, have got no sampling error
+    variances = np.zeros(len(sizes), dtype=np.float64)
+    partial = numbers > 1
+    variances[partial] = (
+        sq_devs[partial] / (numbers[partial] - 1) *
+        (1.0 - numbers[partial] / sizes[partial]) / numbers[partial]
+        )
+
+    return (
+        float(np.sum(shares * means)),
+        float(np.sqrt(np.sum(shares ** 2 * variances)))
+        )
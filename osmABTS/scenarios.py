@@ -0,0 +1,159 @@
+"""
+Closure scenarios
+=================
+
+Beyond the removal of single edges, the closure of a set of roads at once,
+like a whole named street or all the roads at a junction, is described by a
+:py:class:`Scenario`. Closing a node closes all the edges incident to it, so
+that the trips starting or ending there become unreachable and are truncated,
+as for the other unreachable trips.
+
+Many scenarios can be evaluated on the same :py:class:`routing.RoutingBase`,
+where only the trips traversing the closed edges of each scenario are routed
+again.
+
+.. autosummary::
+    :toctree: generated
+    :template: classtempl.rstt
+
+    Scenario
+
+.. autosummary::
+    :toctree: generated
+
+    form_street_scenarios
+    form_junction_scenarios
+    evaluate_scenarios
+
+"""
+
+import collections
+
+from .network import node2str
+
+
+class Scenario(object):
+
+    """Closure scenarios of edges and nodes
+
+    .. py:attribute:: name
+
+        The name of the scenario
+
+    .. py:attribute:: edges
+
+        The list of the node pairs of the closed edges
+
+    .. py:attribute:: nodes
+
+        The list of the closed nodes
+
+    """
+
+    __slots__ = [
+        'name',
+        'edges',
+        'nodes',
+        ]
+
+    def __init__(self, name, edges=(), nodes=()):
+
+        """Initializes the scenario
+
+        :param name: The name of the scenario
+        :param edges: An iterable of the node pairs of the closed edges
+        :param nodes: An iterable of the closed nodes
+
+        """
+
+        self.name = name
+        self.edges = list(edges)
+        self.nodes = list(nodes)
+
+    def closed_edges(self, net):
+
+        """Gets all the edges closed in the scenario
+
+        :param net: The network
+        :returns: The list of the node pairs of the closed edges in the
+            network, including the ones incident to the closed nodes, with
+            each edge only listed once
+
+        """
+
+        closed = collections.OrderedDict()
+        for beg, end in self.edges:
+            if net.has_edge(beg, end):
+                closed.setdefault((min(beg, end), max(beg, end)), None)
+            continue
+        for node in self.nodes:
+            if node not in net:
+                continue
+            for neighb in net.neighbors_iter(node):
+                closed.setdefault((min(node, neighb), max(node, neighb)), None)
+                continue
+            continue
+
+        return closed.keys()
+
+
+def form_street_scenarios(net, names=None):
+
+    """Forms the scenarios of closing whole named streets
+
+    :param net: The network
+    :param names: The iterable of the street names, all the named streets in
+        the network by default
+    :returns: The list of the scenarios, one for each street
+
+    """
+
+    streets = collections.defaultdict(list)
+    for beg, end, data in net.edges_iter(data=True):
+        streets[data['name']].append((beg, end))
+        continue
+
+    if names is None:
+        names = sorted(name for name in streets if name != 'Unamed')
+
+    return [Scenario(name, edges=streets[name]) for name in names]
+
+
+def form_junction_scenarios(net, nodes=None):
+
+    """Forms the scenarios of closing single junctions
+
+    :param net: The network
+    :param nodes: The iterable of the nodes, all the nodes with more than two
+        edges by default
+    :returns: The list of the scenarios, one for each node
+
+    """
+
+    if nodes is None:
+        nodes = sorted(
+            node for node in net.nodes_iter() if net.degree(node) > 2
+            )
+
+    return [
+        Scenario(node2str(net, node), nodes=[node])
+        for node in nodes
+        ]
+
+
+def evaluate_scenarios(base, scenarios):
+
+    """Evaluates the mean travel time for scenarios
+
+    :param base: The :py:class:`routing.RoutingBase` of the model
+    :param scenarios: An iterable of the scenarios
+    :returns: An iterator over the mean travel time of each of the scenarios
+
+    """
+
+    net = base.model.network
+    for scenario in scenarios:
+        yield base.mean_time_without(scenario.closed_edges(net))
+        continue
+
+    return
@@ -0,0 +1,387 @@
+"""
+Query service
+=============
+
+For ad-hoc questions, a model built once can be kept in memory by a local
+HTTP service, answering the queries with low latency rather than running the
+whole program for each of them. The queries are JSON objects posted to the
+service, answered by JSON objects. The service only reads the model, so the
+queries are answered concurrently by a thread for each connection.
+
+The queries, posted to the path of the same name, are
+
+``/snap``
+    The nearest node to a coordinate, like ``{"coord": [lat, lon]}``,
+    answered with the node, its coordinate and the street names.
+
+``/route``
+    The shortest path between two coordinates, given as ``from`` and ``to``,
+    or between two nodes, given as ``from_node`` and ``to_node``, answered
+    with the nodes of the path and the travel time in hours, which is null
+    for unreachable destinations.
+
+``/closure``
+    The mean travel time with some edges closed, given as a list of node
+    pairs ``edges``, a street name ``street``, or a list of junction nodes
+    ``junctions``, answered with the new mean travel time, its change and the
+    percentage of the change. The trips of the model are only routed again
+    when affected by the closure.
+
+``/batch``
+    A list of queries under ``queries``, each with its kind under ``query``
+    and the fields above, answered with the list of the answers.
+
+The status of the model can be got from the path ``/status``. Invalid queries
+are answered with the status 400 and the message under ``error``.
+
+.. autosummary::
+    :toctree: generated
+    :template: classtempl.rstt
+
+    QueryService
+
+.. autosummary::
+    :toctree: generated
+
+    make_server
+
+"""
+
+import json
+import SocketServer
+import BaseHTTPServer
+
+import numpy as np
+
+from .places import Place
+from .paths import ShortestPath
+from .routing import RoutingBase
+from .scenarios import Scenario, form_street_scenarios
+
+
+class QueryService(object):
+
+    """The queries on a model kept in memory
+
+    .. py:attribute:: model
+
+        The model, with the network formed, and the trips generated for the
+        closure queries
+
+    .. py:attribute:: base
+
+        The :py:class:`routing.RoutingBase` of the model for the closure
+        queries, None without trips
+
+    """
+
+    __slots__ = [
+        'model',
+        'base',
+        '_nodes',
+        '_coords',
+        ]
+
+    def __init__(self, model):
+
+        """Initializes the service, routing the trips of the model"""
+
+        if model.network is None:
+            raise ValueError('Network unavailable for the query service')
+
+        self.model = model
+        self.base = RoutingBase(model) if model.trips is not None else None
+
+        net = model.network
+        self._nodes = np.array(sorted(net.nodes_iter()), dtype=np.int64)
+        self._coords = np.array(
+            [net.node[node]['coord'] for node in self._nodes.tolist()],
+            dtype=np.float64
+            ).reshape((-1, 2))
+
+    def status(self):
+
+        """Gets the status of the model"""
+
+        net = self.model.network
+        status = {
+            'map': self.model.osm_file,
+            'nodes': net.number_of_nodes(),
+            'edges': net.number_of_edges(),
+            'trips': None,
+            'mean_time': None,
+            }
+        if self.base is not None:
+            status['trips'] = len(self.model.trips)
+            status['mean_time'] = float(self.base.mean_time())
+
+        return status
+
+    def snap(self, coord):
+
+        """Finds the node nearest to a coordinate
+
+        The same metric is used as for the places, see
+        :py:func:`places.gen_places`.
+
+        :param coord: The latitude and longitude pair
+        :returns: The node
+
+        """
+
+        coord = np.asarray(coord, dtype=np.float64)
+        if coord.shape != (2, ):
+            raise ValueError('Invalid coordinate %r' % (coord.tolist(), ))
+
+        # The first of the nearest nodes, as found by the places
+        dists = np.sqrt(np.sum((self._coords - coord) ** 2, axis=1))
+        return int(self._nodes[np.argmin(dists)])
+
+    def route(self, beg_node, end_node):
+
+        """Finds the shortest path between two nodes
+
+        :returns: A pair of the list of the nodes of the path and the travel
+            time, None when the destination is unreachable
+
+        """
+
+        net = self.model.network
+        for node in [beg_node, end_node]:
+            if node not in net:
+                raise ValueError('Unknown node %r' % (node, ))
+
+        path = ShortestPath(
+            net, [Place(beg_node, '', 1.0), Place(end_node, '', 1.0)],
+            self.model.landmarks
+            )
+        if beg_node != end_node and len(path.nodes) == 0:
+            return [], None
+        return path.nodes, float(path.travel_time())
+
+    def closure(self, edges):
+
+        """Computes the mean travel time with some edges closed
+
+        :param edges: The list of the node pairs of the closed edges
+        :returns: The new mean travel time
+
+        """
+
+        if self.base is None:
+            raise ValueError('Trips unavailable for closure queries')
+
+        return self.base.mean_time_without(edges)
+
+    def handle(self, kind, query):
+
+        """Answers a query
+
+        :param kind: The kind of the query, ``'snap'``, ``'route'``,
+            ``'closure'``, ``'batch'`` or ``'status'``
+        :param query: The dictionary of the query
+        :returns: The dictionary of the answer
+        :raises ValueError: If the query is invalid
+
+        """
+
+        try:
+            handler = _HANDLERS[kind]
+        except KeyError:
+            raise ValueError('Unknown query %s' % kind)
+
+        if not isinstance(query, dict):
+            raise ValueError('Query %s is not an object' % kind)
+
+        try:
+            return handler(self, query)
+        except (KeyError, TypeError) as exc:
+            raise ValueError('Invalid query %s: %s' % (kind, exc))
+
+
+#
+# Query handlers
+# --------------
+#
+
+def _handle_status(service, _):
+
+    """Answers the status query"""
+
+    return service.status()
+
+
+def _handle_snap(service, query):
+
+    """Answers the snapping query"""
+
+    net = service.model.network
+    node = service.snap(query['coord'])
+    return {
+        'node': node,
+        'coord': net.node[node]['coord'].tolist(),
+        'streets': sorted(set(
+            data['name'] for data in net[node].itervalues()
+            )),
+        }
+
+
+def _handle_route(service, query):
+
+    """Answers the routing query"""
+
+    answer = {}
+    for end in ['from', 'to']:
+        if end + '_node' in query:
+            answer[end + '_node'] = int(query[end + '_node'])
+        else:
+            answer[end + '_node'] = service.snap(query[end])
+        continue
+
+    nodes, travel_time = service.route(
+        answer['from_node'], answer['to_node']
+        )
+    answer['nodes'] = nodes
+    answer['travel_time'] = travel_time
+    return answer
+
+
+def _handle_closure(service, query):
+
+    """Answers the closure query"""
+
+    net = service.model.network
+    if 'edges' in query:
+        scenario = Scenario('edges', edges=[
+            (int(beg), int(end)) for beg, end in query['edges']
+            ])
+    elif 'street' in query:
+        scenario = form_street_scenarios(net, [query['street']])[0]
+    elif 'junctions' in query:
+        scenario = Scenario(
+            'junctions', nodes=[int(i) for i in query['junctions']]
+            )
+    else:
+        raise ValueError('No edges, street or junctions to close')
+
+    closed = scenario.closed_edges(net)
+    if len(closed) == 0:
+        raise ValueError('No edge of the network to close')
+
+    new_time = float(service.closure(closed))
+    mean_time = float(service.base.mean_time())
+    return {
+        'closed': [list(edge) for edge in closed],
+        'mean_time': mean_time,
+        'new_time': new_time,
+        'delta': new_time - mean_time,
+        'percentage': (new_time - mean_time) / mean_time * 100.0,
+        }
+
+
+def _handle_batch(service, query):
+
+    """Answers a batch of queries"""
+
+    answers = []
+    for sub_query in query['queries']:
+        if not isinstance(sub_query, dict):
+            raise ValueError('Query in batch is not an object')
+        kind = sub_query.get('query')
+        if kind == 'batch':
+            raise ValueError('Nested batch queries')
+        try:
+            answers.append(service.handle(kind, sub_query))
+        except ValueError as exc:
+            answers.append({'error': str(exc)})
+        continue
+
+    return {'answers': answers}
+
+
+_HANDLERS = {
+    'status': _handle_status,
+    'snap': _handle_snap,
+    'route': _handle_route,
+    'closure': _handle_closure,
+    'batch': _handle_batch,
+    }
+
+
+#
+# The HTTP server
+# ---------------
+#
+
+class _Server(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+
+    """HTTP server answering each connection in a thread"""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class _Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    """Handler of the HTTP requests of the queries"""
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """Answers the status query"""
+        self._answer(lambda: self.server.service.handle(
+            self.path.strip('/'), {}
+            ))
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        """Answers the posted queries"""
+
+        def answer():
+            """Reads and answers the query"""
+            length = int(self.headers.getheader('content-length', 0))
+            try:
+                query = json.loads(self.rfile.read(length) or '{}')
+            except ValueError:
+                raise ValueError('Query is not valid JSON')
+            return self.server.service.handle(self.path.strip('/'), query)
+
+        self._answer(answer)
+
+    def _answer(self, compute):
+        """Sends the answer, or the error for invalid queries"""
+        try:
+            status, answer = 200, compute()
+        except ValueError as exc:
+            status, answer = 400, {'error': str(exc)}
+
+        body = json.dumps(answer)
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        """Keeps the log quiet unless requested"""
+        if self.server.verbose:
+            BaseHTTPServer.BaseHTTPRequestHandler.log_message(self, *args)
+
+
+def make_server(service, host='127.0.0.1', port=0, verbose=False):
+
+    """Makes the HTTP server of a query service
+
+    The server is started by its ``serve_forever`` method, and stopped by its
+    ``shutdown`` method from another thread.
+
+    :param service: The :py:class:`QueryService`
+    :param host: The host to listen on, only the local host by default
+    :param port: The port to listen on, any free port by default, see the
+        ``server_address`` attribute of the server for the actual port
+    :param verbose: If the requests are logged to standard error
+    :returns: The server
+
+    """
+
+    server = _Server((host, port), _Handler)
+    server.service = service
+    server.verbose = verbose
+    return server
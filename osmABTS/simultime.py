@@ -10,15 +10,26 @@ travellers with or without some edge removed. Primarily it contains functions
 
     simul_travel_time
     test_sensitivity_edges
+    test_sensitivity_top_edges
+    test_sensitivity_scenarios
 
 """
 
 from __future__ import print_function
 
 import sys
+import json
+import functools
+import multiprocessing
 
 from .util import print_title
 from .network import node2str
+from .paths import ShortestPath
+from .overlay import NetworkOverlay
+from .routing import RoutingBase
+from .replacement import edge_total_deltas
+from .checkpoint import Checkpoint
+from .scenarios import evaluate_scenarios
 
 
 def simul_travel_time(model):
@@ -36,24 +47,83 @@ def simul_travel_time(model):
     return mean_time
 
 
-def test_sensitivity_edges(model, mean_time):
+def test_sensitivity_edges(model, mean_time, method='index', processes=None,
+                           batch_size=16, output=None, checkpoint=None,
+                           records=None):
 
     """Tests the sensitivity of the mean travel time for each edge
 
     Each edge is going to be temporarily removed to test the sensitity of the
     mean travel time for it.
 
-    A very primitive parallelization is made here. If it is detected that the
-    code is run under an MPI environment, only part of the edges will be test
-    in the current process. Full result can be obtained by external shell
-    scripts.
+    By default, an index from the edges to the distinct trips traversing them
+    is built from the base paths by a :py:class:`routing.RoutingBase`, so that
+    only the trips affected by the removal of an edge are routed again, and
+    edges traversed by no trip get their result instantly. The brute-force
+    method of routing all the trips again for each edge is also available for
+    reference. Alternatively, the changes for all the edges can be computed
+    from the replacement paths of the legs of the distinct trips, without a
+    search for each of the edges, see :py:mod:`replacement`.
+
+    The edges can be tested in parallel by a pool of processes, which take
+    batches of edges from a shared queue as they become free, with the results
+    collected and printed in the original order of the edges by the current
+    process.
+
+    If it is detected that the code is run under an MPI environment with more
+    than one rank, rank 0 becomes the master, which hands out batches of edges
+    to the other ranks on request and gathers the results. All the ranks use
+    the trips and the mean time of rank 0, and only rank 0 prints the results.
+
+    With a checkpoint file given, the new mean times are appended to it in
+    batches as they are computed, under the fingerprint of the model. When
+    the analysis is run again on the same map, seed and trips, the edges
+    already in the file are skipped, so that killed jobs can be resumed.
+
+    For further processing, the results can also be written as a stream of
+    records in the JSON lines format, with one JSON object for each edge, in
+    the original order of the edges. Each record has got the two end nodes
+    ``node1`` and ``node2``, the street name ``name``, the descriptions of
+    the ends ``end1`` and ``end2``, the new mean time ``new_time`` and the
+    relative change ``percentage``.
+
+    The progress of the edges tested, rather than resumed, is reported to the
+    progress callback of the model, if any.
 
     :param model: The model, with everying already setted up
     :param mean_time: The mean_time before any edge is removed
+    :param method: The method for the new mean time, ``'index'``,
+        ``'replacement'`` or ``'brute'``
+    :param processes: The number of processes, serial by default
+    :param batch_size: The number of edges in each batch handed to the
+        processes or MPI ranks
+    :param output: The name of an optional file to write the results into,
+        sorted by the percentage of change in decreasing order
+    :param checkpoint: The name of an optional checkpoint file
+    :param records: The name of an optional file to write the records into
 
     """
 
-    print_title('Edge sensitivity analysis', sys.stdout)
+    comm = _get_mpi_comm()
+    is_root = comm is None or comm.Get_rank() == 0
+
+    ckpt = None
+    done = {}
+    if is_root and checkpoint is not None:
+        ckpt = Checkpoint(checkpoint, model.fingerprint())
+        done = dict(ckpt.done)
+
+    if comm is not None:
+        # All the ranks work on the trips and mean time of the root
+        mean_time, trips, done = comm.bcast(
+            (mean_time, model.trips, done), root=0
+            )
+        if not is_root:
+            model.trips = trips
+            model.paths = None
+
+    if is_root:
+        print_title('Edge sensitivity analysis', sys.stdout)
 
     # A shallow copy of the edges
     edges = [
@@ -61,44 +131,444 @@ def test_sensitivity_edges(model, mean_time):
         if model.network[edge[0]][edge[1]]['highway'] != 'residential'
         ]
     n_edge = len(edges)
-    print(' %s edges to be tested...' % n_edge)
+    pending = [edge for edge in edges if edge not in done]
+    if is_root:
+        print(' %s edges to be tested...' % n_edge)
+        if ckpt is not None:
+            print(' %d edges resumed from checkpoint %s...' % (
+                n_edge - len(pending), checkpoint
+                ))
+
+    if method not in _SA_METHODS:
+        raise ValueError('Unknown sensitivity method %s' % method)
+
+    # Rank 0 of MPI only hands out the edges, without evaluating any
+    if comm is None:
+        results = _eval_edges(
+            pending, _form_new_time_func(model, mean_time, method),
+            processes, batch_size
+            )
+    elif is_root:
+        results = _eval_edges_mpi(comm, pending, None, batch_size)
+        print(' %d ranks working on the edges...' % (comm.Get_size() - 1))
+    else:
+        _eval_edges_mpi(
+            comm, pending, _form_new_time_func(model, mean_time, method),
+            batch_size
+            )
+        return None
+
+    print("Now we remove streets between nodes, and find the new travel time")
+    print(" Street name / node 1 / node 2 / new time / percentage ")
+    lines = []
+    progress = model.progress
+    n_tested = 0
+    if progress is not None:
+        progress('sensitivity', 'edges', 0, len(pending))
+    records_file = open(records, 'w') if records is not None else None
+    try:
+        for n1, n2 in edges:
+            if (n1, n2) in done:
+                new_time = done[(n1, n2)]
+            else:
+                new_time = next(results)
+                if ckpt is not None:
+                    ckpt.add(n1, n2, new_time)
+                n_tested += 1
+                if progress is not None:
+                    progress('sensitivity', 'edges', n_tested, len(pending))
+            record = _form_sa_record(model, n1, n2, new_time, mean_time)
+            line = _form_sa_line(record)
+            print(line)
+            if records_file is not None:
+                print(json.dumps(record, sort_keys=True), file=records_file)
+            if output is not None:
+                lines.append((record['percentage'], line))
+            continue
+        # Drains the evaluation, for the MPI ranks to get the stop signal
+        for _ in results:
+            continue
+    finally:
+        if ckpt is not None:
+            ckpt.flush()
+        if records_file is not None:
+            records_file.close()
+
+    if records is not None:
+        print('Sensitivity records written to file %s' % records)
+
+    if output is not None:
+        lines.sort(key=lambda line: line[0], reverse=True)
+        with open(output, 'w') as out_file:
+            for _, line in lines:
+                print(line, file=out_file)
+                continue
+        print('Sorted sensitivity written to file %s' % output)
+
+    return None
+
+
+def test_sensitivity_top_edges(model, mean_time, number=15, output=None,
+                               records=None):
+
+    """Finds the edges to which the mean travel time is the most sensitive
+
+    Rather than all the edges tested by :py:func:`test_sensitivity_edges`,
+    only the given number of the most sensitive edges are found, by evaluating
+    the edges in the order of decreasing upper bounds of their changes until
+    no remaining edge could be more sensitive, see
+    :py:meth:`routing.RoutingBase.top_deltas`.
+
+    :param model: The model, with everying already setted up
+    :param mean_time: The mean_time before any edge is removed
+    :param number: The number of the most sensitive edges to find
+    :param output: The name of an optional file to write the results into
+    :param records: The name of an optional file to write the records into
+
+    """
+
+    print_title('Edge sensitivity analysis', sys.stdout)
+
+    edges = [
+        edge for edge in model.network.edges()
+        if model.network[edge[0]][edge[1]]['highway'] != 'residential'
+        ]
+    print(' %s edges to be tested...' % len(edges))
+
+    base = RoutingBase(model)
+    top, n_evaluated = base.top_deltas(edges, number)
+    print(' %d edges evaluated exactly for the top %d...' % (
+        n_evaluated, number
+        ))
+
+    print(" Street name / node 1 / node 2 / new time / percentage ")
+    out_file = open(output, 'w') if output is not None else None
+    records_file = open(records, 'w') if records is not None else None
+    try:
+        for delta, (n1, n2) in top:
+            record = _form_sa_record(
+                model, n1, n2, mean_time + delta / base.norm, mean_time
+                )
+            line = _form_sa_line(record)
+            print(line)
+            if out_file is not None:
+                print(line, file=out_file)
+            if records_file is not None:
+                print(json.dumps(record, sort_keys=True), file=records_file)
+            continue
+    finally:
+        for i in [out_file, records_file]:
+            if i is not None:
+                i.close()
+            continue
+
+    return None
+
+
+def test_sensitivity_scenarios(model, mean_time, scenarios, output=None):
+
+    """Tests the sensitivity of the mean travel time for closure scenarios
+
+    All the scenarios share the same base routing state, with only the trips
+    affected by the closures of each scenario routed again, see
+    :py:mod:`scenarios`.
+
+    :param model: The model, with everying already setted up
+    :param mean_time: The mean_time before any closure
+    :param scenarios: The list of :py:class:`scenarios.Scenario` instances
+    :param output: The name of an optional file to write the results into,
+        sorted by the percentage of change in decreasing order
+
+    """
+
+    print_title('Closure scenario analysis', sys.stdout)
+    print(' %d scenarios to be tested...' % len(scenarios))
+
+    base = RoutingBase(model)
+    print(" Scenario / closed edges / new time / percentage ")
+    lines = []
+    for scenario, new_time in zip(
+            scenarios, evaluate_scenarios(base, scenarios)
+            ):
+        n_closed = len(scenario.closed_edges(model.network))
+        percentage = (new_time - mean_time) / mean_time
+        line = 'SC: ' + ' / '.join([
+            scenario.name, str(n_closed),
+            _format_number(new_time), _format_number(percentage)
+            ])
+        print(line)
+        lines.append((percentage, line))
+        continue
+
+    if output is not None:
+        lines.sort(key=lambda line: line[0], reverse=True)
+        with open(output, 'w') as out_file:
+            for _, line in lines:
+                print(line, file=out_file)
+                continue
+        print('Sorted closure results written to file %s' % output)
+
+    return None
+
+
+def _form_sa_record(model, n1, n2, new_time, mean_time):
+
+    """Forms the record of the result for an edge
+
+    :returns: The record as a dictionary
+
+    """
+
+    new_time = float(new_time)
+    return {
+        'node1': n1,
+        'node2': n2,
+        'name': model.network[n1][n2]['name'],
+        'end1': node2str(model.network, n1),
+        'end2': node2str(model.network, n2),
+        'new_time': new_time,
+        'percentage': float((new_time - mean_time) / mean_time),
+        }
+
+
+def _form_sa_line(record):
+
+    """Forms the line of the result for an edge in the log"""
+
+    return 'SA: ' + (
+        ' / '.join([
+            record['name'], record['end1'], record['end2'],
+            _format_number(record['new_time']),
+            _format_number(record['percentage'])
+            ])
+        )
+
+
+def _format_number(number):
+
+    """Formats a number for the lines of the log
+
+    The numbers are in the short format of the original log, with the full
+    precision only kept in the checkpoint and the records.
+
+    """
+
+    return str(float(number))
+
+
+_SA_METHODS = ['index', 'replacement', 'brute']
+
+
+def _form_new_time_func(model, mean_time, method):
+
+    """Forms the function of the new mean time for removing an edge
+
+    :returns: The function taking the two ends of the edge
+
+    """
+
+    if method == 'index':
+        base = RoutingBase(model)
+        return lambda n1, n2: (
+            mean_time + base.delta_without([(n1, n2)]) / base.norm
+            )
+    elif method == 'replacement':
+        base = RoutingBase(model)
+        deltas = edge_total_deltas(base)
+        return lambda n1, n2: (
+            mean_time + deltas[base.edge_index.edge_id(n1, n2)] / base.norm
+            )
+    else:
+        return functools.partial(_brute_force_new_time, model)
+
+
+def _brute_force_new_time(model, n1, n2):
+
+    """Computes the new mean travel time by routing all the trips again"""
+
+    net = NetworkOverlay(model.network, closed=[(n1, n2)])
+    total = sum(
+        ShortestPath(net, trip, model.landmarks).travel_time()
+        for trip in model.trips
+        )
+
+    return total / len(model.trips) / model.time_span
+
+
+#
+# Parallel evaluation of the edges
+# --------------------------------
+#
+# The function for the new mean time is handed to the worker processes by the
+# pool initializer. Since the workers are forked, it needs not to be pickled,
+# and each worker gets its own copy of the model to modify. The batches of
+# edges are taken by the workers from the task queue of the pool as soon as
+# they become free.
+#
+
+_WORKER_DATA = {}
+
+
+def _init_worker(new_time_func):
+
+    """Initializes the worker processes with the new time function"""
+
+    _WORKER_DATA['new_time_func'] = new_time_func
+
+
+def _eval_batch(batch, new_time_func=None):
+
+    """Evaluates a batch of edges, in a worker process by default"""
+
+    if new_time_func is None:
+        new_time_func = _WORKER_DATA['new_time_func']
+    return [
+        (idx, new_time_func(n1, n2))
+        for idx, (n1, n2) in batch
+        ]
+
+
+def _form_batches(edges, batch_size):
+
+    """Forms the batches of the edges with their indices"""
+
+    indexed = list(enumerate(edges))
+    return [
+        indexed[i:i + batch_size]
+        for i in xrange(0, len(indexed), batch_size)
+        ]
+
+
+def _eval_edges(edges, new_time_func, processes, batch_size):
+
+    """Evaluates the new mean time for each of the edges
+
+    :returns: An iterator over the new mean times, in the order of the edges
+
+    """
+
+    if processes is None or processes < 2:
+        for n1, n2 in edges:
+            yield new_time_func(n1, n2)
+            continue
+        return
+
+    batches = _form_batches(edges, batch_size)
+    pool = multiprocessing.Pool(
+        processes, initializer=_init_worker, initargs=(new_time_func,)
+        )
+
+    try:
+        # Results arriving out of order are held until their turn
+        pending = {}
+        curr = 0
+        for batch_res in pool.imap_unordered(_eval_batch, batches):
+            pending.update(batch_res)
+            while curr in pending:
+                yield pending.pop(curr)
+                curr += 1
+            continue
+    finally:
+        pool.terminate()
+        pool.join()
+
+    return
+
+
+#
+# MPI evaluation of the edges
+# ---------------------------
+#
+# Rank 0 is the master holding the queue of the batches. Each of the other
+# ranks sends its results, initially empty, to the master, which replies with
+# the next batch or the stop signal when the queue is empty. So the ranks
+# finishing early get more batches.
+#
+
+_TAG_RESULT = 1
+_TAG_WORK = 2
+_TAG_STOP = 3
+
+
+def _get_mpi_comm():
+
+    """Gets the MPI world communicator, None if not under MPI"""
 
     try:
         from mpi4py import MPI
     except ImportError:
-        pass
+        return None
+
+    comm = MPI.COMM_WORLD
+    return comm if comm.Get_size() > 1 else None
+
+
+def _eval_edges_mpi(comm, edges, new_time_func, batch_size):
+
+    """Evaluates the new mean time for the edges by MPI ranks
+
+    :param new_time_func: The function for the new mean time, only needed
+        on the ranks other than 0
+    :returns: An iterator over the new mean times in the order of the edges
+        on rank 0, None on the other ranks after all the work is done
+
+    """
+
+    if comm.Get_rank() == 0:
+        return _master_mpi(comm, edges, batch_size)
     else:
-        comm = MPI.COMM_WORLD
-        rank = comm.Get_rank()
-        size = comm.Get_size()
-        # distribute work by round-robin
-        edges = edges[rank::size]
-        print(' rank %d get allocated %d edges...' % (rank, len(edges)))
+        _work_mpi(comm, new_time_func)
+        return None
 
-    print("Now we remove streets between nodes, and find the new travel time")
-    print(" Street name / node 1 / node 2 / new time / percentage ")
-    for n1, n2 in edges:
 
-        data = model.network[n1][n2]
+def _master_mpi(comm, edges, batch_size):
 
-        street_name = data['name']
-        end1 = node2str(model.network, n1)
-        end2 = node2str(model.network, n2)
+    """Hands out the batches and yields the results in order on rank 0"""
 
-        model.network.remove_edge(n1, n2)
+    from mpi4py import MPI
 
-        new_time = simul_travel_time(model)
-        percentage = (new_time - mean_time) / mean_time
-        print(
-            'SA: ' + (
-                ' / '.join([
-                    street_name, end1, end2,
-                    str(new_time), str(percentage)
-                    ])
-                )
+    status = MPI.Status()
+    batches = _form_batches(edges, batch_size)
+    next_batch = 0
+    n_active = comm.Get_size() - 1
+    pending = {}
+    curr = 0
+
+    while n_active > 0:
+        batch_res = comm.recv(
+            source=MPI.ANY_SOURCE, tag=_TAG_RESULT, status=status
             )
+        worker = status.Get_source()
+        if next_batch < len(batches):
+            comm.send(batches[next_batch], dest=worker, tag=_TAG_WORK)
+            next_batch += 1
+        else:
+            comm.send(None, dest=worker, tag=_TAG_STOP)
+            n_active -= 1
 
-        model.network.add_edge(n1, n2, **data)
+        pending.update(batch_res)
+        while curr in pending:
+            yield pending.pop(curr)
+            curr += 1
+        continue
 
-    return None
+    return
+
+
+def _work_mpi(comm, new_time_func):
 
+    """Evaluates the batches from rank 0 until the stop signal"""
+
+    from mpi4py import MPI
+
+    status = MPI.Status()
+    batch_res = []
+    while True:
+        comm.send(batch_res, dest=0, tag=_TAG_RESULT)
+        batch = comm.recv(source=0, tag=MPI.ANY_TAG, status=status)
+        if status.Get_tag() == _TAG_STOP:
+            break
+        batch_res = _eval_batch(batch, new_time_func)
+        continue
+
+    return None
@@ -0,0 +1,204 @@
+"""
+Speed profiles of the roads
+===========================
+
+The travel time of each edge of the network is just the length of the roads
+of each type on it divided by the speed for the type. So for calibrating the
+speeds, rather than forming the network from the OSM data again for each
+candidate speed profile, the lengths are tabulated once into a
+:py:class:`ClassLengths` matrix, with one row for each edge and one column for
+each type of roads, and the travel time for any number of speed profiles is
+computed by a single matrix product.
+
+A speed profile is a dictionary with the types of roads as keys and the speeds
+in miles per hour as values. Types absent from a profile take the speeds used
+for the formation of the network.
+
+The network of the model is never modified for the profiles, the new travel
+time is given by a :py:class:`overlay.NetworkOverlay` on it, with the places,
+travellers and trips of the model reused. Since the landmark lower bounds are
+not valid for increased speeds, they are not used for the routing here.
+
+.. autosummary::
+    :toctree: generated
+    :template: classtempl.rstt
+
+    ClassLengths
+
+.. autosummary::
+    :toctree: generated
+
+    form_class_lengths
+    reweight_network
+    evaluate_speed_profiles
+
+"""
+
+import numpy as np
+
+from .network import _HIGHWAY_SPEEDS
+from .traffic import form_edge_index
+from .trips import unique_trips
+from .paths import ShortestPath
+from .overlay import NetworkOverlay
+
+
+class ClassLengths(object):
+
+    """The lengths of the roads of each type on the edges
+
+    .. py:attribute:: index
+
+        The :py:class:`traffic.EdgeIndex` of the network, the rows are in the
+        order of its edge identities
+
+    .. py:attribute:: classes
+
+        The sorted list of the types of roads, for the columns
+
+    .. py:attribute:: lengths
+
+        The matrix of the lengths, in miles
+
+    """
+
+    __slots__ = [
+        'index',
+        'classes',
+        'lengths',
+        ]
+
+    def __init__(self, index, classes, lengths):
+
+        """Initializes the table with the fields"""
+
+        self.index = index
+        self.classes = classes
+        self.lengths = lengths
+
+    def inverse_speeds(self, profiles):
+
+        """Forms the matrix of the inverse speeds for the profiles
+
+        :param profiles: A list of the speed profiles
+        :returns: The matrix of the inverse speeds, with one row for each of
+            the types of roads and one column for each of the profiles
+        :raises ValueError: If the speed for a type of roads is unknown
+
+        """
+
+        inverse = np.empty((len(self.classes), len(profiles)), np.float64)
+        for j, profile in enumerate(profiles):
+            for i, highway in enumerate(self.classes):
+                try:
+                    speed = profile.get(highway, _HIGHWAY_SPEEDS[highway])
+                except KeyError:
+                    raise ValueError('Unknown highway type %s' % highway)
+                inverse[i, j] = 1.0 / speed
+                continue
+            continue
+
+        return inverse
+
+    def travel_times(self, profiles):
+
+        """Computes the travel time of the edges for the profiles
+
+        :param profiles: A list of the speed profiles
+        :returns: The matrix of the travel time, with one row for each of the
+            edges and one column for each of the profiles
+
+        """
+
+        return np.dot(self.lengths, self.inverse_speeds(profiles))
+
+
+def form_class_lengths(net, index=None):
+
+    """Tabulates the lengths of each type of roads on the edges
+
+    :param net: The network
+    :param index: The optional :py:class:`traffic.EdgeIndex` of the network,
+        formed when not given
+    :returns: The :py:class:`ClassLengths` instance
+
+    """
+
+    if index is None:
+        index = form_edge_index(net)
+
+    edges = index.edges.tolist()
+    class_lengths = [net[beg][end]['class_lengths'] for beg, end in edges]
+    classes = sorted(set(
+        highway for lengths in class_lengths for highway in lengths
+        ))
+    class_pos = {highway: i for i, highway in enumerate(classes)}
+
+    lengths = np.zeros((len(edges), len(classes)), dtype=np.float64)
+    for i, edge_lengths in enumerate(class_lengths):
+        for highway, length in edge_lengths.iteritems():
+            lengths[i, class_pos[highway]] = length
+            continue
+        continue
+
+    return ClassLengths(index, classes, lengths)
+
+
+def reweight_network(net, travel_times, index):
+
+    """Forms an overlay on the network with new travel time
+
+    :param net: The network
+    :param travel_times: The array of the new travel time of the edges, in
+        the order of the edge identities
+    :param index: The :py:class:`traffic.EdgeIndex` of the network
+    :returns: The :py:class:`overlay.NetworkOverlay` instance
+
+    """
+
+    return NetworkOverlay(net, travel_times=dict(zip(
+        [tuple(edge) for edge in index.edges.tolist()], travel_times.tolist()
+        )))
+
+
+def evaluate_speed_profiles(model, profiles, class_lengths=None):
+
+    """Evaluates the mean travel time for speed profiles
+
+    The travel time of the edges for all the profiles are computed at once,
+    and each distinct sequence of nodes of the trips is only routed once for
+    each of the profiles.
+
+    :param model: The model, with the trips generated
+    :param profiles: A list of the speed profiles
+    :param class_lengths: The optional :py:class:`ClassLengths` of the
+        network of the model, formed when not given
+    :returns: The list of the mean travel time for each of the profiles
+
+    """
+
+    if model.trips is None:
+        raise ValueError('Trips unavailable for the speed profiles')
+
+    if class_lengths is None:
+        class_lengths = form_class_lengths(model.network)
+    travel_times = class_lengths.travel_times(profiles)
+
+    firsts, counts, _ = unique_trips(model.trips)
+    trips = [model.trips[i] for i in firsts]
+    counts = counts.tolist()
+    norm = len(model.trips) * model.time_span
+
+    mean_times = []
+    for j in xrange(0, len(profiles)):
+        net = reweight_network(
+            model.network, travel_times[:, j], class_lengths.index
+            )
+        total = sum(
+            count * ShortestPath(net, trip).travel_time()
+            for trip, count in zip(trips, counts)
+            )
+        mean_times.append(total / norm)
+        continue
+
+    return mean_times
@@ -0,0 +1,435 @@
+"""
+Synthetic cities
+================
+
+For benchmarks and tests at controlled scales without real maps, synthetic
+cities can be generated as OpenStreetMap XML data, which are read by
+:py:func:`readosm.read_osm` and give places for all the categories in
+:py:data:`places.DEFAULT_PLACE_CATS`, like any real map.
+
+Two layouts are available. A *grid* city has got rows and columns of streets
+meeting at the junctions, and a *radial* city has got ring roads around a
+centre crossed by spokes from the centre. The type of each street is drawn
+from a mix of highway types, with the shares of the types as weights, and the
+residential streets give the homes. Between two junctions, a number of shape
+nodes can be added along the streets, to be trimmed out in the formation of
+the network like in real maps.
+
+The places of interest are scattered randomly over the area of the city, with
+the number of places of each category given as a density per junction. The
+work places are named nodes and named buildings, the leisure places are
+parks, the restaurants are nodes with cuisines, and the churches are nodes
+with religions.
+
+The cities are accumulated in a :py:class:`SyntheticCity`, which can be
+written to a file.
+
+.. autosummary::
+    :toctree: generated
+    :template: classtempl.rstt
+
+    SyntheticCity
+
+.. autosummary::
+    :toctree: generated
+
+    gen_grid_city
+    gen_radial_city
+    add_places
+
+"""
+
+import math
+import random
+from xml.sax.saxutils import quoteattr
+
+
+# The default shares of the highway types of the streets
+DEFAULT_HIGHWAY_MIX = {
+    'residential': 0.6,
+    'tertiary': 0.2,
+    'secondary': 0.15,
+    'primary': 0.05,
+    }
+
+# The default numbers of places of each category for each junction
+DEFAULT_PLACE_DENSITIES = {
+    'work': 0.3,
+    'leisure': 0.05,
+    'restaurant': 0.1,
+    'church': 0.03,
+    }
+
+# The origin of the synthetic cities, in latitude and longitude
+_ORIGIN = (40.0, -75.0)
+
+
+class SyntheticCity(object):
+
+    """Synthetic OpenStreetMap data
+
+    .. py:attribute:: nodes
+
+        The list of the nodes, as triples of the identity, the latitude and
+        longitude pair, and the dictionary of the tags
+
+    .. py:attribute:: ways
+
+        The list of the ways, as triples of the identity, the list of the
+        identities of the nodes, and the dictionary of the tags
+
+    .. py:attribute:: n_junctions
+
+        The number of the junctions of the streets
+
+    """
+
+    __slots__ = [
+        'nodes',
+        'ways',
+        'n_junctions',
+        '_coords',
+        '_next_id',
+        ]
+
+    def __init__(self):
+
+        """Initializes the city with nothing in it"""
+
+        self.nodes = []
+        self.ways = []
+        self.n_junctions = 0
+        self._coords = {}
+        self._next_id = 1
+
+    def add_node(self, coord, tags=None):
+
+        """Adds a node to the city
+
+        :param coord: The latitude and longitude pair
+        :param tags: The optional dictionary of the tags
+        :returns: The identity of the new node
+
+        """
+
+        node_id = self._next_id
+        self._next_id += 1
+        self.nodes.append((node_id, coord, tags or {}))
+        self._coords[node_id] = coord
+        return node_id
+
+    def add_junction(self, coord):
+
+        """Adds a junction of streets, as a node without tags"""
+
+        self.n_junctions += 1
+        return self.add_node(coord)
+
+    def add_way(self, nodes, tags):
+
+        """Adds a way to the city
+
+        :param nodes: The list of the identities of the nodes
+        :param tags: The dictionary of the tags
+        :returns: The identity of the new way
+
+        """
+
+        way_id = self._next_id
+        self._next_id += 1
+        self.ways.append((way_id, list(nodes), tags))
+        return way_id
+
+    def add_street(self, junctions, tags, shape_nodes=0):
+
+        """Adds a street through junctions
+
+        :param junctions: The list of the identities of the junctions along
+            the street
+        :param tags: The dictionary of the tags of the street
+        :param shape_nodes: The number of shape nodes added evenly between
+            each pair of neighbouring junctions
+        :returns: The identity of the new way
+
+        """
+
+        nodes = [junctions[0]]
+        for beg, end in zip(junctions[:-1], junctions[1:]):
+            beg_coord = self._coords[beg]
+            end_coord = self._coords[end]
+            for i in xrange(1, shape_nodes + 1):
+                frac = float(i) / (shape_nodes + 1)
+                nodes.append(self.add_node((
+                    beg_coord[0] + frac * (end_coord[0] - beg_coord[0]),
+                    beg_coord[1] + frac * (end_coord[1] - beg_coord[1])
+                    )))
+                continue
+            nodes.append(end)
+            continue
+
+        return self.add_way(nodes, tags)
+
+    def bounds(self):
+
+        """Gets the bounding box of the nodes
+
+        :returns: A pair of the lowest and highest latitude and longitude
+            pairs
+
+        """
+
+        lats = [coord[0] for _, coord, _ in self.nodes]
+        lons = [coord[1] for _, coord, _ in self.nodes]
+        return (min(lats), min(lons)), (max(lats), max(lons))
+
+    def write(self, out_file):
+
+        """Writes the city as OpenStreetMap XML
+
+        :param out_file: The file object to write to
+
+        """
+
+        out_file.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+        out_file.write('<osm version="0.6" generator="osmABTS">\n')
+
+        for node_id, coord, tags in self.nodes:
+            head = ' <node id="%d" lat="%.7f" lon="%.7f"' % (
+                node_id, coord[0], coord[1]
+                )
+            if len(tags) == 0:
+                out_file.write(head + '/>\n')
+            else:
+                out_file.write(head + '>\n')
+                _write_tags(out_file, tags)
+                out_file.write(' </node>\n')
+            continue
+
+        for way_id, nodes, tags in self.ways:
+            out_file.write(' <way id="%d">\n' % way_id)
+            for node_id in nodes:
+                out_file.write('  <nd ref="%d"/>\n' % node_id)
+                continue
+            _write_tags(out_file, tags)
+            out_file.write(' </way>\n')
+            continue
+
+        out_file.write('</osm>\n')
+
+        return None
+
+
+def _write_tags(out_file, tags):
+
+    """Writes the tags of a node or a way"""
+
+    for key in sorted(tags):
+        out_file.write('  <tag k=%s v=%s/>\n' % (
+            quoteattr(key), quoteattr(tags[key])
+            ))
+        continue
+
+    return None
+
+
+#
+# City layouts
+# ------------
+#
+
+def gen_grid_city(rows, cols, spacing=0.002, highway_mix=None,
+                  densities=None, shape_nodes=1, seed=None):
+
+    """Generates a grid city
+
+    :param rows: The number of the streets along the longitude
+    :param cols: The number of the streets along the latitude
+    :param spacing: The distance between neighbouring streets, in degrees
+    :param highway_mix: The dictionary of the shares of the highway types of
+        the streets, :py:data:`DEFAULT_HIGHWAY_MIX` by default
+    :param densities: The dictionary of the numbers of places of each
+        category for each junction, :py:data:`DEFAULT_PLACE_DENSITIES` by
+        default
+    :param shape_nodes: The number of shape nodes between the junctions
+    :param seed: The seed for the random numbers
+    :returns: The :py:class:`SyntheticCity` instance
+
+    """
+
+    rand = random.Random(seed)
+    city = SyntheticCity()
+
+    junctions = [
+        [
+            city.add_junction(
+                (_ORIGIN[0] + i * spacing, _ORIGIN[1] + j * spacing)
+                )
+            for j in xrange(0, cols)
+            ]
+        for i in xrange(0, rows)
+        ]
+
+    for i in xrange(0, rows):
+        city.add_street(
+            junctions[i], _street_tags(rand, highway_mix, 'Row %d' % i),
+            shape_nodes
+            )
+        continue
+    for j in xrange(0, cols):
+        city.add_street(
+            [junctions[i][j] for i in xrange(0, rows)],
+            _street_tags(rand, highway_mix, 'Column %d' % j), shape_nodes
+            )
+        continue
+
+    add_places(city, densities, rand)
+    return city
+
+
+def gen_radial_city(rings, spokes, spacing=0.002, highway_mix=None,
+                    densities=None, shape_nodes=1, seed=None):
+
+    """Generates a radial city
+
+    The junctions are at the centre and on the crossings of the ring roads
+    with the spokes.
+
+    :param rings: The number of the ring roads
+    :param spokes: The number of the spokes from the centre
+    :param spacing: The distance between neighbouring rings, in degrees
+    :returns: The :py:class:`SyntheticCity` instance
+
+    The other parameters are the same as :py:func:`gen_grid_city`.
+
+    """
+
+    rand = random.Random(seed)
+    city = SyntheticCity()
+
+    centre = city.add_junction(_ORIGIN)
+    junctions = [
+        [
+            city.add_junction((
+                _ORIGIN[0] + ring * spacing * math.sin(angle),
+                _ORIGIN[1] + ring * spacing * math.cos(angle)
+                ))
+            for angle in [2.0 * math.pi * i / spokes
+                          for i in xrange(0, spokes)]
+            ]
+        for ring in xrange(1, rings + 1)
+        ]
+
+    for ring_i, ring in enumerate(junctions):
+        city.add_street(
+            ring + ring[:1],
+            _street_tags(rand, highway_mix, 'Ring %d' % (ring_i + 1)),
+            shape_nodes
+            )
+        continue
+    for spoke_i in xrange(0, spokes):
+        city.add_street(
+            [centre] + [ring[spoke_i] for ring in junctions],
+            _street_tags(rand, highway_mix, 'Spoke %d' % (spoke_i + 1)),
+            shape_nodes
+            )
+        continue
+
+    add_places(city, densities, rand)
+    return city
+
+
+def _street_tags(rand, highway_mix, name):
+
+    """Forms the tags of a street, with the highway type drawn from the mix"""
+
+    highway_mix = highway_mix or DEFAULT_HIGHWAY_MIX
+
+    highways = sorted(highway_mix)
+    rand_n = rand.uniform(0.0, sum(highway_mix[i] for i in highways))
+    for highway in highways:
+        rand_n -= highway_mix[highway]
+        if rand_n <= 0.0:
+            break
+        continue
+
+    return {'highway': highway, 'name': name}
+
+
+#
+# Places of interest
+# ------------------
+#
+
+def add_places(city, densities=None, rand=None):
+
+    """Adds places of interest scattered over a city
+
+    :param city: The :py:class:`SyntheticCity` to add to
+    :param densities: The dictionary of the numbers of places of each
+        category for each junction, :py:data:`DEFAULT_PLACE_DENSITIES` by
+        default
+    :param rand: The optional ``random.Random`` instance for the random
+        numbers
+
+    """
+
+    densities = densities or DEFAULT_PLACE_DENSITIES
+    rand = rand or random.Random()
+
+    lows, highs = city.bounds()
+
+    def rand_coord():
+        """Draws a random coordinate in the city"""
+        return (
+            rand.uniform(lows[0], highs[0]), rand.uniform(lows[1], highs[1])
+            )
+
+    for cat_name in sorted(densities):
+        try:
+            add_place = _PLACE_ADDERS[cat_name]
+        except KeyError:
+            raise ValueError('Unknown place category %s' % cat_name)
+        number = int(round(densities[cat_name] * city.n_junctions))
+        for i in xrange(0, number):
+            add_place(city, rand_coord(), i)
+            continue
+        continue
+
+    return None
+
+
+def _add_work(city, coord, idx):
+
+    """Adds a work place, every other one as a building"""
+
+    name = 'Office %d' % idx
+    if idx % 2 == 0:
+        city.add_node(coord, {'name': name})
+    else:
+        # A small square building around the coordinate
+        delta = 0.00005
+        corners = [
+            city.add_node((coord[0] + i * delta, coord[1] + j * delta))
+            for i, j in [(-1, -1), (-1, 1), (1, 1), (1, -1)]
+            ]
+        city.add_way(
+            corners + corners[:1], {'building': 'yes', 'name': name}
+            )
+
+    return None
+
+
+_PLACE_ADDERS = {
+    'work': _add_work,
+    'leisure': lambda city, coord, idx: city.add_node(
+        coord, {'leisure': 'park', 'name': 'Park %d' % idx}
+        ),
+    'restaurant': lambda city, coord, idx: city.add_node(
+        coord, {'amenity': 'restaurant', 'cuisine': 'pizza',
+                'name': 'Restaurant %d' % idx}
+        ),
+    'church': lambda city, coord, idx: city.add_node(
+        coord, {'amenity': 'place_of_worship', 'religion': 'christian',
+                'name': 'Church %d' % idx}
+        ),
+    }
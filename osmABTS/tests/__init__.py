@@ -0,0 +1,8 @@
+"""
+Tests of osmABTS
+================
+
+The behaviour tests of the engines, run on small synthetic cities from
+:py:mod:`osmABTS.synthetic`, by ``python -m unittest discover osmABTS``.
+
+"""
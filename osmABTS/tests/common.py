@@ -0,0 +1,75 @@
+"""
+Common utilities for the tests
+"""
+
+import os
+import os.path
+import shutil
+import tempfile
+import unittest
+
+from osmABTS.model import Model
+from osmABTS.synthetic import gen_grid_city, gen_radial_city
+
+
+class CityTestCase(unittest.TestCase):
+
+    """Test case with synthetic cities written to a temporary directory"""
+
+    def setUp(self):
+
+        """Creates the temporary directory"""
+
+        self.work_dir = tempfile.mkdtemp(prefix='osmABTS-test-')
+
+    def tearDown(self):
+
+        """Removes the temporary directory"""
+
+        shutil.rmtree(self.work_dir)
+
+    def write_city(self, layout='grid', size=6, seed=0):
+
+        """Writes a synthetic city, returning the name of the map file
+
+        :param layout: ``'grid'`` or ``'radial'``
+        :param size: The size of the city, as in the ``benchosm`` script
+
+        """
+
+        if layout == 'grid':
+            city = gen_grid_city(size, size, seed=seed)
+        else:
+            city = gen_radial_city(size, 2 * size, seed=seed)
+
+        file_name = os.path.join(
+            self.work_dir, '%s-%d-%d.osm' % (layout, size, seed)
+            )
+        with open(file_name, 'w') as out_file:
+            city.write(out_file)
+        return file_name
+
+    def form_model(self, map_file, travellers=20, time_span=2.0, seed=0,
+                   cache_dir=None, landmarks=0):
+
+        """Forms a model with the trips generated on a map"""
+
+        model = Model(map_file, cache_dir=cache_dir)
+        model.seed_random(seed)
+        model.form_network()
+        if landmarks > 0:
+            model.form_landmarks(landmarks)
+        model.form_places()
+        model.form_travellers(travellers)
+        model.gen_trips(time_span)
+        return model
+
+    def assertResultsEqual(self, results, expected):
+
+        """Asserts the batch results equal apart from the wall times"""
+
+        strip = lambda rows: [
+            {key: value for key, value in row.iteritems() if key != 'wall'}
+            for row in rows
+            ]
+        self.assertEqual(strip(results), strip(expected))
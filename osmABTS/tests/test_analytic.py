@@ -0,0 +1,39 @@
+"""
+Tests of the expected mean travel time
+"""
+
+from osmABTS.model import Model
+from osmABTS.replications import run_replications
+
+from .common import CityTestCase
+
+
+class AnalyticTest(CityTestCase):
+
+    """Tests the expected mean travel time against the simulation"""
+
+    def check_expected(self, layout, size):
+
+        """Checks the expectation against seeded replications on a city"""
+
+        model = Model(self.write_city(layout, size))
+        model.form_network()
+        model.form_places()
+        expected = model.compute_expected_mean_time(2.0)
+
+        results = run_replications(model, 100, 2.0, seed=0, max_reps=8)
+        self.assertLess(
+            abs(results.mean() - expected), 2.0 * results.half_width()
+            )
+
+    def test_grid(self):
+
+        """Tests the expectation on a grid city"""
+
+        self.check_expected('grid', 6)
+
+    def test_radial(self):
+
+        """Tests the expectation on a radial city"""
+
+        self.check_expected('radial', 4)
@@ -0,0 +1,84 @@
+"""
+Tests of the batch runs of scenarios
+"""
+
+import os.path
+
+from osmABTS.model import Model
+from osmABTS.batch import BatchScenario, run_batch
+
+from .common import CityTestCase
+
+
+_SCENARIOS = [
+    BatchScenario('base', travellers=15, time_span=2.0, seed=1),
+    BatchScenario('short', travellers=15, time_span=1.0, seed=1),
+    BatchScenario(
+        'equal offices', travellers=15, time_span=2.0, seed=1,
+        place_weights={'work': 1.0}
+        ),
+    BatchScenario(
+        'one office', travellers=15, time_span=2.0, seed=1,
+        place_weights={'work': {'Office 0': 100.0}}
+        ),
+    ]
+
+
+class BatchTest(CityTestCase):
+
+    """Tests the batch runs against separate and uncached runs"""
+
+    def run_scenarios(self, map_file, cache_dir=None, processes=None):
+
+        """Runs the scenarios on a fresh model of the map"""
+
+        model = Model(map_file, cache_dir=cache_dir)
+        model.form_network()
+        model.form_places()
+        return run_batch(model, _SCENARIOS, processes)
+
+    def test_cache(self):
+
+        """Tests the cached batch runs against the uncached run"""
+
+        map_file = self.write_city('grid', 5)
+        cache_dir = os.path.join(self.work_dir, 'cache')
+
+        expected = self.run_scenarios(map_file)
+        # Reweighted places need their own travellers
+        self.assertNotEqual(
+            expected[0]['mean_time'], expected[3]['mean_time']
+            )
+        for _ in xrange(0, 2):
+            self.assertResultsEqual(
+                self.run_scenarios(map_file, cache_dir), expected
+                )
+            continue
+
+    def test_separate(self):
+
+        """Tests the batch run against separate runs of the scenarios"""
+
+        map_file = self.write_city('radial', 3)
+        results = self.run_scenarios(map_file)
+
+        for scenario, result in zip(_SCENARIOS[:2], results):
+            model = self.form_model(
+                map_file, scenario.travellers, scenario.time_span,
+                scenario.seed
+                )
+            model.compute_paths()
+            self.assertAlmostEqual(
+                result['mean_time'], model.compute_mean_time(), places=12
+                )
+            continue
+
+    def test_parallel(self):
+
+        """Tests the parallel batch run against the serial run"""
+
+        map_file = self.write_city('grid', 5)
+        self.assertResultsEqual(
+            self.run_scenarios(map_file, processes=2),
+            self.run_scenarios(map_file)
+            )
@@ -0,0 +1,88 @@
+"""
+Tests of the caching of the stages
+"""
+
+import os
+import os.path
+import random
+
+from .common import CityTestCase
+
+
+def summarize(model):
+
+    """Summarizes the results of the stages of a model for comparison"""
+
+    net = model.network
+    return {
+        'edges': sorted(
+            (beg, end, data['travel_time'], data['name'])
+            for beg, end, data in net.edges_iter(data=True)
+            ),
+        'places': {
+            cat_name: [(i.node, i.name, i.weight) for i in places]
+            for cat_name, places in model.places.iteritems()
+            },
+        'travellers': [
+            sorted((key, place.node) for key, place in i.attrs.iteritems())
+            for i in model.travellers
+            ],
+        'trips': [tuple(place.node for place in trip) for trip in model.trips],
+        'kinds': list(model.trip_kinds),
+        'fingerprint': model.fingerprint(),
+        # The random numbers after the stages, loaded from the cache
+        'random': random.random(),
+        }
+
+
+class CacheTest(CityTestCase):
+
+    """Tests the cached stages against computing them again"""
+
+    def test_round_trip(self):
+
+        """Tests loading all the stages from the cache"""
+
+        map_file = self.write_city('grid', 6)
+        cache_dir = os.path.join(self.work_dir, 'cache')
+
+        expected = summarize(self.form_model(map_file, seed=3))
+
+        stored = self.form_model(map_file, seed=3, cache_dir=cache_dir)
+        self.assertEqual(summarize(stored), expected)
+        n_files = len(os.listdir(cache_dir))
+        self.assertEqual(n_files, 5)
+
+        loaded = self.form_model(map_file, seed=3, cache_dir=cache_dir)
+        self.assertEqual(summarize(loaded), expected)
+        self.assertEqual(loaded.stage_keys, stored.stage_keys)
+        self.assertEqual(len(os.listdir(cache_dir)), n_files)
+
+    def test_invalidation(self):
+
+        """Tests that changed inputs are not loaded from the cache"""
+
+        map_file = self.write_city('grid', 6)
+        cache_dir = os.path.join(self.work_dir, 'cache')
+
+        first = self.form_model(map_file, seed=3, cache_dir=cache_dir)
+        reseeded = self.form_model(map_file, seed=4, cache_dir=cache_dir)
+        self.assertEqual(
+            reseeded.stage_keys['places'], first.stage_keys['places']
+            )
+        self.assertNotEqual(
+            reseeded.stage_keys['travellers'], first.stage_keys['travellers']
+            )
+        self.assertEqual(
+            summarize(reseeded), summarize(self.form_model(map_file, seed=4))
+            )
+
+        longer = self.form_model(
+            map_file, seed=3, time_span=3.0, cache_dir=cache_dir
+            )
+        self.assertEqual(
+            longer.stage_keys['travellers'], first.stage_keys['travellers']
+            )
+        self.assertNotEqual(
+            longer.stage_keys['trips'], first.stage_keys['trips']
+            )
@@ -0,0 +1,34 @@
+"""
+Tests of the travel time matrix
+"""
+
+from .common import CityTestCase
+
+
+class MatrixTest(CityTestCase):
+
+    """Tests the mean travel time from the matrix against the paths"""
+
+    def check_mean_time(self, layout, size, processes=None):
+
+        """Checks the mean travel time on a city"""
+
+        model = self.form_model(self.write_city(layout, size), travellers=30)
+        model.compute_matrix(processes)
+        model.compute_paths()
+        self.assertAlmostEqual(
+            model.compute_mean_time_by_matrix(), model.compute_mean_time(),
+            places=12
+            )
+
+    def test_grid(self):
+
+        """Tests the mean travel time on a grid city"""
+
+        self.check_mean_time('grid', 6)
+
+    def test_radial(self):
+
+        """Tests the mean travel time on a radial city, in parallel"""
+
+        self.check_mean_time('radial', 4, processes=2)
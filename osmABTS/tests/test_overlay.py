@@ -0,0 +1,43 @@
+"""
+Tests of the network overlays
+"""
+
+import networkx as nx
+
+from osmABTS.model import Model
+from osmABTS.overlay import NetworkOverlay
+
+from .common import CityTestCase
+
+
+class OverlayTest(CityTestCase):
+
+    """Tests the overlays against modified copies of the network"""
+
+    def test_closed(self):
+
+        """Tests closing edges, with duplicates in both orientations"""
+
+        model = Model(self.write_city('grid', 4))
+        model.form_network()
+        net = model.network
+        edges = net.edges()[:3]
+        beg, end = edges[0]
+
+        overlay = NetworkOverlay(net, closed=edges + [(end, beg), edges[1]])
+        copy = net.copy()
+        copy.remove_edges_from(edges)
+
+        self.assertEqual(len(overlay.closed), 2 * len(edges))
+        for node in net.nodes_iter():
+            self.assertEqual(sorted(overlay[node]), sorted(copy[node]))
+            continue
+        source = net.nodes()[0]
+        self.assertEqual(
+            nx.single_source_dijkstra_path_length(
+                overlay, source, weight='travel_time'
+                ),
+            nx.single_source_dijkstra_path_length(
+                copy, source, weight='travel_time'
+                )
+            )
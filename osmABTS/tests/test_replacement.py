@@ -0,0 +1,42 @@
+"""
+Tests of the replacement-path engine
+"""
+
+from osmABTS.routing import RoutingBase
+from osmABTS.replacement import edge_total_deltas
+
+from .common import CityTestCase
+
+
+class ReplacementTest(CityTestCase):
+
+    """Tests the replacement paths against the re-routing of the trips"""
+
+    def check_deltas(self, layout, size, landmarks=0):
+
+        """Checks the changes for removing each edge of a city"""
+
+        model = self.form_model(
+            self.write_city(layout, size), travellers=15, landmarks=landmarks
+            )
+        base = RoutingBase(model)
+        deltas = edge_total_deltas(base)
+
+        for beg, end in model.network.edges_iter():
+            self.assertAlmostEqual(
+                deltas[base.edge_index.edge_id(beg, end)],
+                base.delta_without([(beg, end)]), places=9
+                )
+            continue
+
+    def test_grid(self):
+
+        """Tests the changes for the edges of a grid city"""
+
+        self.check_deltas('grid', 6)
+
+    def test_radial(self):
+
+        """Tests the changes for the edges of a radial city with landmarks"""
+
+        self.check_deltas('radial', 4, landmarks=4)
@@ -0,0 +1,93 @@
+"""
+Tests of the re-routing of the affected trips
+"""
+
+from osmABTS.paths import ShortestPath
+from osmABTS.routing import RoutingBase
+
+from .common import CityTestCase
+
+
+def brute_total_deltas(model, edges):
+
+    """Computes the changes of the total travel time for removing edges
+
+    All the trips are routed again on copies of the network without each of
+    the edges.
+
+    """
+
+    def total(net):
+        """Gets the total travel time of the trips on a network"""
+        return sum(
+            ShortestPath(net, trip).travel_time() for trip in model.trips
+            )
+
+    base_total = total(model.network)
+    deltas = []
+    for beg, end in edges:
+        net = model.network.copy()
+        net.remove_edge(beg, end)
+        deltas.append(total(net) - base_total)
+        continue
+
+    return deltas
+
+
+class RoutingTest(CityTestCase):
+
+    """Tests the routing base against routing all the trips again"""
+
+    def check_deltas(self, layout, size):
+
+        """Checks the changes for removing the edges of a city"""
+
+        model = self.form_model(self.write_city(layout, size), travellers=10)
+        base = RoutingBase(model)
+        edges = model.network.edges()
+
+        self.assertEqual(len(base.trips), len(set(
+            tuple(place.node for place in trip) for trip in model.trips
+            )))
+        for (beg, end), expected in zip(
+                edges, brute_total_deltas(model, edges)
+                ):
+            self.assertAlmostEqual(
+                base.delta_without([(beg, end)]), expected, places=9
+                )
+            continue
+
+    def test_grid(self):
+
+        """Tests the changes for the edges of a grid city"""
+
+        self.check_deltas('grid', 5)
+
+    def test_radial(self):
+
+        """Tests the changes for the edges of a radial city"""
+
+        self.check_deltas('radial', 3)
+
+    def test_top(self):
+
+        """Tests the top edges against the full ranking"""
+
+        model = self.form_model(self.write_city('grid', 6), travellers=15)
+        base = RoutingBase(model)
+        edges = model.network.edges()
+        ranking = sorted(
+            (base.delta_without([edge]) for edge in edges), reverse=True
+            )
+
+        for number in [1, 5, len(edges)]:
+            top, n_evaluated = base.top_deltas(edges, number)
+            self.assertLessEqual(n_evaluated, len(edges))
+            self.assertEqual(len(top), number)
+            for (delta, edge), expected in zip(top, ranking):
+                self.assertAlmostEqual(delta, expected, places=9)
+                self.assertAlmostEqual(
+                    delta, base.delta_without([edge]), places=9
+                    )
+                continue
+            continue
@@ -0,0 +1,30 @@
+"""
+Tests of the timing of the stages
+"""
+
+import time
+import unittest
+
+from osmABTS.timings import Timings
+
+
+class TimingsTest(unittest.TestCase):
+
+    """Tests the records of nested stages"""
+
+    def test_nested(self):
+
+        """Tests that nested stages are not counted twice in the total"""
+
+        timings = Timings()
+        with timings.stage('outer'):
+            for _ in xrange(0, 2):
+                with timings.stage('inner'):
+                    time.sleep(0.01)
+                continue
+
+        self.assertEqual(
+            [(i.name, i.depth) for i in timings.stages],
+            [('inner', 1), ('inner', 1), ('outer', 0)]
+            )
+        self.assertEqual(timings.total_wall(), timings.stages[-1].wall)
@@ -0,0 +1,40 @@
+"""
+Tests of the differential verification
+"""
+
+from osmABTS.model import Model
+from osmABTS.verify import verify_model, verify_network
+
+from .common import CityTestCase
+
+
+class VerifyTest(CityTestCase):
+
+    """Tests the verification on synthetic cities"""
+
+    def test_untrimmed(self):
+
+        """Tests the verification of an untrimmed network"""
+
+        model = Model(self.write_city('grid', 4))
+        model.form_network(trim=False)
+        trimmed = Model(model.osm_file)
+        trimmed.form_network()
+
+        self.assertGreater(
+            model.network.number_of_nodes(),
+            trimmed.network.number_of_nodes()
+            )
+        self.assertTrue(verify_network(model).ok())
+        self.assertTrue(verify_network(trimmed).ok())
+        self.assertFalse(verify_network(model, trim=True).ok())
+
+    def test_model(self):
+
+        """Tests all the checks on a radial city with landmarks"""
+
+        model = self.form_model(self.write_city('radial', 4), landmarks=4)
+        model.compute_paths()
+        for check in verify_model(model, n_edges=10, draws=2000):
+            self.assertTrue(check.ok(), check.name)
+            continue
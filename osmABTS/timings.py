@@ -0,0 +1,285 @@
+"""
+Timing of the stages
+====================
+
+For finding out where the time and memory of a run goes, the stages of a
+:py:class:`model.Model`, like the parsing of the map, the formation of the
+network and places, the generation of the trips and the routing, can be
+recorded into a :py:class:`Timings` instance given to the model. For each
+stage, the wall and CPU time, the peak and change of the resident memory of
+the process, the change of the number of the Python objects tracked by the
+garbage collector, and the sizes of the results, like the numbers of nodes,
+edges, places, trips and paths, are recorded.
+
+The peak resident memory is from ``getrusage``, which only increases over the
+process, so a stage with a peak above the peak before it is the one raising
+the memory footprint. The current resident memory is read from ``/proc`` on
+Linux, and left as None elsewhere.
+
+Any other part of a run can also be recorded by the :py:meth:`Timings.stage`
+context manager, and the records can be written as JSON by
+:py:meth:`Timings.write`. The stages of a model are also the units for
+counting the work of the shortest-path searches, see
+:py:class:`paths.RoutingStats`.
+
+.. autosummary::
+    :toctree: generated
+    :template: classtempl.rstt
+
+    StageTiming
+    Timings
+
+.. autosummary::
+    :toctree: generated
+
+    timed_stage
+
+"""
+
+import os
+import gc
+import json
+import time
+import resource
+import functools
+import contextlib
+
+from .paths import RoutingStats, collect_stats
+
+
+class StageTiming(object):
+
+    """The record of a stage
+
+    .. py:attribute:: name
+
+        The name of the stage
+
+    .. py:attribute:: depth
+
+        The nesting depth of the stage, zero for the stages not run inside
+        other recorded stages
+
+    .. py:attribute:: wall
+
+        The wall time of the stage, in seconds
+
+    .. py:attribute:: cpu
+
+        The CPU time of the stage in the process, in seconds
+
+    .. py:attribute:: peak_rss
+
+        The peak resident memory of the process after the stage, in KiB
+
+    .. py:attribute:: peak_rss_delta
+
+        The increase of the peak resident memory during the stage, in KiB
+
+    .. py:attribute:: rss_delta
+
+        The change of the resident memory during the stage, in KiB, or None
+        when unavailable
+
+    .. py:attribute:: objects_delta
+
+        The change of the number of the Python objects tracked by the garbage
+        collector during the stage
+
+    .. py:attribute:: counts
+
+        A dictionary of the sizes of the results, like the number of trips
+
+    """
+
+    __slots__ = [
+        'name',
+        'depth',
+        'wall',
+        'cpu',
+        'peak_rss',
+        'peak_rss_delta',
+        'rss_delta',
+        'objects_delta',
+        'counts',
+        ]
+
+    def __init__(self, name, depth=0):
+
+        """Initializes the record with nothing measured"""
+
+        self.name = name
+        self.depth = depth
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.peak_rss = 0
+        self.peak_rss_delta = 0
+        self.rss_delta = None
+        self.objects_delta = 0
+        self.counts = {}
+
+    def as_dict(self):
+
+        """Gets the record as a dictionary for JSON"""
+
+        return {i: getattr(self, i) for i in self.__slots__}
+
+
+class Timings(object):
+
+    """The records of the stages of a run
+
+    .. py:attribute:: stages
+
+        The list of the :py:class:`StageTiming` records, in the order of the
+        completion of the stages, so nested stages come before the stages
+        containing them
+
+    """
+
+    __slots__ = [
+        'stages',
+        '_depth',
+        ]
+
+    def __init__(self):
+
+        """Initializes the records with no stage"""
+
+        self.stages = []
+        self._depth = 0
+
+    @contextlib.contextmanager
+    def stage(self, name):
+
+        """Records a stage in the body of a ``with`` statement
+
+        The record is given as the target of the ``with`` statement, so that
+        the counts can be added to it in the body. Stages raising exceptions
+        are not recorded.
+
+        :param name: The name of the stage
+
+        """
+
+        record = StageTiming(name, self._depth)
+
+        peak_rss = _peak_rss()
+        rss = _current_rss()
+        n_objects = len(gc.get_objects())
+        cpu = time.clock()
+        wall = time.time()
+
+        self._depth += 1
+        try:
+            yield record
+        finally:
+            self._depth -= 1
+
+        record.wall = time.time() - wall
+        record.cpu = time.clock() - cpu
+        record.objects_delta = len(gc.get_objects()) - n_objects
+        new_rss = _current_rss()
+        if rss is not None and new_rss is not None:
+            record.rss_delta = new_rss - rss
+        record.peak_rss = _peak_rss()
+        record.peak_rss_delta = record.peak_rss - peak_rss
+
+        self.stages.append(record)
+
+    def total_wall(self):
+
+        """Gets the total wall time of the top-level stages
+
+        The nested stages are not counted again, since their time is already
+        in the stages containing them.
+
+        """
+
+        return sum(i.wall for i in self.stages if i.depth == 0)
+
+    def write(self, file_name):
+
+        """Writes the records as JSON to a file
+
+        :param file_name: The name of the file
+
+        """
+
+        with open(file_name, 'w') as out_file:
+            json.dump({
+                'stages': [i.as_dict() for i in self.stages],
+                'total_wall': self.total_wall(),
+                'peak_rss': max([0] + [i.peak_rss for i in self.stages]),
+                }, out_file, indent=2, sort_keys=True)
+            out_file.write('\n')
+
+        return None
+
+
+def timed_stage(name, counter=None):
+
+    """Decorates a method of a model to be recorded as a stage
+
+    The stage is recorded when the ``timings`` attribute of the object is not
+    None, and the shortest-path searches of the stage are counted into the
+    :py:class:`paths.RoutingStats` under the name of the stage in the
+    ``routing_stats`` dictionary of the object when it is not None. Otherwise
+    the method is called directly.
+
+    :param name: The name of the stage
+    :param counter: The optional function called with the object after the
+        stage, giving the dictionary of the counts of the stage
+
+    """
+
+    def decorator(method):
+        """Wraps the method"""
+
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            """Calls the method under the timing"""
+            if self.routing_stats is not None:
+                stats = self.routing_stats.setdefault(name, RoutingStats())
+                with collect_stats(stats):
+                    return timed(self, *args, **kwargs)
+            return timed(self, *args, **kwargs)
+
+        def timed(self, *args, **kwargs):
+            """Calls the method, timed if required"""
+            if self.timings is None:
+                return method(self, *args, **kwargs)
+            with self.timings.stage(name) as record:
+                result = method(self, *args, **kwargs)
+                if counter is not None:
+                    record.counts.update(counter(self))
+            return result
+
+        return wrapper
+
+    return decorator
+
+
+#
+# Memory usage
+# ------------
+#
+
+def _peak_rss():
+
+    """Gets the peak resident memory of the process in KiB"""
+
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def _current_rss():
+
+    """Gets the current resident memory of the process in KiB, if possible"""
+
+    try:
+        with open('/proc/self/statm', 'r') as in_file:
+            pages = int(in_file.read().split()[1])
+    except (IOError, IndexError, ValueError):
+        return None
+
+    return pages * (os.sysconf('SC_PAGE_SIZE') // 1024)
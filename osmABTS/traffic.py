@@ -0,0 +1,196 @@
+"""
+Edge traffic volumes
+====================
+
+This module computes the traffic volume on each of the edges of the network,
+that is, the number of times that the edges are traversed by the trips. For
+vectorized counting, the edges are given dense integer identities by an
+:py:class:`EdgeIndex`, and the consecutive node pairs of the paths in a
+:py:class:`paths.PathStore` are mapped into the edge identities all at once.
+
+.. autosummary::
+    :toctree: generated
+    :template: classtempl.rstt
+
+    EdgeIndex
+
+.. autosummary::
+    :toctree: generated
+
+    form_edge_index
+    path_edge_ids
+    edge_volumes
+
+"""
+
+import numpy as np
+
+
+#
+# Dense edge identities
+# ---------------------
+#
+
+class EdgeIndex(object):
+
+    """Dense integer identities for the edges of a network
+
+    The edges are identified by the positions of their ends in the sorted
+    array of nodes, which are combined into a single integer key. The edge
+    identities are the positions of the keys in their sorted array.
+
+    .. py:attribute:: nodes
+
+        The sorted array of the nodes of the network
+
+    .. py:attribute:: keys
+
+        The sorted array of the keys of the edges
+
+    .. py:attribute:: edges
+
+        The two-column array of the end nodes of the edges, in the order of
+        the edge identities. The first end is always the one smaller in the
+        order of the nodes.
+
+    """
+
+    __slots__ = [
+        'nodes',
+        'keys',
+        'edges',
+        ]
+
+    def __init__(self, nodes, keys, edges):
+
+        """Initializes the index with the arrays"""
+
+        self.nodes = nodes
+        self.keys = keys
+        self.edges = edges
+
+    def __len__(self):
+
+        """Gets the number of edges"""
+
+        return len(self.keys)
+
+    def _node_pos(self, nodes):
+
+        """Gets the positions of nodes, -1 for nodes not in the network"""
+
+        nodes = np.asarray(nodes, dtype=np.int64)
+        if len(self.nodes) == 0:
+            return np.zeros(len(nodes), dtype=np.int64) - 1
+        pos = np.minimum(
+            np.searchsorted(self.nodes, nodes), len(self.nodes) - 1
+            )
+        return np.where(self.nodes[pos] == nodes, pos, -1)
+
+    def edge_ids(self, beg_nodes, end_nodes):
+
+        """Gets the identities of the edges between pairs of nodes
+
+        :param beg_nodes: An array of one end of the edges
+        :param end_nodes: An array of the other end of the edges
+        :returns: The array of the edge identities, with -1 for the pairs not
+            connected by an edge
+
+        """
+
+        beg_pos = self._node_pos(beg_nodes)
+        end_pos = self._node_pos(end_nodes)
+        keys = (
+            np.minimum(beg_pos, end_pos) * len(self.nodes) +
+            np.maximum(beg_pos, end_pos)
+            )
+
+        if len(self.keys) == 0:
+            return np.zeros(len(keys), dtype=np.int64) - 1
+        ids = np.minimum(np.searchsorted(self.keys, keys), len(self.keys) - 1)
+        found = (
+            (self.keys[ids] == keys) & (beg_pos >= 0) & (end_pos >= 0) &
+            (beg_pos != end_pos)
+            )
+        return np.where(found, ids, -1)
+
+    def edge_id(self, beg, end):
+
+        """Gets the identity of a single edge, -1 if it is not in the index"""
+
+        return int(self.edge_ids([beg], [end])[0])
+
+
+def form_edge_index(net):
+
+    """Forms the dense edge identities for a network
+
+    :param net: The road network
+    :returns: The :py:class:`EdgeIndex` instance
+
+    """
+
+    nodes = np.array(sorted(net.nodes_iter()), dtype=np.int64)
+    edges = np.array(net.edges(), dtype=np.int64).reshape((-1, 2))
+    edges.sort(axis=1)
+
+    pos = np.searchsorted(nodes, edges)
+    keys = pos[:, 0] * len(nodes) + pos[:, 1]
+    order = np.argsort(keys)
+
+    return EdgeIndex(nodes, keys[order], edges[order])
+
+
+#
+# Volume accumulation
+# -------------------
+#
+
+def path_edge_ids(index, store):
+
+    """Maps the paths in a store into the edge identities
+
+    The pairs of repeated nodes at the joints of the legs are dropped.
+
+    :param index: The :py:class:`EdgeIndex` of the network
+    :param store: The :py:class:`paths.PathStore` of the paths
+    :returns: A pair of arrays, the index of the path and the edge identity,
+        for each of the edges traversed by the paths
+
+    """
+
+    nodes = store.nodes
+    offsets = store.node_offsets
+
+    path_ids = np.repeat(
+        np.arange(len(store), dtype=np.int64), np.diff(offsets)
+        )
+    # Pairs of nodes starting at the last node of a path are not edges
+    pair_valid = np.ones(max(len(nodes) - 1, 0), dtype=np.bool_)
+    ends = offsets[1:-1] - 1
+    pair_valid[ends[(ends >= 0) & (ends < len(pair_valid))]] = False
+
+    ids = index.edge_ids(nodes[:-1], nodes[1:])
+    pair_valid &= ids >= 0
+
+    return path_ids[:-1][pair_valid], ids[pair_valid]
+
+
+def edge_volumes(index, store, weights=None):
+
+    """Accumulates the traffic volumes on the edges
+
+    :param index: The :py:class:`EdgeIndex` of the network
+    :param store: The :py:class:`paths.PathStore` of the paths
+    :param weights: The optional array of the number of trips for each of the
+        paths, for paths shared by multiple trips
+    :returns: The array of the traffic volumes, in the order of the edge
+        identities
+
+    """
+
+    path_ids, ids = path_edge_ids(index, store)
+    if weights is not None:
+        weights = np.asarray(weights, dtype=np.float64)[path_ids]
+
+    return np.bincount(ids, weights=weights, minlength=len(index))
@@ -10,11 +10,15 @@ travellers and places. This module is kind of at the centre of the simulation.
 
 .. autofunction:: gen_trips
 
+.. autofunction:: unique_trips
+
 """
 
 import random
 import collections
 
+import numpy as np
+
 from .util import select_place
 
 
@@ -158,3 +162,42 @@ def gen_trips(time_span, places, trips, traveller):
             continue
 
     return result
+
+
+#
+# Trip de-duplication
+# -------------------
+#
+# Many of the generated trips visit exactly the same sequence of nodes, for
+# instance the daily commutes of a traveller. Since they have got the same
+# shortest path, they only need to be routed once.
+#
+
+def unique_trips(trips):
+
+    """Finds the trips visiting distinct sequences of nodes
+
+    :param trips: A list of trips, as lists of places
+    :returns: A triple of arrays, the index of the first trip for each distinct
+        node sequence, the number of trips with each distinct sequence, and the
+        index of the distinct sequence for each of the trips
+
+    """
+
+    seqs = {}
+    firsts = []
+    inverse = np.empty(len(trips), dtype=np.int64)
+
+    for trip_i, trip in enumerate(trips):
+        key = tuple(place.node for place in trip)
+        try:
+            inverse[trip_i] = seqs[key]
+        except KeyError:
+            seqs[key] = len(firsts)
+            inverse[trip_i] = len(firsts)
+            firsts.append(trip_i)
+        continue
+
+    counts = np.bincount(inverse, minlength=len(firsts))
+
+    return np.array(firsts, dtype=np.int64), counts, inverse
@@ -8,6 +8,7 @@ Some utility functions
     select_place
     pairwise
     print_title
+    file_digest
 
 """
 
@@ -16,6 +17,7 @@ from __future__ import print_function
 import random
 import bisect
 import itertools
+import hashlib
 
 
 def select_place(places):
@@ -65,3 +67,22 @@ def print_title(title, outf):
     print("")
 
     return None
+
+
+def file_digest(file_name):
+
+    """Computes the SHA-1 hex digest of the content of a file
+
+    :raises ValueError: If the file cannot be read
+
+    """
+
+    digest = hashlib.sha1()
+    try:
+        with open(file_name, 'rb') as in_file:
+            for block in iter(lambda: in_file.read(1 << 20), b''):
+                digest.update(block)
+    except IOError:
+        raise ValueError('File %s unable to be read' % file_name)
+
+    return digest.hexdigest()
@@ -0,0 +1,493 @@
+"""
+Differential verification
+=========================
+
+The faster engines of this package are meant to give the same results as the
+straightforward reference code. For confidence before switching engines in
+production, they can be run side by side with the reference on the same map
+and seed, and any mismatches beyond the tolerances are reported.
+
+The checks are
+
+``parsing``
+    The parsed map of the model, possibly loaded from the cache, against the
+    map parsed again by :py:func:`readosm.read_osm`.
+
+``network``
+    The network of the model against the network formed again by
+    :py:func:`network.form_network_from_osm`, with the same nodes, edges and
+    travel time of the edges.
+
+``paths``
+    The travel time of a sample of the trips from the reference
+    ``nx.shortest_path``, against the A* search with the landmarks, the
+    counting searches of :py:func:`paths.collect_stats`, the paths of the
+    model and the travel time matrix, whichever are available.
+
+``sampling``
+    The frequencies of the places drawn by :py:func:`util.select_place`
+    against the probabilities from :py:func:`analytic.place_probabilities`,
+    within a number of standard errors.
+
+``sensitivity``
+    The changes of the total travel time for removing a sample of the edges
+    traversed by the trips, from routing the trips again on a copy of the
+    network without the edge, against the inverted index of
+    :py:class:`routing.RoutingBase` and the replacement paths of
+    :py:mod:`replacement`.
+
+.. autosummary::
+    :toctree: generated
+    :template: classtempl.rstt
+
+    CheckResult
+
+.. autosummary::
+    :toctree: generated
+
+    verify_parsing
+    verify_network
+    verify_paths
+    verify_sampling
+    verify_sensitivity
+    verify_model
+    print_checks
+
+"""
+
+from __future__ import print_function
+
+import math
+import random
+
+import numpy as np
+
+from .readosm import read_osm
+from .network import form_network_from_osm
+from .paths import ShortestPath, collect_stats, RoutingStats
+from .analytic import place_probabilities
+from .routing import RoutingBase
+from .replacement import edge_total_deltas
+from .util import select_place
+
+
+class CheckResult(object):
+
+    """The result of a check
+
+    .. py:attribute:: name
+
+        The name of the check
+
+    .. py:attribute:: compared
+
+        The number of items compared
+
+    .. py:attribute:: mismatches
+
+        The list of the descriptions of the mismatches
+
+    """
+
+    __slots__ = [
+        'name',
+        'compared',
+        'mismatches',
+        ]
+
+    def __init__(self, name):
+
+        """Initializes the result with nothing compared"""
+
+        self.name = name
+        self.compared = 0
+        self.mismatches = []
+
+    def compare(self, item, expected, actual, rtol=0.0, atol=0.0):
+
+        """Compares a value against the reference
+
+        Infinite values only match the same infinity.
+
+        :param item: The description of the item compared
+        :param expected: The reference value
+        :param actual: The value to verify
+        :param rtol: The relative tolerance
+        :param atol: The absolute tolerance
+        :returns: If the values match
+
+        """
+
+        self.compared += 1
+        if isinstance(expected, float) or isinstance(actual, float):
+            if math.isinf(expected) or math.isinf(actual):
+                matched = expected == actual
+            else:
+                matched = (
+                    abs(actual - expected) <= atol + rtol * abs(expected)
+                    )
+        else:
+            matched = expected == actual
+
+        if not matched:
+            self.mismatches.append(
+                '%s: expected %r, got %r' % (item, expected, actual)
+                )
+        return matched
+
+    def compare_sets(self, item, expected, actual):
+
+        """Compares a collection of items against the reference as sets
+
+        :param item: The description of the collection
+        :param expected: The reference collection
+        :param actual: The collection to verify
+        :returns: If the sets match
+
+        """
+
+        self.compared += 1
+        expected = set(expected)
+        actual = set(actual)
+        missing = sorted(expected - actual)
+        extra = sorted(actual - expected)
+
+        if len(missing) > 0 or len(extra) > 0:
+            self.mismatches.append(
+                '%s: %d missing, like %r, %d extra, like %r' % (
+                    item, len(missing), missing[:3], len(extra), extra[:3]
+                    )
+                )
+        return len(missing) == 0 and len(extra) == 0
+
+    def ok(self):
+
+        """Tests if there is no mismatch"""
+
+        return len(self.mismatches) == 0
+
+
+#
+# The checks
+# ----------
+#
+
+def verify_parsing(model):
+
+    """Verifies the parsed map of a model against parsing it again
+
+    :param model: The model
+    :returns: The :py:class:`CheckResult`
+
+    """
+
+    result = CheckResult('parsing')
+    raw_osm = read_osm(model.osm_file)
+
+    result.compare_sets('node identities', raw_osm.nodes, model.raw_osm.nodes)
+    for node_id, node in raw_osm.nodes.iteritems():
+        other = model.raw_osm.nodes.get(node_id)
+        if other is None:
+            continue
+        result.compare(
+            'node %d' % node_id, (tuple(node.coord), node.tags),
+            (tuple(other.coord), other.tags)
+            )
+        continue
+
+    result.compare_sets('way identities', raw_osm.ways, model.raw_osm.ways)
+    for way_id, way in raw_osm.ways.iteritems():
+        other = model.raw_osm.ways.get(way_id)
+        if other is None:
+            continue
+        result.compare(
+            'way %d' % way_id, (way.nodes, way.tags), (other.nodes, other.tags)
+            )
+        continue
+
+    return result
+
+
+def verify_network(model, rtol=1.0e-9, trim=None):
+
+    """Verifies the network of a model against forming it again
+
+    :param model: The model, with the network formed
+    :param rtol: The relative tolerance of the travel time and length
+    :param trim: If the network of the model is trimmed, as recorded by the
+        model by default
+    :returns: The :py:class:`CheckResult`
+
+    """
+
+    if trim is None:
+        trim = model.trim
+
+    result = CheckResult('network')
+    ref = form_network_from_osm(model.raw_osm, trim)
+    net = model.network
+
+    result.compare_sets('nodes', ref.nodes_iter(), net.nodes_iter())
+    ref_edges = set(_edge_key(beg, end) for beg, end in ref.edges_iter())
+    edges = set(_edge_key(beg, end) for beg, end in net.edges_iter())
+    result.compare_sets('edges', ref_edges, edges)
+
+    for beg, end in sorted(ref_edges & edges):
+        ref_data = ref[beg][end]
+        data = net[beg][end]
+        for attr in ['travel_time', 'length']:
+            result.compare(
+                '%s of edge %d-%d' % (attr, beg, end),
+                float(ref_data[attr]), float(data[attr]), rtol
+                )
+            continue
+        continue
+
+    return result
+
+
+def verify_paths(model, number=200, rtol=1.0e-9, seed=0):
+
+    """Verifies the travel time of the trips of a model
+
+    :param model: The model, with the trips generated
+    :param number: The number of trips to verify, all the trips when None
+    :param rtol: The relative tolerance of the travel time
+    :param seed: The seed for drawing the trips
+    :returns: The :py:class:`CheckResult`
+
+    """
+
+    result = CheckResult('paths')
+    if model.trips is None:
+        raise ValueError('Trips unavailable for verifying the paths')
+
+    trip_ids = range(0, len(model.trips))
+    if number is not None and number < len(trip_ids):
+        trip_ids = sorted(random.Random(seed).sample(trip_ids, number))
+    trips = [model.trips[i] for i in trip_ids]
+
+    # The reference, with the searches counted by the model not disturbed
+    with collect_stats(None):
+        ref_times = [
+            ShortestPath(model.network, trip).travel_time() for trip in trips
+            ]
+
+    engines = []
+    if model.landmarks is not None:
+        engines.append(('landmarks', lambda: [
+            ShortestPath(model.network, trip, model.landmarks).travel_time()
+            for trip in trips
+            ]))
+    engines.append(('counted search', lambda: _counted_times(model, trips)))
+    if model.paths is not None:
+        engines.append(('model paths', lambda: [
+            model.paths[i].travel_time() for i in trip_ids
+            ]))
+    if model.matrix is not None:
+        engines.append(('matrix', lambda: model.matrix.trip_times(
+            trips
+            ).tolist()))
+
+    for engine, compute in engines:
+        try:
+            times = compute()
+        except KeyError:
+            result.mismatches.append('%s: trips not covered' % engine)
+            continue
+        for trip_i, ref_time, time in zip(trip_ids, ref_times, times):
+            result.compare(
+                '%s for trip %d' % (engine, trip_i),
+                float(ref_time), float(time), rtol
+                )
+            continue
+        continue
+
+    return result
+
+
+def _counted_times(model, trips):
+
+    """Computes the travel time of trips under the counting of the searches"""
+
+    with collect_stats(RoutingStats()):
+        return [
+            ShortestPath(model.network, trip, model.landmarks).travel_time()
+            for trip in trips
+            ]
+
+
+def verify_sampling(model, draws=20000, z_tol=5.0, seed=0):
+
+    """Verifies the selection of the places against their probabilities
+
+    The random numbers of the model are not disturbed.
+
+    :param model: The model, with the places formed
+    :param draws: The number of places drawn from each category
+    :param z_tol: The tolerance of the frequencies, in standard errors
+    :param seed: The seed for the draws
+    :returns: The :py:class:`CheckResult`
+
+    """
+
+    result = CheckResult('sampling')
+    if model.places is None:
+        raise ValueError('Places unavailable for verifying the sampling')
+
+    state = random.getstate()
+    try:
+        random.seed(seed)
+        for cat_name in sorted(model.places):
+            places = model.places[cat_name]
+            if len(places) == 0:
+                continue
+            nodes, probs = place_probabilities(places)
+            drawn = np.array([
+                select_place(places).node for _ in xrange(0, draws)
+                ], dtype=np.int64)
+            freqs = np.bincount(
+                np.searchsorted(nodes, drawn), minlength=len(nodes)
+                ) / float(draws)
+            std_errs = np.sqrt(probs * (1.0 - probs) / draws)
+            for node, prob, freq, std_err in zip(
+                    nodes.tolist(), probs.tolist(), freqs.tolist(),
+                    std_errs.tolist()
+                    ):
+                result.compare(
+                    'frequency of node %d in %s' % (node, cat_name),
+                    prob, freq, atol=z_tol * std_err
+                    )
+                continue
+            continue
+    finally:
+        random.setstate(state)
+
+    return result
+
+
+def verify_sensitivity(model, number=20, rtol=1.0e-9, seed=0):
+
+    """Verifies the changes of the travel time for removing edges
+
+    :param model: The model, with the trips generated
+    :param number: The number of edges traversed by the trips to verify
+    :param rtol: The relative tolerance of the changes, relative to the total
+        travel time
+    :param seed: The seed for drawing the edges
+    :returns: The :py:class:`CheckResult`
+
+    """
+
+    result = CheckResult('sensitivity')
+    if model.trips is None:
+        raise ValueError('Trips unavailable for verifying the sensitivity')
+
+    base = RoutingBase(model)
+    index = base.edge_index
+    used = np.flatnonzero(np.diff(base.edge_offsets) > 0).tolist()
+    if number is not None and number < len(used):
+        used = sorted(random.Random(seed).sample(used, number))
+
+    deltas = edge_total_deltas(base)
+    atol = rtol * abs(base.total)
+    for edge_id in used:
+        beg, end = index.edges[edge_id].tolist()
+        ref_delta = _removed_delta(model, base, beg, end)
+        result.compare(
+            'index for edge %d-%d' % (beg, end),
+            ref_delta, float(base.delta_without([(beg, end)])), atol=atol
+            )
+        result.compare(
+            'replacement for edge %d-%d' % (beg, end),
+            ref_delta, float(deltas[edge_id]), atol=atol
+            )
+        continue
+
+    return result
+
+
+def _removed_delta(model, base, beg, end):
+
+    """Computes the change of total travel time on a copy without an edge"""
+
+    net = model.network.copy()
+    net.remove_edge(beg, end)
+    with collect_stats(None):
+        delta = sum(
+            count * (
+                ShortestPath(net, trip).travel_time() -
+                ShortestPath(model.network, trip).travel_time()
+                )
+            for trip, count in zip(base.trips, base.counts.tolist())
+            )
+
+    return float(delta)
+
+
+def _edge_key(beg, end):
+
+    """Forms the key of an undirected edge"""
+
+    return (beg, end) if beg <= end else (end, beg)
+
+
+#
+# The driver functions
+# --------------------
+#
+
+def verify_model(model, rtol=1.0e-9, n_trips=200, n_edges=20, draws=20000,
+                 z_tol=5.0, seed=0):
+
+    """Runs all the checks available for a model
+
+    :param model: The model, with the network formed, and the places and
+        trips for the checks needing them
+    :param rtol: The relative tolerance of the travel time
+    :param n_trips: The number of trips for verifying the paths
+    :param n_edges: The number of edges for verifying the sensitivity
+    :param draws: The number of places drawn from each category
+    :param z_tol: The tolerance of the frequencies, in standard errors
+    :param seed: The seed for drawing the trips, edges and places
+    :returns: The list of the :py:class:`CheckResult`
+
+    """
+
+    results = [verify_parsing(model)]
+    if model.network is not None:
+        results.append(verify_network(model, rtol))
+    if model.places is not None:
+        results.append(verify_sampling(model, draws, z_tol, seed))
+    if model.trips is not None:
+        results.append(verify_paths(model, n_trips, rtol, seed))
+        results.append(verify_sensitivity(model, n_edges, rtol, seed))
+
+    return results
+
+
+def print_checks(results, out_file, max_mismatches=10):
+
+    """Prints the results of the checks
+
+    :param results: The list of the :py:class:`CheckResult`
+    :param out_file: The file to print to
+    :param max_mismatches: The maximum number of mismatches printed for each
+        check
+
+    """
+
+    for result in results:
+        print(' %s: %d compared, %d mismatches' % (
+            result.name, result.compared, len(result.mismatches)
+            ), file=out_file)
+        for mismatch in result.mismatches[:max_mismatches]:
+            print('  MISMATCH %s' % mismatch, file=out_file)
+            continue
+        if len(result.mismatches) > max_mismatches:
+            print('  ... and %d more' % (
+                len(result.mismatches) - max_mismatches
+                ), file=out_file)
+        continue
+
+    return None